@@ -0,0 +1,381 @@
+"""
+Benchmarks for the bank classes.
+
+    python bankBenchmark.py suite [--scales 3 4 5] [--output results.json]
+    python bankBenchmark.py compare OLD.json NEW.json [--tolerance 0.1]
+    python bankBenchmark.py concurrency
+
+suite times the hot paths and writes the results as JSON; compare lists the
+results of a later run that got worse than an earlier one and exits with
+status 1 if there are any. Results ending in _per_second are better higher,
+the rest (seconds, bytes) better lower.
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+from bankProject import Customer, MyBank, MyDate, Transaction
+from bankShards import ShardedBank
+
+
+def make_bank(customers):
+    """Return a bank with the given number of empty customers"""
+    bank = MyBank("TakeMyMoney")
+    for n in range(customers):
+        bank.add_customer(Customer(f"Customer {n}", n, 100000 + n))
+    return bank
+
+
+def bench_threads(thread_counts=(1, 2, 4, 8), accounts=1000,
+                  transactions=200000):
+    """
+    Push transactions through MyBank.submit_transaction with different
+    numbers of worker threads and return {threads: transactions per second}
+    """
+    date = MyDate(1, 1, 2022)
+    results = {}
+    for threads in thread_counts:
+        bank = make_bank(accounts)
+        bank.start_workers(threads)
+        start = time.perf_counter()
+        for n in range(transactions):
+            bank.submit_transaction(100000 + n % accounts, 1,
+                                    Transaction.DEPOSIT, date)
+        bank.stop_workers()
+        results[threads] = transactions / (time.perf_counter() - start)
+        assert bank.get_totals()["total_balance"] == transactions
+    return results
+
+
+def bench_tellers(thread_counts=(1, 2, 4, 8), accounts=1000,
+                  transactions=200000):
+    """
+    Have threads call perform_transaction directly on shared accounts and
+    return {threads: transactions per second}
+    """
+    date = MyDate(1, 1, 2022)
+    results = {}
+    for threads in thread_counts:
+        bank = make_bank(accounts)
+        share = transactions // threads
+
+        def teller(first):
+            for n in range(first, first + share):
+                bank.find_account(100000 + n % accounts).perform_transaction(
+                    1, Transaction.DEPOSIT, date)
+
+        tellers = [threading.Thread(target=teller, args=(t * share,))
+                   for t in range(threads)]
+        start = time.perf_counter()
+        for thread in tellers:
+            thread.start()
+        for thread in tellers:
+            thread.join()
+        results[threads] = share * threads / (time.perf_counter() - start)
+        assert bank.get_totals()["total_balance"] == share * threads
+    return results
+
+
+def bench_shards(shard_counts=(1, 2, 4, 8), accounts=1000,
+                 transactions=400000, batch=20000):
+    """
+    Push transactions through ShardedBank.apply_batch in batches with
+    different numbers of shard processes and return {shards: transactions
+    per second}
+    """
+    date = MyDate(1, 1, 2022)
+    account_ids = [100000 + n % accounts for n in range(batch)]
+    amounts = [1] * batch
+    types = [Transaction.DEPOSIT] * batch
+    dates = [date] * batch
+    results = {}
+    for shards in shard_counts:
+        with ShardedBank("TakeMyMoney", shards) as bank:
+            for n in range(accounts):
+                bank.add_customer(Customer(f"Customer {n}", n, 100000 + n))
+            start = time.perf_counter()
+            for _ in range(transactions // batch):
+                bank.apply_batch(account_ids, amounts, types, dates)
+            results[shards] = (transactions // batch * batch
+                               / (time.perf_counter() - start))
+            assert (bank.get_totals()["total_balance"]
+                    == transactions // batch * batch)
+    return results
+
+
+def bench_transfers(thread_counts=(1, 16, 256, 2000), hot_accounts=8,
+                    transfers=100000):
+    """
+    Have threads make MyBank.transfer calls between a few hot accounts, so
+    most transfers fight over the same locks, and return {threads:
+    transfers per second}
+    """
+    date = MyDate(1, 1, 2022)
+    results = {}
+    for threads in thread_counts:
+        bank = make_bank(hot_accounts)
+        for n in range(hot_accounts):
+            bank.find_account(100000 + n).perform_transaction(
+                1000, Transaction.DEPOSIT, date)
+        share = max(1, transfers // threads)
+
+        def mover(first):
+            for n in range(first, first + share):
+                source = n % hot_accounts
+                destination = (source + 1 + n // hot_accounts
+                               % (hot_accounts - 1)) % hot_accounts
+                bank.transfer(100000 + source, 100000 + destination, 1, date)
+
+        movers = [threading.Thread(target=mover, args=(t * share,))
+                  for t in range(threads)]
+        start = time.perf_counter()
+        for thread in movers:
+            thread.start()
+        for thread in movers:
+            thread.join()
+        results[threads] = share * threads / (time.perf_counter() - start)
+        assert bank.get_totals()["total_balance"] == 1000 * hot_accounts
+        assert bank.recount_totals() == {}
+    return results
+
+
+def best_time(function, repeat=3):
+    """Return the shortest of repeat runs of function, in seconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def long_account(history):
+    """Return an account with history transactions already on it"""
+    account = Customer("Long", 1, 100000).account
+    date = MyDate(1, 1, 2022)
+    account.transactions.extend_rows([100] * history,
+                                     [Transaction.DEPOSIT] * history,
+                                     [date] * history,
+                                     range(100, 100 * history + 1, 100))
+    account.balance = history
+    return account
+
+
+def bench_perform_transaction(transactions=100000):
+    """Return Account.perform_transaction calls per second on one account"""
+    date = MyDate(1, 1, 2022)
+
+    def run():
+        account = Customer("Busy", 1, 100000).account
+        for n in range(transactions):
+            account.perform_transaction(5, n & 1, date)
+
+    return transactions / best_time(run)
+
+
+def bench_transaction_construction(transactions=100000):
+    """Return Transaction objects built per second"""
+    date = MyDate(1, 1, 2022)
+
+    def run():
+        for n in range(transactions):
+            Transaction(5, n & 1, date, 100)
+
+    return transactions / best_time(run)
+
+
+def bench_statement(history=1000000, calls=10000):
+    """Return get_max_10_transactions calls per second on a long history"""
+    account = long_account(history)
+
+    def run():
+        for _ in range(calls):
+            account.get_max_10_transactions()
+
+    return calls / best_time(run)
+
+
+def bench_summary(customers, calls=1000):
+    """Return seconds per display_bank_summary call on a bank of customers"""
+    bank = make_bank(customers)
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(calls):
+                bank.display_bank_summary()
+
+    return best_time(run) / calls
+
+
+def bench_remove_customer(customers):
+    """Return MyBank.remove_customer calls per second, emptying a bank"""
+    bank = make_bank(customers)
+    everyone = bank.customers
+    start = time.perf_counter()
+    for customer in everyone:
+        bank.remove_customer(customer)
+    return customers / (time.perf_counter() - start)
+
+
+def bench_accrual(customers):
+    """Return seconds for one MyBank.accrue pass over a bank of customers"""
+    bank = make_bank(customers)
+    date = MyDate(1, 1, 2022)
+    bank.apply_batch([100000 + n for n in range(customers)], [1000] * customers,
+                     [Transaction.DEPOSIT] * customers, [date] * customers)
+    start = time.perf_counter()
+    bank.accrue(date, rate="0.0125", fee=1)
+    return time.perf_counter() - start
+
+
+def bench_top_customers(customers, calls=1000):
+    """
+    Return MyBank.top_customers(10) calls per second on a bank of customers
+    with a transaction between every call
+    """
+    bank = make_bank(customers)
+    date = MyDate(1, 1, 2022)
+    bank.apply_batch([100000 + n for n in range(customers)],
+                     [n % 1000 for n in range(customers)],
+                     [Transaction.DEPOSIT] * customers, [date] * customers)
+    bank.rank_balances()
+    start = time.perf_counter()
+    for n in range(calls):
+        bank.find_account(100000 + n % customers).perform_transaction(
+            n, Transaction.DEPOSIT, date)
+        bank.top_customers(10)
+    return calls / (time.perf_counter() - start)
+
+
+def bench_name_search(customers, calls=1000):
+    """
+    Return MyBank.find_customers_by_name and find_customers_like calls per
+    second, as a pair, on a bank of customers
+    """
+    bank = make_bank(customers)
+    bank.index_names()
+    queries = [f"Customer {n % customers}"[:-1] for n in range(0, calls * 7, 7)]
+    start = time.perf_counter()
+    for query in queries:
+        bank.find_customers_by_name(query)
+    prefix = calls / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for query in queries:
+        bank.find_customers_like("Custmer " + query[9:])
+    return prefix, calls / (time.perf_counter() - start)
+
+
+def memory_per_transaction(transactions=100000):
+    """Return the bytes a ledger grows by per transaction performed"""
+    account = Customer("Busy", 1, 100000).account
+    date = MyDate(1, 1, 2022)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        for n in range(transactions):
+            account.perform_transaction(5, n & 1, date)
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return (after - before) / transactions
+
+
+def run_suite(scales=(3, 4, 5), report=print):
+    """
+    Run the hot path benchmarks, the bank size ones at 10**scale customers
+    for each scale, and return the results as a dict ready for JSON
+    """
+    results = {}
+
+    def note(name, value):
+        results[name] = value
+        report(f"{name}: {value:,.6g}")
+
+    note("perform_transaction_per_second", bench_perform_transaction())
+    note("transaction_construction_per_second",
+         bench_transaction_construction())
+    note("get_max_10_transactions_per_second", bench_statement())
+    note("memory_per_transaction_bytes", memory_per_transaction())
+    for scale in scales:
+        note(f"display_bank_summary_1e{scale}_seconds",
+             bench_summary(10 ** scale))
+        note(f"remove_customer_1e{scale}_per_second",
+             bench_remove_customer(10 ** scale))
+        note(f"accrue_1e{scale}_seconds", bench_accrual(10 ** scale))
+        note(f"top_customers_1e{scale}_per_second",
+             bench_top_customers(10 ** scale))
+        prefix, fuzzy = bench_name_search(10 ** scale)
+        note(f"find_customers_by_name_1e{scale}_per_second", prefix)
+        note(f"find_customers_like_1e{scale}_per_second", fuzzy)
+    return {"python": platform.python_version(),
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "results": results}
+
+
+def compare(old, new, tolerance=0.1):
+    """
+    Return a line for every result in new that is more than tolerance
+    (a fraction) worse than the same result in old
+    """
+    regressions = []
+    for name, new_value in new["results"].items():
+        old_value = old["results"].get(name)
+        if not old_value:
+            continue
+        change = (new_value - old_value) / old_value
+        if not name.endswith("_per_second"):
+            change = -change
+        if change < -tolerance:
+            regressions.append(f"{name}: {old_value:,.6g} -> {new_value:,.6g} "
+                               f"({-change:.0%} worse)")
+    return regressions
+
+
+def main():
+    """Run the benchmarks from the command line"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    suite = commands.add_parser("suite", help="time the hot paths")
+    suite.add_argument("--scales", type=int, nargs="+", default=[3, 4, 5],
+                       help="powers of ten of customers for the bank benchmarks")
+    suite.add_argument("--output", help="file to write the JSON results to")
+    check = commands.add_parser("compare", help="compare two suite results")
+    check.add_argument("old")
+    check.add_argument("new")
+    check.add_argument("--tolerance", type=float, default=0.1)
+    commands.add_parser("concurrency",
+                        help="time threads, shards and contended transfers")
+    arguments = parser.parse_args()
+    if arguments.command == "suite":
+        result = run_suite(arguments.scales)
+        if arguments.output:
+            with open(arguments.output, "w") as file:
+                json.dump(result, file, indent=2)
+    elif arguments.command == "compare":
+        with open(arguments.old) as old, open(arguments.new) as new:
+            regressions = compare(json.load(old), json.load(new),
+                                  arguments.tolerance)
+        for line in regressions:
+            print(line)
+        sys.exit(1 if regressions else 0)
+    else:
+        for name, bench in (("submit_transaction", bench_threads),
+                            ("perform_transaction", bench_tellers)):
+            for threads, rate in bench().items():
+                print(f"{name}: {threads} threads {rate:,.0f} transactions/s")
+        for shards, rate in bench_shards().items():
+            print(f"apply_batch: {shards} shards {rate:,.0f} transactions/s")
+        for threads, rate in bench_transfers().items():
+            print(f"transfer: {threads} threads {rate:,.0f} transfers/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Runs scripts of bank operations against MyBank without any prompting.
+One operation per line; dates are optional, d/m/yyyy or yyyy-mm-dd, and
+default to today. Blank lines and lines starting with # are skipped.
+
+    open CUSTOMER_ID ACCOUNT_ID NAME...
+    reopen ACCOUNT_ID [DATE]
+    deposit ACCOUNT_ID AMOUNT [DATE]
+    withdraw ACCOUNT_ID AMOUNT [DATE]
+    transfer FROM_ACCOUNT_ID TO_ACCOUNT_ID AMOUNT [DATE]
+    close ACCOUNT_ID [DATE]
+    summary
+    statement ACCOUNT_ID [COUNT]
+
+Runs of deposits and withdrawals are gathered up and performed with
+MyBank.apply_batch, which gives each account the same results as
+performing them one by one. Bad lines are reported on stderr with their
+line number and the rest of the script still runs.
+
+    python bankCLI.py SCRIPT [--data DIRECTORY] [--name NAME]
+    python bankCLI.py -                   (reads the script from stdin)
+    python bankCLI.py                     (runs the doctests)
+"""
+import argparse
+import doctest
+import sys
+import time
+from array import array
+from bankIO import decode_date
+from bankProject import Customer, Money, MyBank, MyDate, Transaction
+
+BATCH_SIZE = 65536
+
+
+class ScriptRunner:
+    """Performs script lines against a bank, counting what happened"""
+
+    def __init__(self, bank, batch_size=BATCH_SIZE):
+        self.bank = bank
+        self.batch_size = batch_size
+        self.today = MyDate.today()
+        self.operations = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.errors = 0
+        self._dates = {}  # date text -> MyDate
+        self._account_ids = []
+        self._amounts = array("q")
+        self._types = []
+        self._batch_dates = []
+
+    def run(self, lines, errors=sys.stderr):
+        """Perform every line of a script and return how many were bad"""
+        for number, line in enumerate(lines, 1):
+            words = line.split()
+            if not words or words[0].startswith("#"):
+                continue
+            self.operations += 1
+            try:
+                op = words[0]
+                if op == "deposit":
+                    self._queue(words, Transaction.DEPOSIT)
+                elif op == "withdraw":
+                    self._queue(words, Transaction.WITHDRAWAL)
+                else:
+                    self.flush()
+                    handler = getattr(self, "do_" + op, None)
+                    if handler is None:
+                        raise ValueError(f"unknown operation {op!r}")
+                    handler(words)
+            except (IndexError, OverflowError, ValueError) as error:
+                self.errors += 1
+                if isinstance(error, IndexError):
+                    error = f"{words[0]} is missing arguments"
+                print(f"line {number}: {error}", file=errors)
+        self.flush()
+        return self.errors
+
+    def _date(self, words, position):
+        """Return the date at position in words, today if there is none"""
+        if len(words) <= position:
+            return self.today
+        text = words[position]
+        date = self._dates.get(text)
+        if date is None:
+            date = self._dates[text] = decode_date(text)
+        return date
+
+    @staticmethod
+    def _cents(text):
+        """Return an amount given in a script, in cents"""
+        cents = int(text) * 100 if text.isdigit() else Money.to_cents(text)
+        if cents < 0:
+            raise ValueError(f"amount {text} is negative")
+        if cents > Money.MAX_CENTS:
+            raise ValueError(f"amount {text} is too large")
+        return cents
+
+    def _account(self, text):
+        """Return the customer holding the account given in a script"""
+        customer = self.bank.find_customer_by_account(int(text))
+        if customer is None:
+            raise ValueError(f"account {text} is not with the bank")
+        return customer
+
+    def _queue(self, words, transaction_type):
+        """Add a deposit or withdrawal line to the batch"""
+        account_id = int(words[1])
+        if self.bank.find_account(account_id) is None:
+            raise ValueError(f"account {account_id} is not with the bank")
+        cents = self._cents(words[2])
+        date = self._date(words, 3)
+        self._account_ids.append(account_id)
+        self._amounts.append(cents)
+        self._types.append(transaction_type)
+        self._batch_dates.append(date)
+        if len(self._account_ids) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Perform the gathered deposits and withdrawals"""
+        if not self._account_ids:
+            return
+        accepted = sum(self.bank.apply_batch(self._account_ids, self._amounts,
+                                             self._types, self._batch_dates,
+                                             amounts_in_cents=True))
+        self.accepted += accepted
+        self.rejected += len(self._account_ids) - accepted
+        self._account_ids = []
+        self._amounts = array("q")
+        self._types = []
+        self._batch_dates = []
+
+    def do_open(self, words):
+        """open CUSTOMER_ID ACCOUNT_ID NAME..."""
+        if len(words) < 4:
+            raise IndexError
+        self.bank.add_customer(Customer(" ".join(words[3:]), int(words[1]),
+                                        int(words[2])))
+
+    def do_reopen(self, words):
+        """reopen ACCOUNT_ID [DATE]"""
+        self._account(words[1]).open_account(self._date(words, 2))
+
+    def do_transfer(self, words):
+        """transfer FROM_ACCOUNT_ID TO_ACCOUNT_ID AMOUNT [DATE]"""
+        if self.bank.transfer(int(words[1]), int(words[2]),
+                              Money.from_cents(self._cents(words[3])),
+                              self._date(words, 4)):
+            self.accepted += 1
+        else:
+            self.rejected += 1
+
+    def do_close(self, words):
+        """close ACCOUNT_ID [DATE]"""
+        self.bank.retire_customer(self._account(words[1]),
+                                  self._date(words, 2))
+
+    def do_summary(self, words):
+        """summary"""
+        self.bank.display_bank_summary()
+
+    def do_statement(self, words):
+        """statement ACCOUNT_ID [COUNT]"""
+        customer = self._account(words[1])
+        count = int(words[2]) if len(words) > 2 else 10
+        if count <= 0:
+            raise ValueError(f"statement count {count} is not positive")
+        print(customer.get_statement(-count), end="")
+
+
+def test_cli():
+    """
+    >>> import io
+    >>> bank = MyBank("TakeMyMoney")
+    >>> runner = ScriptRunner(bank)
+    >>> runner.run(io.StringIO('''
+    ... # two customers
+    ... open 1 1001 Mr. Gardiner
+    ... open 2 1002 Mr. Bean
+    ... deposit 1001 500.5 1/3/2022
+    ... deposit 1002 20 2022-03-01
+    ... withdraw 1002 900 2/3/2022
+    ... withdraw 1003 5
+    ... deposit 1001 -5
+    ... deposit 1001 lots
+    ... deposit 1001 100000000000000000000
+    ... deposit 1001 1e30
+    ... transfer 1001 1002 100 3/3/2022
+    ... statement 1002
+    ... statement 1002 0
+    ... close 1001 4/3/2022
+    ... fly 1001
+    ... deposit 1001 5
+    ... summary
+    ... '''), errors=sys.stdout)
+    line 8: account 1003 is not with the bank
+    line 9: amount -5 is negative
+    line 10: 'lots' is not an amount of money
+    line 11: amount 100000000000000000000 is too large
+    line 12: '1e30' is too large an amount of money
+    1 1/3/2022 Deposit $20 Balance: $20
+    2 2/3/2022 No transaction Balance: $20
+    3 3/3/2022 Deposit $100 Balance: $120
+    line 15: statement count 0 is not positive
+    line 17: unknown operation 'fly'
+    line 18: account 1001 is not with the bank
+    <BLANKLINE>
+    ************************************************************************
+    TakeMyMoney has 1 customers
+    Total amount in customer accounts $120
+    ************************************************************************
+    <BLANKLINE>
+    8
+    >>> runner.operations, runner.accepted, runner.rejected, runner.errors
+    (17, 3, 1, 8)
+    """
+    pass
+
+
+def main():
+    """Run a script from the command line"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("script", help="script file, or - for stdin")
+    parser.add_argument("--data", help="directory to journal the bank in")
+    parser.add_argument("--name", default="TakeMyMoney")
+    arguments = parser.parse_args()
+    if arguments.data is None:
+        bank = MyBank(arguments.name)
+    else:
+        import bankJournal
+        bank = bankJournal.open_bank(arguments.data, arguments.name)
+    runner = ScriptRunner(bank)
+    start = time.perf_counter()
+    try:
+        if arguments.script == "-":
+            runner.run(sys.stdin)
+        else:
+            with open(arguments.script) as script:
+                runner.run(script)
+    finally:
+        if bank.journal is not None:
+            bank.journal.close()
+    elapsed = time.perf_counter() - start
+    print(f"{runner.operations} operations in {elapsed:.2f}s: "
+          f"{runner.accepted} accepted, {runner.rejected} rejected, "
+          f"{runner.errors} errors", file=sys.stderr)
+    sys.exit(1 if runner.errors else 0)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main()
+    else:
+        doctest.testmod()
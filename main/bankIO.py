@@ -0,0 +1,311 @@
+"""
+Streaming import/export of bank customers and transaction histories.
+Reads and writes CSV or JSON Lines one record at a time, so files of any
+size can be replayed into a MyBank or dumped from one in constant memory.
+"""
+import csv
+import datetime
+import doctest
+import itertools
+import json
+from bankProject import Customer, Money, MyDate, Transaction
+
+CUSTOMER_FIELDS = ["customer_id", "name", "account_id", "balance", "is_open"]
+TRANSACTION_FIELDS = ["account_id", "date", "type", "amount",
+                      "balance_after", "applied", "transfer_id",
+                      "transfer_account"]
+CHUNK_SIZE = 65536
+
+
+def encode_date(date):
+    """Return a MyDate or datetime.date as d/m/yyyy text"""
+    return str(MyDate.from_date(date))
+
+
+def decode_date(text):
+    """Return the MyDate for d/m/yyyy or ISO yyyy-mm-dd text"""
+    if "/" in text:
+        return MyDate.parse(text)
+    return MyDate.from_date(datetime.date.fromisoformat(text))
+
+
+def parse_amount(value):
+    """Return an amount read from a file as Money"""
+    return Money(value)
+
+
+def parse_bool(value):
+    """Return a flag read from a file"""
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes")
+    return bool(value)
+
+
+def iter_customer_records(bank):
+    """Yield a record for every customer of the bank"""
+    for customer in bank.customers:
+        yield customer_record(customer)
+
+
+def customer_record(customer):
+    """Return the record for one customer"""
+    account = customer.account
+    return {"customer_id": customer.get_customer_id(),
+            "name": customer.get_name(),
+            "account_id": account.get_account_id(),
+            "balance": account.balance.as_number(),
+            "is_open": bool(account.is_open)}
+
+
+def iter_transaction_records(bank):
+    """
+    Yield a record for every transaction of every account of the bank,
+    saying whether it was applied and, for one side of a transfer, the
+    transfer's ID and the other account
+    """
+    for customer in bank.customers:
+        yield from account_transaction_records(customer.account)
+
+
+def account_transaction_records(account):
+    """Yield a record for every transaction of one account, as above"""
+    descriptions = Transaction.TRANSACTION_DESCRIPTIONS
+    account_id = account.get_account_id()
+    ledger = account.transactions
+    links = ledger.links()
+    for index in range(len(ledger)):
+        amount, type_index, date, balance = ledger.row(index)
+        transfer_id, other_account_id = links.get(index, (None, None))
+        yield {"account_id": account_id,
+               "date": encode_date(date),
+               "type": descriptions[type_index],
+               "amount": Money.from_cents(amount).as_number(),
+               "balance_after": Money.from_cents(balance).as_number(),
+               "applied": ledger.is_applied(index),
+               "transfer_id": transfer_id,
+               "transfer_account": other_account_id}
+
+
+def write_csv(records, out, fields):
+    """Write records to a CSV file object and return how many were written"""
+    writer = csv.DictWriter(out, fieldnames=fields)
+    writer.writeheader()
+    count = 0
+    for records_chunk in chunked(records, CHUNK_SIZE):
+        writer.writerows(records_chunk)
+        count += len(records_chunk)
+    return count
+
+
+def write_jsonl(records, out):
+    """Write records to a JSON Lines file object and return how many were written"""
+    count = 0
+    for records_chunk in chunked(records, CHUNK_SIZE):
+        out.write("".join(json.dumps(record) + "\n"
+                          for record in records_chunk))
+        count += len(records_chunk)
+    return count
+
+
+def read_csv(lines):
+    """Yield the records of a CSV file object"""
+    yield from csv.DictReader(lines)
+
+
+def read_jsonl(lines):
+    """Yield the records of a JSON Lines file object"""
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def chunked(records, size=CHUNK_SIZE):
+    """Yield lists of at most size records"""
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def customer_from_record(record):
+    """Return a Customer rebuilt from a customer record"""
+    customer = Customer(record["name"], int(record["customer_id"]),
+                        int(record["account_id"]))
+    customer.account.balance = parse_amount(record["balance"])
+    customer.account.is_open = parse_bool(record["is_open"])
+    return customer
+
+
+def load_customers(bank, records):
+    """Add a customer to the bank for every record and return how many"""
+    count = 0
+    for record in records:
+        bank.add_customer(customer_from_record(record))
+        count += 1
+    return count
+
+
+def replay_transactions(bank, records, chunk_size=CHUNK_SIZE):
+    """
+    Perform every transaction record against the bank, a chunk at a time,
+    and return (accepted, rejected). The recorded balances are ignored; the
+    bank works them out itself.
+    """
+    types = Transaction.TRANSACTION_DESCRIPTIONS
+    accepted_count = 0
+    rejected_count = 0
+    for chunk in chunked(records, chunk_size):
+        accepted = bank.apply_batch(
+            [int(record["account_id"]) for record in chunk],
+            Money.pack(record["amount"] for record in chunk),
+            [types.index(record["type"]) for record in chunk],
+            [decode_date(record["date"]) for record in chunk],
+            amounts_in_cents=True)
+        accepted_now = sum(accepted)
+        accepted_count += accepted_now
+        rejected_count += len(accepted) - accepted_now
+    return accepted_count, rejected_count
+
+
+def restore_transactions(bank, records, chunk_size=CHUNK_SIZE):
+    """
+    Append transaction records to the ledgers of the bank's accounts as they
+    were written, without touching any balance, and return how many were
+    restored. Use with load_customers to bring back an exported bank: the
+    bank counts the restored rows on their days, so its point-in-time
+    totals come back too. Records without an applied flag count as applied.
+    """
+    types = Transaction.TRANSACTION_DESCRIPTIONS
+    count = 0
+    for chunk in chunked(records, chunk_size):
+        for account_id, rows in itertools.groupby(
+                chunk, key=lambda record: int(record["account_id"])):
+            account = bank.find_account(account_id)
+            if account is None:
+                raise ValueError(f"account {account_id} is not with the bank")
+            rows = list(rows)
+            account.restore_rows(
+                Money.pack(record["amount"] for record in rows),
+                [types.index(record["type"]) for record in rows],
+                [decode_date(record["date"]) for record in rows],
+                Money.pack(record["balance_after"] for record in rows),
+                [parse_bool(record.get("applied", True)) for record in rows],
+                [(offset, int(record["transfer_id"]),
+                  int(record["transfer_account"]))
+                 for offset, record in enumerate(rows)
+                 if record.get("transfer_id") not in (None, "")])
+            count += len(rows)
+    return count
+
+
+def export_bank(bank, customers_out, transactions_out, file_format="csv"):
+    """Write the customers and transactions of the bank to two file objects"""
+    if file_format == "csv":
+        write_csv(iter_customer_records(bank), customers_out, CUSTOMER_FIELDS)
+        write_csv(iter_transaction_records(bank), transactions_out,
+                  TRANSACTION_FIELDS)
+    elif file_format == "jsonl":
+        write_jsonl(iter_customer_records(bank), customers_out)
+        write_jsonl(iter_transaction_records(bank), transactions_out)
+    else:
+        raise ValueError(f"unknown file format {file_format!r}")
+
+
+def import_bank(bank, customers_in, transactions_in, file_format="csv"):
+    """Restore customers and transactions written by export_bank into the bank"""
+    if file_format == "csv":
+        read = read_csv
+    elif file_format == "jsonl":
+        read = read_jsonl
+    else:
+        raise ValueError(f"unknown file format {file_format!r}")
+    load_customers(bank, read(customers_in))
+    restore_transactions(bank, read(transactions_in))
+
+
+def test_bank_io():
+    """
+    >>> import io
+    >>> from bankProject import MyBank
+    >>> bank = MyBank("TakeMyMoney")
+    >>> bank.add_customer(Customer("Mr. Gardiner", 1, 1001))
+    >>> bank.add_customer(Customer("Mr. Bean", 2, 1002))
+    >>> bank.find_customer(1).perform_transaction(
+    ...     500.5, Transaction.DEPOSIT, MyDate(1, 3, 2022))
+    True
+    >>> bank.find_customer(1).perform_transaction(
+    ...     600, Transaction.WITHDRAWAL, MyDate(2, 3, 2022))
+    False
+    >>> bank.find_customer(2).perform_transaction(
+    ...     20, Transaction.DEPOSIT, datetime.date(2022, 3, 3))
+    True
+    >>> customers_out, transactions_out = io.StringIO(), io.StringIO()
+    >>> export_bank(bank, customers_out, transactions_out)
+    >>> print(transactions_out.getvalue().replace("\\r", ""))
+    account_id,date,type,amount,balance_after,applied,transfer_id,transfer_account
+    1001,1/3/2022,Deposit,500.5,500.5,True,,
+    1001,2/3/2022,No transaction,600,500.5,True,,
+    1002,3/3/2022,Deposit,20,20,True,,
+    <BLANKLINE>
+
+    # Restore a copy
+    >>> copy = MyBank("TakeMyMoney")
+    >>> import_bank(copy, io.StringIO(customers_out.getvalue()),
+    ...             io.StringIO(transactions_out.getvalue()))
+    >>> print(copy.find_customer(1).get_max_10_transactions())
+    1 1/3/2022 Deposit $500.5 Balance: $500.5
+    2 2/3/2022 No transaction Balance: $500.5
+    <BLANKLINE>
+    >>> copy.get_totals()["total_balance"]
+    Money('520.5')
+
+    # Round trips keep point-in-time balances, unapplied rows and transfers
+    >>> bank.transfer(1001, 1002, 100, MyDate(4, 3, 2022))
+    True
+    >>> bank.find_account(1002).set_is_open(False)
+    >>> bank.find_customer(2).perform_transaction(
+    ...     7, Transaction.DEPOSIT, MyDate(5, 3, 2022))
+    False
+    >>> customers_jsonl, transactions_jsonl = io.StringIO(), io.StringIO()
+    >>> export_bank(bank, customers_jsonl, transactions_jsonl, "jsonl")
+    >>> print(transactions_jsonl.getvalue().splitlines()[-1])
+    {"account_id": 1002, "date": "5/3/2022", "type": "Deposit", "amount": 7, "balance_after": 127, "applied": false, "transfer_id": null, "transfer_account": null}
+    >>> restored = MyBank("TakeMyMoney")
+    >>> import_bank(restored, io.StringIO(customers_jsonl.getvalue()),
+    ...             io.StringIO(transactions_jsonl.getvalue()), "jsonl")
+    >>> days = [MyDate(day, 3, 2022) for day in range(1, 7)]
+    >>> [str(restored.total_as_of(day)) for day in days]
+    ['500.5', '500.5', '520.5', '520.5', '520.5', '520.5']
+    >>> all(restored.total_as_of(day) == bank.total_as_of(day) for day in days)
+    True
+    >>> restored.find_account(1002).balance_as_of(MyDate(5, 3, 2022))
+    Money('120')
+    >>> [t.get_link() for t in restored.find_account(1002).transactions]
+    [None, (1, 1001), None]
+    >>> restored.transfer(1002, 1001, 5, MyDate(6, 3, 2022))
+    False
+    >>> restored.find_account(1002).transactions[-1].get_link()
+    (2, 1001)
+
+    # Replay the history into fresh accounts
+    >>> records = list(read_csv(io.StringIO(transactions_out.getvalue())))
+    >>> replayed = MyBank("TakeMyMoney")
+    >>> replayed.add_customer(Customer("Mr. Gardiner", 1, 1001))
+    >>> replayed.add_customer(Customer("Mr. Bean", 2, 1002))
+    >>> replay_transactions(replayed, records, chunk_size=2)
+    (2, 1)
+    >>> jsonl = io.StringIO()
+    >>> write_jsonl(iter_customer_records(replayed), jsonl)
+    2
+    >>> print(jsonl.getvalue())
+    {"customer_id": 1, "name": "Mr. Gardiner", "account_id": 1001, "balance": 500.5, "is_open": true}
+    {"customer_id": 2, "name": "Mr. Bean", "account_id": 1002, "balance": 20, "is_open": true}
+    <BLANKLINE>
+    """
+    pass
+
+
+if __name__ == "__main__":
+    doctest.testmod()
@@ -0,0 +1,581 @@
+"""
+Durable MyBank state: an append-only journal of every change plus compact
+binary snapshots. On restart the last snapshot is memory-mapped and only the
+journal written since it is replayed.
+
+Files in the bank directory:
+    snapshot.bin      the last snapshot, replaced atomically
+    journal.<n>.log   journal generation n; a snapshot starts a new one
+"""
+import doctest
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from array import array
+from bankIO import account_transaction_records, restore_transactions
+from bankProject import Customer, Ledger, Money, MyBank, MyDate, Rollup
+
+# Record kinds
+TRANSACTION = 1
+STATUS = 2
+CLOSE = 3
+CUSTOMER = 4
+REMOVE = 5
+TRANSFER = 6
+
+RECORD_HEADER = struct.Struct("<BII")  # kind, payload length, crc32
+DATE = struct.Struct("<i")  # MyDate day ordinal
+TRANSACTION_PAYLOAD = struct.Struct("<qqB")  # account, amount in cents, type
+STATUS_PAYLOAD = struct.Struct("<q?")
+CLOSE_PAYLOAD = struct.Struct("<q")
+REMOVE_PAYLOAD = struct.Struct("<q?")
+TRANSFER_PAYLOAD = struct.Struct("<qqq")  # source, destination, amount in cents
+
+SNAPSHOT_MAGIC = b"BANKSNP4"
+SNAPSHOT_HEADER = struct.Struct("<QQI")  # generation, journal offset, meta length
+SNAPSHOT_ACCOUNT = struct.Struct("<qqqBII")
+# customer ID, account ID, balance in cents, is open,
+# name length, ledger rows
+SNAPSHOT_INDEX = struct.Struct("<?II")
+# ledger in date order, days and months with rollups
+
+
+def pack_date(date):
+    """Return a MyDate or datetime.date packed into DATE.size bytes"""
+    return DATE.pack(date.toordinal())
+
+
+def unpack_date(buffer, offset=0):
+    """Return the MyDate packed at offset"""
+    return MyDate.from_ordinal(DATE.unpack_from(buffer, offset)[0])
+
+
+def journal_path(directory, generation):
+    """Return the path of a journal generation"""
+    return os.path.join(directory, f"journal.{generation}.log")
+
+
+def journal_generations(directory):
+    """Return the journal generations in the directory, oldest first"""
+    generations = []
+    for name in os.listdir(directory):
+        parts = name.split(".")
+        if (len(parts) == 3 and parts[0] == "journal" and parts[2] == "log"
+                and parts[1].isdigit()):
+            generations.append(int(parts[1]))
+    return sorted(generations)
+
+
+class Journal:
+    """
+    Append-only log of the changes made to a bank. Records are buffered and
+    forced to disk with fsync by a background thread every sync_every
+    records or sync_interval seconds, whichever comes first, so recording
+    never waits for the disk. With snapshot_every set, the same thread takes
+    a snapshot after that many records.
+    """
+
+    def __init__(self, directory, generation=0, sync_every=1000,
+                 sync_interval=1.0, snapshot_every=None):
+        self.directory = directory
+        self.generation = generation
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.snapshot_every = snapshot_every
+        self.bank = None
+        self._file = open(journal_path(directory, generation), "ab")
+        self._unsynced = 0
+        self._since_snapshot = 0
+        self._closing = False
+        self._lock = threading.Lock()  # one record at a time into the file
+        self._due = threading.Condition(self._lock)
+        self._sync_lock = threading.Lock()  # one fsync or file switch at a time
+        self._checkpoint_lock = threading.Lock()
+        self._flusher = threading.Thread(target=self._flush, daemon=True,
+                                         name=f"journal {directory}")
+        self._flusher.start()
+
+    def attach(self, bank):
+        """Start recording every change made to the bank"""
+        for customer in bank.customers:
+            self.check_customer(customer)
+        self.bank = bank
+        bank.journal = self
+
+    @staticmethod
+    def check_customer(customer):
+        """
+        Raise ValueError unless the customer's IDs fit the records, which
+        hold them as 64-bit integers; checked before a customer joins, so
+        recording their changes can't fail on them later
+        """
+        for kind, value in (("customer", customer.get_customer_id()),
+                            ("account", customer.account.get_account_id())):
+            if not isinstance(value, int) or not -2 ** 63 <= value < 2 ** 63:
+                raise ValueError(f"{kind} ID {value!r} can't be journaled: "
+                                 f"a journaled bank needs 64-bit integer IDs")
+
+    def _write(self, kind, payload):
+        """Append one record, waking the flusher if a sync or snapshot is due"""
+        with self._lock:
+            self._file.write(RECORD_HEADER.pack(kind, len(payload),
+                                                zlib.crc32(payload)) + payload)
+            self._unsynced += 1
+            self._since_snapshot += 1
+            if self._unsynced >= self.sync_every or self._snapshot_due():
+                self._due.notify()
+
+    def _snapshot_due(self):
+        """Return whether snapshot_every records were written; lock held"""
+        return (self.snapshot_every is not None and self.bank is not None
+                and self._since_snapshot >= self.snapshot_every)
+
+    def _flush(self):
+        """Sync and snapshot in the background until the journal closes"""
+        while True:
+            with self._lock:
+                if (not self._closing and self._unsynced < self.sync_every
+                        and not self._snapshot_due()):
+                    self._due.wait(self.sync_interval)
+                if self._closing:
+                    return
+                snapshot = self._snapshot_due()
+                unsynced = self._unsynced
+            if snapshot:
+                self.checkpoint()
+            elif unsynced:
+                self.sync()
+
+    def record_transaction(self, account_id, amount, type_index, date):
+        """Record a transaction as it was resolved, amount in cents"""
+        self._write(TRANSACTION, TRANSACTION_PAYLOAD.pack(
+            account_id, amount, type_index) + pack_date(date))
+
+    def record_batch(self, account_id, amounts, type_indexes, dates):
+        """Record the resolved rows of a batch on one account"""
+        for amount, type_index, date in zip(amounts, type_indexes, dates):
+            self.record_transaction(account_id, amount, type_index, date)
+
+    def record_status(self, account_id, is_open):
+        """Record an account being opened or closed without a withdrawal"""
+        self._write(STATUS, STATUS_PAYLOAD.pack(account_id, bool(is_open)))
+
+    def record_close(self, account_id, date):
+        """Record an account being closed and emptied"""
+        self._write(CLOSE, CLOSE_PAYLOAD.pack(account_id) + pack_date(date))
+
+    def record_customer(self, customer):
+        """
+        Record a customer joining the bank, with any history their account
+        brings along as bankIO transaction records
+        """
+        account = customer.account
+        self._write(CUSTOMER, json.dumps(
+            [customer.get_customer_id(), customer.get_name(),
+             account.get_account_id(), account.balance.cents,
+             bool(account.is_open),
+             list(account_transaction_records(account))]).encode())
+
+    def record_transfer(self, source_id, destination_id, amount, date):
+        """Record a transfer between two accounts, amount in cents"""
+        self._write(TRANSFER, TRANSFER_PAYLOAD.pack(
+            source_id, destination_id, amount) + pack_date(date))
+
+    def record_remove(self, customer_id, retire):
+        """Record a customer leaving the bank"""
+        self._write(REMOVE, REMOVE_PAYLOAD.pack(customer_id, retire))
+
+    def sync(self):
+        """
+        Force everything recorded so far onto disk. Only the flush holds up
+        recording; the fsync runs while new records are buffered.
+        """
+        with self._sync_lock:
+            with self._lock:
+                if self._file.closed:
+                    return
+                self._file.flush()
+                self._unsynced = 0
+            os.fsync(self._file.fileno())
+
+    def checkpoint(self):
+        """
+        Snapshot the bank and start a new journal generation. The snapshot is
+        written from a read view taken as the generation changes, so the
+        bank keeps changing, and recording into the new generation, meanwhile.
+        """
+        with self._checkpoint_lock:
+            with self._sync_lock:
+                old_generation = self.generation
+                old_file = self._file
+                view = self.bank._read_view(then=self._next_generation)
+                old_file.flush()
+                os.fsync(old_file.fileno())
+                old_file.close()
+            with view:
+                write_snapshot(view, os.path.join(self.directory,
+                                                  "snapshot.bin"),
+                               old_generation + 1, 0)
+            os.remove(journal_path(self.directory, old_generation))
+
+    def _next_generation(self):
+        """Switch recording to the next generation's file"""
+        with self._lock:
+            self._file.flush()
+            self.generation += 1
+            self._file = open(journal_path(self.directory, self.generation),
+                              "ab")
+            self._unsynced = 0
+            self._since_snapshot = 0
+
+    def close(self):
+        """Stop the flusher, then sync and close the journal file"""
+        with self._lock:
+            self._closing = True
+            self._due.notify()
+        self._flusher.join()
+        self.sync()
+        with self._lock:
+            self._file.close()
+        if self.bank is not None and self.bank.journal is self:
+            self.bank.journal = None
+
+
+def read_records(path, offset=0):
+    """
+    Yield (kind, payload, end offset) for each whole record in a journal
+    file, stopping at the first torn or corrupt one
+    """
+    with open(path, "rb") as file:
+        file.seek(offset)
+        while True:
+            header = file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            kind, length, crc = RECORD_HEADER.unpack(header)
+            payload = file.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            offset += RECORD_HEADER.size + length
+            yield kind, payload, offset
+
+
+def replay_record(bank, kind, payload):
+    """Apply one journal record to the bank"""
+    if kind == TRANSACTION:
+        account_id, cents, type_index = TRANSACTION_PAYLOAD.unpack_from(payload)
+        date = unpack_date(payload, TRANSACTION_PAYLOAD.size)
+        bank.find_account(account_id).perform_transaction(
+            Money.from_cents(cents), type_index, date)
+    elif kind == STATUS:
+        account_id, is_open = STATUS_PAYLOAD.unpack(payload)
+        bank.find_account(account_id).set_is_open(is_open)
+    elif kind == CLOSE:
+        (account_id,) = CLOSE_PAYLOAD.unpack_from(payload)
+        bank.find_account(account_id).close_account(
+            unpack_date(payload, CLOSE_PAYLOAD.size))
+    elif kind == CUSTOMER:
+        customer_id, name, account_id, cents, is_open, *history = \
+            json.loads(payload)
+        customer = Customer(name, customer_id, account_id)
+        customer.account.balance = Money.from_cents(cents)
+        customer.account.is_open = is_open
+        bank.add_customer(customer)
+        if history:  # records written before histories were kept have none
+            restore_transactions(bank, history[0])
+    elif kind == TRANSFER:
+        source_id, destination_id, cents = TRANSFER_PAYLOAD.unpack_from(payload)
+        bank.transfer(source_id, destination_id, Money.from_cents(cents),
+                      unpack_date(payload, TRANSFER_PAYLOAD.size))
+    elif kind == REMOVE:
+        customer_id, retire = REMOVE_PAYLOAD.unpack(payload)
+        bank._remove_customer(bank.find_customer(customer_id), retire)
+    else:
+        raise ValueError(f"unknown journal record kind {kind}")
+
+
+def replay_journal(bank, path, offset=0):
+    """Apply a journal file to the bank from offset; return where it ended"""
+    for kind, payload, offset in read_records(path, offset):
+        replay_record(bank, kind, payload)
+    return offset
+
+
+def write_snapshot(bank, path, generation, journal_offset):
+    """Write the whole bank, or a read view of it, to path atomically"""
+    if isinstance(bank, MyBank):
+        with bank.read_view() as view:
+            return write_snapshot(view, path, generation, journal_offset)
+    customers = bank.customers
+    totals = bank.get_totals()
+    links = {}  # account ID -> [[row, transfer ID, other account ID]]
+    for customer in customers:
+        ledger_links = customer.account.transactions.links()
+        if ledger_links:
+            links[customer.account.get_account_id()] = [
+                [row, transfer_id, other]
+                for row, (transfer_id, other) in ledger_links.items()]
+    meta = json.dumps({"name": bank.name,
+                       "inflow": totals["total_inflow"].cents,
+                       "outflow": totals["total_outflow"].cents,
+                       "retired": bank.retired_accounts,
+                       "next_transfer": bank.next_transfer,
+                       "links": links}).encode()
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(SNAPSHOT_MAGIC)
+        file.write(SNAPSHOT_HEADER.pack(generation, journal_offset, len(meta)))
+        file.write(meta)
+        for customer in customers:
+            account = customer.account
+            name = customer.get_name().encode()
+            amounts, balances, codes, ordinals = account.transactions.columns()
+            in_date_order, daily, monthly = account.transactions.index()
+            daily = Rollup.to_columns(daily)
+            monthly = Rollup.to_columns(monthly)
+            file.write(SNAPSHOT_ACCOUNT.pack(
+                customer.get_customer_id(), account.get_account_id(),
+                account.balance.cents, bool(account.is_open), len(name),
+                len(codes)))
+            file.write(name)
+            file.write(amounts.tobytes())
+            file.write(balances.tobytes())
+            file.write(codes.tobytes())
+            file.write(ordinals.tobytes())
+            file.write(SNAPSHOT_INDEX.pack(in_date_order, len(daily[0]),
+                                           len(monthly[0])))
+            for column in daily + monthly:
+                file.write(column.tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+def _take(buffer, offset, typecode, count):
+    """Return (array of count items read at offset, offset after them)"""
+    column = array(typecode)
+    end = offset + count * column.itemsize
+    column.frombytes(buffer[offset:end])
+    return column, end
+
+
+def read_snapshot(path):
+    """Return (bank, generation, journal offset) loaded from a snapshot"""
+    with open(path, "rb") as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        if buffer[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a bank snapshot")
+        offset = len(SNAPSHOT_MAGIC)
+        generation, journal_offset, meta_length = \
+            SNAPSHOT_HEADER.unpack_from(buffer, offset)
+        offset += SNAPSHOT_HEADER.size
+        meta = json.loads(buffer[offset:offset + meta_length])
+        offset += meta_length
+        bank = MyBank(meta["name"])
+        while offset < len(buffer):
+            (customer_id, account_id, cents, is_open, name_length,
+             rows) = SNAPSHOT_ACCOUNT.unpack_from(buffer, offset)
+            offset += SNAPSHOT_ACCOUNT.size
+            name = buffer[offset:offset + name_length].decode()
+            offset += name_length
+            amounts, offset = _take(buffer, offset, "q", rows)
+            balances, offset = _take(buffer, offset, "q", rows)
+            codes, offset = _take(buffer, offset, "B", rows)
+            ordinals, offset = _take(buffer, offset, "i", rows)
+            in_date_order, days, months = SNAPSHOT_INDEX.unpack_from(buffer,
+                                                                     offset)
+            offset += SNAPSHOT_INDEX.size
+            index = [bool(in_date_order)]
+            for count in (days, months):
+                rollup_columns = []
+                for typecode in "i" + "q" * len(Rollup.__slots__):
+                    column, offset = _take(buffer, offset, typecode, count)
+                    rollup_columns.append(column)
+                index.append(Rollup.from_columns(rollup_columns))
+            customer = Customer(name, customer_id, account_id)
+            customer.account.balance = Money.from_cents(cents)
+            customer.account.is_open = bool(is_open)
+            customer.account.transactions = Ledger.from_columns(
+                amounts, balances, codes, ordinals, index)
+            bank.add_customer(customer)
+        bank._restore_counts(meta["inflow"], meta["outflow"], meta["retired"],
+                             meta["next_transfer"])
+        for account_id, rows in meta["links"].items():
+            ledger = bank.find_account(int(account_id)).transactions
+            for row, transfer_id, other in rows:
+                ledger.link(row, transfer_id, other)
+    return bank, generation, journal_offset
+
+
+def open_bank(directory, name, sync_every=1000, sync_interval=1.0,
+              snapshot_every=None):
+    """
+    Return the bank kept in directory, loading its last snapshot and
+    replaying the journal written since, with a journal attached that keeps
+    recording. A new directory gives an empty bank called name.
+    """
+    os.makedirs(directory, exist_ok=True)
+    snapshot = os.path.join(directory, "snapshot.bin")
+    if os.path.exists(snapshot):
+        bank, generation, offset = read_snapshot(snapshot)
+    else:
+        bank, generation, offset = MyBank(name), 0, 0
+    generations = [g for g in journal_generations(directory) if g >= generation]
+    end = offset
+    for g in generations:
+        end = replay_journal(bank, journal_path(directory, g),
+                             offset if g == generation else 0)
+    if generations:
+        generation = generations[-1]
+        # Drop a torn record left by a crash so new records follow good ones
+        with open(journal_path(directory, generation), "r+b") as file:
+            file.truncate(end)
+    journal = Journal(directory, generation, sync_every, sync_interval,
+                      snapshot_every)
+    journal.attach(bank)
+    return bank
+
+
+def test_journal():
+    """
+    >>> import tempfile
+    >>> from bankProject import Transaction
+    >>> directory = tempfile.mkdtemp()
+    >>> bank = open_bank(directory, "TakeMyMoney", sync_every=1)
+    >>> bank.add_customer(Customer("Mr. Gardiner", 1, 1001))
+    >>> bank.add_customer(Customer("Mr. Bean", 2, 1002))
+    >>> bank.find_customer(1).perform_transaction(500.5, Transaction.DEPOSIT,
+    ...                                           MyDate(1, 3, 2022))
+    True
+    >>> bank.transfer(1001, 1002, 100, MyDate(1, 3, 2022))
+    True
+    >>> bank.journal.checkpoint()
+    >>> bank.find_customer(1).perform_transaction(200, Transaction.WITHDRAWAL,
+    ...                                           MyDate(2, 3, 2022))
+    True
+    >>> bank.transfer(1002, 1001, 100, MyDate(2, 3, 2022))
+    True
+    >>> bank.find_customer(2).perform_transaction(5, Transaction.WITHDRAWAL,
+    ...                                           MyDate(2, 3, 2022))
+    False
+    >>> bank.close_account(bank.find_customer(2))
+    GET_RICH_QUICK ACCOUNT [1002]: Balance $0 Account closed
+    >>> bank.journal.close()
+
+    # Restart: load the snapshot, replay the five records after it
+    >>> restored = open_bank(directory, "TakeMyMoney")
+    >>> print(restored.find_customer(1).get_max_10_transactions())
+    1 1/3/2022 Deposit $500.5 Balance: $500.5
+    2 1/3/2022 Withdrawal $100 Balance: $400.5
+    3 2/3/2022 Withdrawal $200 Balance: $200.5
+    4 2/3/2022 Deposit $100 Balance: $300.5
+    <BLANKLINE>
+    >>> [t.get_link() for t in restored.find_account(1001).transactions]
+    [None, (1, 1002), None, (2, 1002)]
+    >>> restored.find_customer(2) is None
+    True
+    >>> restored.get_totals() == bank.get_totals()
+    True
+
+    # Snapshots keep each ledger's rollups, from the ledger itself or worked
+    # out for the rows a read view sees, so loading one doesn't replay rows
+    >>> early = restored.read_view()
+    >>> restored.find_customer(1).perform_transaction(1, Transaction.DEPOSIT,
+    ...                                               MyDate(3, 3, 2022))
+    True
+    >>> path = os.path.join(directory, "early.bin")
+    >>> write_snapshot(early, path, 0, 0)
+    >>> early.close()
+    >>> copy = read_snapshot(path)[0]
+    >>> [str(copy.total_as_of(MyDate(day, 3, 2022))) for day in (1, 2, 3)]
+    ['400.5', '300.5', '300.5']
+    >>> ledger = copy.find_account(1001).transactions
+    >>> ledger.monthly_rollup(2022, 3)
+    Rollup(deposits=2 $600.5, withdrawals=2 $300, rejected=0, closing balance=$300.5)
+    >>> ledger.balance_as_of(MyDate(1, 3, 2022)), ledger._checkpoints
+    (Money('400.5'), [0])
+    >>> restored.journal.close()
+
+    # Records are synced on a timer and may be longer than 64 KiB; the
+    # background thread snapshots after snapshot_every records
+    >>> import time
+    >>> directory = tempfile.mkdtemp()
+    >>> bank = open_bank(directory, "TakeMyMoney", sync_interval=0.05,
+    ...                  snapshot_every=3)
+    >>> bank.add_customer(Customer("Mr. " + "Bean" * 20000, 1, 1001))
+    >>> time.sleep(0.5)
+    >>> os.path.getsize(journal_path(directory, 0)) > 80000
+    True
+    >>> bank.find_customer(1).perform_transaction(5, Transaction.DEPOSIT,
+    ...                                           MyDate(1, 3, 2022))
+    True
+    >>> bank.find_customer(1).perform_transaction(2, Transaction.WITHDRAWAL,
+    ...                                           MyDate(1, 3, 2022))
+    True
+    >>> time.sleep(0.5)
+    >>> bank.journal.generation, journal_generations(directory)
+    (1, [1])
+    >>> bank.find_customer(1).perform_transaction(1, Transaction.DEPOSIT,
+    ...                                           MyDate(2, 3, 2022))
+    True
+    >>> bank.journal.close()
+    >>> restored = open_bank(directory, "TakeMyMoney")
+    >>> len(restored.find_customer(1).get_name()), restored.get_totals()["total_balance"]
+    (80004, Money('4'))
+    >>> restored.journal.close()
+
+    # A customer joining with a history keeps it on replay, as in a snapshot
+    >>> directory = tempfile.mkdtemp()
+    >>> bank = open_bank(directory, "TakeMyMoney")
+    >>> joining = Customer("Mr. Bean", 3, 1003)
+    >>> joining.perform_transaction(100, Transaction.DEPOSIT, MyDate(5, 3, 2022))
+    True
+    >>> bank.add_customer(joining)
+    >>> bank.journal.close()
+    >>> days = [MyDate(day, 3, 2022) for day in (4, 5)]
+    >>> def history(bank):
+    ...     account = bank.find_account(1003)
+    ...     return (len(account.transactions),
+    ...             [str(account.balance_as_of(day)) for day in days],
+    ...             [str(bank.total_as_of(day)) for day in days])
+    >>> history(bank)
+    (1, ['0', '100'], ['0', '100'])
+    >>> replayed = open_bank(directory, "TakeMyMoney")
+    >>> history(replayed)
+    (1, ['0', '100'], ['0', '100'])
+    >>> replayed.journal.checkpoint()
+    >>> replayed.journal.close()
+    >>> loaded = open_bank(directory, "TakeMyMoney")
+    >>> history(loaded)
+    (1, ['0', '100'], ['0', '100'])
+    >>> loaded.journal.close()
+
+    # IDs a record can't hold are turned away before the customer joins
+    >>> bank = open_bank(tempfile.mkdtemp(), "TakeMyMoney")
+    >>> bank.add_customer(Customer("Mr. Bean", 4, "ACC-4"))
+    Traceback (most recent call last):
+    ValueError: account ID 'ACC-4' can't be journaled: a journaled bank needs 64-bit integer IDs
+    >>> bank.add_customer(Customer("Mr. Bean", 2 ** 63, 1004))
+    Traceback (most recent call last):
+    ValueError: customer ID 9223372036854775808 can't be journaled: a journaled bank needs 64-bit integer IDs
+    >>> bank.get_totals()["customers"], bank.recount_totals()
+    (0, {})
+    >>> bank.journal.close()
+    >>> unjournaled = MyBank("TakeMyMoney")
+    >>> unjournaled.add_customer(Customer("Mr. Bean", 4, "ACC-4"))
+    >>> journal = Journal(tempfile.mkdtemp())
+    >>> journal.attach(unjournaled)
+    Traceback (most recent call last):
+    ValueError: account ID 'ACC-4' can't be journaled: a journaled bank needs 64-bit integer IDs
+    >>> journal.close()
+    >>> unjournaled.journal is None
+    True
+    """
+    pass
+
+
+if __name__ == "__main__":
+    doctest.testmod()
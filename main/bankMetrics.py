@@ -0,0 +1,268 @@
+"""
+Opt-in counters and latency histograms for MyBank and Account operations.
+
+    metrics = bankMetrics.enable()
+    ...
+    print(metrics.to_prometheus())
+    bankMetrics.disable()
+
+enable() swaps timing wrappers in for the measured methods on the classes
+themselves and disable() puts the originals back, so while metrics are off
+the bank runs exactly the code it would without this module.
+"""
+import bisect
+import doctest
+import functools
+import json
+import threading
+import time
+from bankProject import Account, MyBank
+
+# Upper bounds in seconds of the latency histogram buckets, 1us to 1s
+BUCKETS = (0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005,
+           0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0)
+
+COUNTERS = ("accepted", "rejected", "closed", "opened")
+
+
+class Histogram:
+    """Counts of observed latencies by bucket, with their sum"""
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # the last is above 1s
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        """Count one latency"""
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def cumulative(self):
+        """Return [(upper bound, observations at or below it)], +Inf last"""
+        total = 0
+        result = []
+        for bound, count in zip(BUCKETS + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, fraction):
+        """Return the upper bound of the bucket holding the fraction quantile"""
+        if self.count == 0:
+            return 0.0
+        wanted = fraction * self.count
+        for bound, total in self.cumulative():
+            if total >= wanted:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """Counters and per-operation latency histograms"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.histograms = {}
+
+    def count(self, name, amount=1):
+        """Add to a counter"""
+        with self._lock:
+            self.counters[name] += amount
+
+    def observe(self, operation, seconds):
+        """Record the latency of one call of operation"""
+        with self._lock:
+            histogram = self.histograms.get(operation)
+            if histogram is None:
+                histogram = self.histograms[operation] = Histogram()
+            histogram.observe(seconds)
+
+    def reset(self):
+        """Forget everything recorded so far"""
+        with self._lock:
+            self.counters = dict.fromkeys(COUNTERS, 0)
+            self.histograms = {}
+
+    def snapshot(self):
+        """Return everything recorded so far as plain data"""
+        with self._lock:
+            return {"counters": dict(self.counters),
+                    "latency": {operation: {
+                        "count": histogram.count,
+                        "sum_seconds": histogram.sum,
+                        "p50_seconds": histogram.quantile(0.50),
+                        "p99_seconds": histogram.quantile(0.99),
+                        "buckets": [[bound, total] for bound, total
+                                    in histogram.cumulative()[:-1]]}
+                        for operation, histogram in self.histograms.items()}}
+
+    def to_json(self):
+        """Return the snapshot as JSON text"""
+        return json.dumps(self.snapshot())
+
+    def to_prometheus(self):
+        """Return everything recorded so far in the Prometheus text format"""
+        lines = ["# HELP bank_events_total Bank events by kind.",
+                 "# TYPE bank_events_total counter"]
+        with self._lock:
+            for name, value in self.counters.items():
+                lines.append(f'bank_events_total{{event="{name}"}} {value}')
+            lines.append("# HELP bank_operation_seconds Latency of bank "
+                         "operations.")
+            lines.append("# TYPE bank_operation_seconds histogram")
+            for operation, histogram in self.histograms.items():
+                label = f'operation="{operation}"'
+                for bound, total in histogram.cumulative():
+                    bound = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'bank_operation_seconds_bucket{{{label},'
+                                 f'le="{bound}"}} {total}')
+                lines.append(f"bank_operation_seconds_sum{{{label}}} "
+                             f"{histogram.sum!r}")
+                lines.append(f"bank_operation_seconds_count{{{label}}} "
+                             f"{histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _timed(metrics, operation, method, after=None):
+    """
+    Return method wrapped to record its latency under operation and then
+    call after(metrics, instance, was_open, result) if given
+    """
+    clock = time.perf_counter
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        was_open = getattr(self, "is_open", None)
+        start = clock()
+        result = method(self, *args, **kwargs)
+        metrics.observe(operation, clock() - start)
+        if after is not None:
+            after(metrics, self, was_open, result)
+        return result
+
+    return wrapper
+
+
+def _count_transaction(metrics, account, was_open, accepted):
+    metrics.count("accepted" if accepted else "rejected")
+
+
+def _count_batch(metrics, bank, was_open, accepted):
+    went_through = sum(accepted)
+    metrics.count("accepted", went_through)
+    metrics.count("rejected", len(accepted) - went_through)
+
+
+def _count_close(metrics, account, was_open, result):
+    if was_open:
+        metrics.count("closed")
+
+
+def _count_status(metrics, account, was_open, result):
+    if account.is_open and not was_open:
+        metrics.count("opened")
+    elif was_open and not account.is_open:
+        metrics.count("closed")
+
+
+# (class, method name, operation, counting function)
+MEASURED = ((Account, "perform_transaction", "perform_transaction",
+             _count_transaction),
+            (Account, "close_account", "close_account", _count_close),
+            (Account, "set_is_open", "set_is_open", _count_status),
+            (Account, "write_statement", "statement", None),
+            (MyBank, "apply_batch", "apply_batch", _count_batch),
+            (MyBank, "transfer", "transfer", _count_transaction),
+            (MyBank, "display_bank_summary", "display_bank_summary", None))
+
+_originals = {}
+_enabled = None
+
+
+def enable(metrics=None):
+    """Start recording into metrics (a new Metrics if None) and return it"""
+    global _enabled
+    if _enabled is not None:
+        disable()
+    metrics = Metrics() if metrics is None else metrics
+    for cls, name, operation, after in MEASURED:
+        original = cls.__dict__[name]
+        _originals[cls, name] = original
+        setattr(cls, name, _timed(metrics, operation, original, after))
+    _enabled = metrics
+    return metrics
+
+
+def disable():
+    """Stop recording and put the measured methods back as they were"""
+    global _enabled
+    for (cls, name), original in _originals.items():
+        setattr(cls, name, original)
+    _originals.clear()
+    _enabled = None
+
+
+def enabled():
+    """Return the Metrics being recorded into, or None"""
+    return _enabled
+
+
+def test_metrics():
+    """
+    >>> from bankProject import Customer, MyDate
+    >>> bank = MyBank("TakeMyMoney")
+    >>> customer = Customer("Mr. Gardiner", 1, 1001)
+    >>> bank.add_customer(customer)
+    >>> bank.add_customer(Customer("Mrs. Gardiner", 2, 1002))
+    >>> metrics = enable()
+    >>> date = MyDate(1, 3, 2022)
+    >>> customer.perform_transaction(500, 0, date)
+    True
+    >>> customer.perform_transaction(900, 1, date)
+    False
+    >>> bank.apply_batch([1001, 1001, 9999], [5, 5, 5], [0, 1, 0], [date] * 3)
+    [True, True, False]
+    >>> bank.transfer(1001, 1002, 100, date), bank.transfer(1001, 1002, 900, date)
+    (True, False)
+    >>> statement = customer.get_max_10_transactions()
+    >>> customer.close_account(date)
+    >>> customer.open_account(date)
+    >>> bank.display_bank_summary()
+    <BLANKLINE>
+    ************************************************************************
+    TakeMyMoney has 2 customers
+    Total amount in customer accounts $100
+    ************************************************************************
+    <BLANKLINE>
+    >>> disable()
+    >>> customer.perform_transaction(5, 0, date)
+    True
+    >>> snapshot = metrics.snapshot()
+    >>> snapshot["counters"]
+    {'accepted': 5, 'rejected': 3, 'closed': 1, 'opened': 1}
+    >>> sorted((name, latency["count"])
+    ...        for name, latency in snapshot["latency"].items())
+    ... # doctest: +NORMALIZE_WHITESPACE
+    [('apply_batch', 1), ('close_account', 1), ('display_bank_summary', 1),
+     ('perform_transaction', 3), ('set_is_open', 1), ('statement', 1),
+     ('transfer', 2)]
+    >>> text = metrics.to_prometheus()
+    >>> print(text.splitlines()[2])
+    bank_events_total{event="accepted"} 5
+    >>> 'bank_operation_seconds_count{operation="perform_transaction"} 3' in text
+    True
+    >>> json.loads(metrics.to_json())["counters"]["closed"]
+    1
+    >>> hasattr(Account.perform_transaction, "__wrapped__")
+    False
+    """
+    pass
+
+
+if __name__ == "__main__":
+    doctest.testmod()
@@ -2,21 +2,357 @@
 BankClasses program. Simulates a bank/customers/accounts/transactions/dates
 """
 import doctest
+import bisect
+import contextlib
 import datetime
+import decimal
+import fractions
+import functools
+import heapq
+import io
+import itertools
+import math
+import numbers
+import os
+import queue
+import re
+import struct
+import tempfile
+import threading
+import weakref
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import Future
 # Total: -15
 
 
 class MyDate:
     """
-    A date object to represent a date
+    A date object to represent a date. Stored as a day ordinal (as in
+    datetime.date.toordinal) and interned, so every MyDate for the same day
+    is the same object.
     """
-    def __init__(self, day, month, year):
-        self._day = day # -1
-        self._month = month
-        self._year = year
+    __slots__ = ("_ordinal", "_text")
+    _by_ordinal = {}
+
+    def __new__(cls, day, month, year):
+        return cls.from_ordinal(cls._fields_ordinal(day, month, year))
+
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def _fields_ordinal(day, month, year):
+        """Return the day ordinal of a date, remembering recent ones"""
+        return datetime.date(year, month, day).toordinal()
+
+    @classmethod
+    def from_ordinal(cls, ordinal):
+        """Return the interned MyDate for a day ordinal"""
+        date = cls._by_ordinal.get(ordinal)
+        if date is None:
+            date = object.__new__(cls)
+            date._ordinal = ordinal
+            date._text = None
+            date = cls._by_ordinal.setdefault(ordinal, date)
+        return date
+
+    @classmethod
+    def from_date(cls, date):
+        """Return the MyDate for a MyDate or a datetime.date"""
+        if type(date) is cls:
+            return date
+        return cls.from_ordinal(date.toordinal())
+
+    @classmethod
+    def parse(cls, text):
+        """Return the MyDate for text written as d/m/yyyy"""
+        return cls.from_ordinal(cls._text_ordinal(text))
+
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def _text_ordinal(text):
+        """Return the day ordinal of d/m/yyyy text, remembering recent texts"""
+        day, month, year = text.split("/")
+        return MyDate._fields_ordinal(int(day), int(month), int(year))
+
+    @classmethod
+    def today(cls):
+        """Return today's date"""
+        return cls.from_date(datetime.date.today())
+
+    @property
+    def _day(self):
+        return datetime.date.fromordinal(self._ordinal).day
+
+    @property
+    def _month(self):
+        return datetime.date.fromordinal(self._ordinal).month
+
+    @property
+    def _year(self):
+        return datetime.date.fromordinal(self._ordinal).year
+
+    def toordinal(self):
+        """Return the day ordinal"""
+        return self._ordinal
+
+    def to_date(self):
+        """Return the date as a datetime.date"""
+        return datetime.date.fromordinal(self._ordinal)
 
     def __str__(self):
-        return f"{self._day}/{self._month}/{self._year}"
+        if self._text is None:
+            date = datetime.date.fromordinal(self._ordinal)
+            self._text = f"{date.day}/{date.month}/{date.year}"
+        return self._text
+
+    def __repr__(self):
+        return f"MyDate.parse({str(self)!r})"
+
+    def __reduce__(self):
+        return MyDate.from_ordinal, (self._ordinal,)
+
+    def __hash__(self):
+        return hash(self._ordinal)
+
+    def __eq__(self, other):
+        if type(other) is not MyDate:
+            return NotImplemented
+        return self._ordinal == other._ordinal
+
+    def __lt__(self, other):
+        if type(other) is not MyDate:
+            return NotImplemented
+        return self._ordinal < other._ordinal
+
+    def __le__(self, other):
+        if type(other) is not MyDate:
+            return NotImplemented
+        return self._ordinal <= other._ordinal
+
+    def __gt__(self, other):
+        if type(other) is not MyDate:
+            return NotImplemented
+        return self._ordinal > other._ordinal
+
+    def __ge__(self, other):
+        if type(other) is not MyDate:
+            return NotImplemented
+        return self._ordinal >= other._ordinal
+
+    def __add__(self, days):
+        """Return the date a number of days later"""
+        if not isinstance(days, int):
+            return NotImplemented
+        return MyDate.from_ordinal(self._ordinal + days)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        """Return the days between two dates, or the date days earlier"""
+        if type(other) is MyDate:
+            return self._ordinal - other._ordinal
+        if isinstance(other, int):
+            return MyDate.from_ordinal(self._ordinal - other)
+        return NotImplemented
+
+
+class Money:
+    """
+    An exact amount of money, held as a whole number of cents. Prints the
+    way the bank always has: 500, 900.5, 100.01.
+    """
+    __slots__ = ("cents",)
+
+    def __init__(self, amount=0):
+        self.cents = Money.to_cents(amount)
+
+    @classmethod
+    def from_cents(cls, cents):
+        """Return the Money for a whole number of cents"""
+        money = object.__new__(cls)
+        money.cents = cents
+        return money
+
+    # Amounts are kept in int64 columns
+    MIN_CENTS = -2 ** 63
+    MAX_CENTS = 2 ** 63 - 1
+
+    @staticmethod
+    def to_cents(amount):
+        """
+        Return a dollar amount (int, float, str, Decimal or Money) in cents,
+        raising ValueError if it isn't a finite amount that fits in int64
+        """
+        kind = type(amount)
+        if kind is Money:
+            return amount.cents
+        if kind is int:
+            cents = amount * 100
+        elif kind is float:
+            if not math.isfinite(amount):
+                raise ValueError(f"{amount!r} is not an amount of money")
+            cents = round(amount * 100)
+        else:
+            try:
+                cents = decimal.Decimal(str(amount).strip()) * 100
+                cents = int(cents.to_integral_value(decimal.ROUND_HALF_EVEN))
+            except (decimal.InvalidOperation, OverflowError, ValueError):
+                raise ValueError(
+                    f"{amount!r} is not an amount of money") from None
+        if not Money.MIN_CENTS <= cents <= Money.MAX_CENTS:
+            raise ValueError(f"{amount!r} is too large an amount of money")
+        return cents
+
+    @staticmethod
+    def pack(amounts):
+        """Return dollar amounts as an int64 array of cents"""
+        to_cents = Money.to_cents
+        return array("q", [to_cents(amount) for amount in amounts])
+
+    @staticmethod
+    def unpack(cents):
+        """Return Money for each amount in an array of cents"""
+        from_cents = Money.from_cents
+        return [from_cents(amount) for amount in cents]
+
+    @staticmethod
+    def scale(cents, rate):
+        """
+        Return every amount in an array of cents times rate (a number, or
+        text such as "0.0125"), rounded half-even to the cent, as an int64
+        array. Exact: the rate is turned into a fraction once and the rest is
+        integer arithmetic.
+        """
+        rate = fractions.Fraction(str(rate))
+        numerator = rate.numerator
+        denominator = rate.denominator
+        scaled = array("q")
+        add = scaled.append
+        for amount in cents:
+            quotient, remainder = divmod(amount * numerator, denominator)
+            twice = 2 * remainder
+            if twice > denominator or (twice == denominator and quotient & 1):
+                quotient += 1
+            add(quotient)
+        return scaled
+
+    def as_number(self):
+        """Return the amount in dollars as an int, or a float if it has cents"""
+        dollars, cents = divmod(self.cents, 100)
+        return dollars if cents == 0 else self.cents / 100
+
+    def __str__(self):
+        dollars, cents = divmod(abs(self.cents), 100)
+        sign = "-" if self.cents < 0 else ""
+        if cents == 0:
+            return f"{sign}{dollars}"
+        return f"{sign}{dollars}.{cents:02d}".rstrip("0")
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+    def __reduce__(self):
+        return Money.from_cents, (self.cents,)
+
+    @staticmethod
+    def _cents_of(other):
+        """Return another operand in cents, or None if it isn't an amount"""
+        if type(other) is Money:
+            return other.cents
+        if isinstance(other, numbers.Real):
+            return Money.to_cents(other)
+        return None
+
+    def __add__(self, other):
+        cents = self._cents_of(other)
+        if cents is None:
+            return NotImplemented
+        return Money.from_cents(self.cents + cents)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        cents = self._cents_of(other)
+        if cents is None:
+            return NotImplemented
+        return Money.from_cents(self.cents - cents)
+
+    def __rsub__(self, other):
+        cents = self._cents_of(other)
+        if cents is None:
+            return NotImplemented
+        return Money.from_cents(cents - self.cents)
+
+    def __mul__(self, factor):
+        """Return the amount times a number, rounded half-even to the cent"""
+        if not isinstance(factor, (numbers.Real, decimal.Decimal)):
+            return NotImplemented
+        return Money.from_cents(round(self.cents * factor))
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return Money.from_cents(-self.cents)
+
+    def __abs__(self):
+        return Money.from_cents(abs(self.cents))
+
+    def __bool__(self):
+        return self.cents != 0
+
+    def __float__(self):
+        return self.cents / 100
+
+    def __hash__(self):
+        return hash(fractions.Fraction(self.cents, 100))
+
+    def _compared(self, other):
+        """
+        Return (this amount, other) as exact values to compare, or None if
+        other isn't a number. Unlike arithmetic, comparisons don't round
+        other to the cent, so they agree with __hash__: Money(0.1) != 0.1.
+        """
+        if type(other) is Money:
+            return self.cents, other.cents
+        if type(other) is int:
+            return self.cents, other * 100
+        if isinstance(other, float) and not math.isfinite(other):
+            return self.cents / 100, other
+        if isinstance(other, (numbers.Rational, float)):
+            return fractions.Fraction(self.cents, 100), fractions.Fraction(other)
+        if isinstance(other, numbers.Real):
+            return self.cents / 100, other
+        return None
+
+    def __eq__(self, other):
+        pair = self._compared(other)
+        if pair is None:
+            return NotImplemented
+        return pair[0] == pair[1]
+
+    def __lt__(self, other):
+        pair = self._compared(other)
+        if pair is None:
+            return NotImplemented
+        return pair[0] < pair[1]
+
+    def __le__(self, other):
+        pair = self._compared(other)
+        if pair is None:
+            return NotImplemented
+        return pair[0] <= pair[1]
+
+    def __gt__(self, other):
+        pair = self._compared(other)
+        if pair is None:
+            return NotImplemented
+        return pair[0] > pair[1]
+
+    def __ge__(self, other):
+        pair = self._compared(other)
+        if pair is None:
+            return NotImplemented
+        return pair[0] >= pair[1]
 
 
 class Transaction:
@@ -30,52 +366,1670 @@ class Transaction:
     DEPOSIT = 0
     WITHDRAWAL = 1
     NO_TRANSACTION = 2
+    _link = None  # (transfer ID, other account ID) for one side of a transfer
 
     def __init__(self, amount, transaction_type, date, current_balance):
 
-        self._amount = amount
-        if transaction_type == self.DEPOSIT: # -1
-            self._balance_after_transaction = current_balance + amount
-        elif transaction_type == self.WITHDRAWAL and not current_balance - amount < 0:
-            self._balance_after_transaction = current_balance - amount
-        else:
-            self._balance_after_transaction = current_balance
-            transaction_type = self.NO_TRANSACTION
+        self._amount = Money.to_cents(amount)  # amounts are kept in cents
+        transaction_type, self._balance_after_transaction = self.resolve(
+            self._amount, transaction_type, Money.to_cents(current_balance))
 
         self._date = date
         self._type_index = transaction_type
 
     # -1
 
+    @classmethod
+    def resolve(cls, amount, transaction_type, current_balance):
+        """Return the (type, balance after) a transaction would end up with"""
+        if transaction_type == cls.DEPOSIT:
+            return transaction_type, current_balance + amount
+        elif transaction_type == cls.WITHDRAWAL and not current_balance - amount < 0:
+            return transaction_type, current_balance - amount
+        else:
+            return cls.NO_TRANSACTION, current_balance
+
+    @classmethod
+    def from_row(cls, amount, type_index, date, balance_after_transaction):
+        """Build a transaction from already resolved ledger values in cents"""
+        transaction = cls.__new__(cls)
+        transaction._amount = amount
+        transaction._balance_after_transaction = balance_after_transaction
+        transaction._date = date
+        transaction._type_index = type_index
+        return transaction
+
+    @staticmethod
+    def render(date, type_index, amount, balance_after_transaction):
+        """Return the statement line for a transaction, amounts in cents"""
+        amount = Money.from_cents(amount)
+        balance_after_transaction = Money.from_cents(balance_after_transaction)
+        if type_index == 0:
+            return f"{date} Deposit ${amount} Balance: ${balance_after_transaction}"
+        elif type_index == 1:
+            return f"{date} Withdrawal ${amount} Balance: ${balance_after_transaction}"
+        else:
+            return f"{date} No transaction Balance: ${balance_after_transaction}"
+
     def get_amount(self):
         """Return amount in transaction"""
-        return self._amount
+        return Money.from_cents(self._amount)
 
     def get_balance_after_transaction(self):
         """Return balance after transaction"""
-        return self._balance_after_transaction
+        return Money.from_cents(self._balance_after_transaction)
+
+    def get_link(self):
+        """Return (transfer ID, other account ID) if this is one side of a transfer"""
+        return self._link
 
     def __str__(self):  # e.g. 24/1/2021 Deposit $500 Balance: $11700 \\\\\ 25/1/2021 No Transaction Balance $12
-        if self._type_index == 0:
-            return f"{self._date} Deposit ${self._amount} Balance: ${self._balance_after_transaction}"
-        elif self._type_index == 1:
-            return f"{self._date} Withdrawal ${self._amount} Balance: ${self._balance_after_transaction}"
+        return self.render(self._date, self._type_index, self._amount,
+                           self._balance_after_transaction)
+
+
+class Rollup:
+    """
+    Totals of a ledger's transactions over one day or one month
+    """
+    __slots__ = ("deposits", "deposit_cents", "withdrawals",
+                 "withdrawal_cents", "rejected", "closing_cents",
+                 "change_cents")
+
+    def __init__(self):
+        self.deposits = 0
+        self.deposit_cents = 0
+        self.withdrawals = 0
+        self.withdrawal_cents = 0
+        self.rejected = 0
+        self.closing_cents = 0
+        self.change_cents = 0  # what the applied transactions changed the balance by
+
+    @property
+    def deposit_total(self):
+        return Money.from_cents(self.deposit_cents)
+
+    @property
+    def withdrawal_total(self):
+        return Money.from_cents(self.withdrawal_cents)
+
+    @property
+    def closing_balance(self):
+        return Money.from_cents(self.closing_cents)
+
+    @property
+    def transactions(self):
+        return self.deposits + self.withdrawals + self.rejected
+
+    def add(self, type_index, amount, balance_after_transaction, applied=True):
+        """Count one transaction, amounts in cents"""
+        if type_index == Transaction.DEPOSIT:
+            self.deposits += 1
+            self.deposit_cents += amount
+            if applied:
+                self.change_cents += amount
+        elif type_index == Transaction.WITHDRAWAL:
+            self.withdrawals += 1
+            self.withdrawal_cents += amount
+            if applied:
+                self.change_cents -= amount
         else:
-            return f"{self._date} No transaction Balance: ${self._balance_after_transaction}"
+            self.rejected += 1
+        self.closing_cents = balance_after_transaction
+
+    def merge(self, other):
+        """Add another rollup's totals to this one, closing balances included"""
+        self.deposits += other.deposits
+        self.deposit_cents += other.deposit_cents
+        self.withdrawals += other.withdrawals
+        self.withdrawal_cents += other.withdrawal_cents
+        self.rejected += other.rejected
+        self.closing_cents += other.closing_cents
+        self.change_cents += other.change_cents
+
+    def follow(self, later):
+        """Add the totals of a later stretch of the same period to this one"""
+        closing_cents = later.closing_cents
+        self.merge(later)
+        self.closing_cents = closing_cents
+
+    def subtract(self, earlier):
+        """Take away the totals of an earlier stretch of the same period"""
+        self.deposits -= earlier.deposits
+        self.deposit_cents -= earlier.deposit_cents
+        self.withdrawals -= earlier.withdrawals
+        self.withdrawal_cents -= earlier.withdrawal_cents
+        self.rejected -= earlier.rejected
+        self.change_cents -= earlier.change_cents
+
+    @classmethod
+    def to_columns(cls, rollups):
+        """Return (keys, then one column per slot) of {key: Rollup}"""
+        keys = sorted(rollups)
+        return (array("i", keys),) + tuple(
+            array("q", [getattr(rollups[key], name) for key in keys])
+            for name in cls.__slots__)
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Return the {key: Rollup} of columns from to_columns, in key order"""
+        rollups = {}
+        for key, *values in zip(*columns):
+            rollup = rollups[key] = cls()
+            for name, value in zip(cls.__slots__, values):
+                setattr(rollup, name, value)
+        return rollups
+
+    def __repr__(self):
+        return (f"Rollup(deposits={self.deposits} ${self.deposit_total}, "
+                f"withdrawals={self.withdrawals} ${self.withdrawal_total}, "
+                f"rejected={self.rejected}, "
+                f"closing balance=${self.closing_balance})")
+
+
+def month_key(date):
+    """Return a number that orders months, for a MyDate or a day ordinal"""
+    if isinstance(date, MyDate):
+        date = date._ordinal
+    date = datetime.date.fromordinal(date)
+    return date.year * 12 + date.month - 1
+
+
+def month_days(key):
+    """Return the first and last day ordinals of the month with a month_key"""
+    year, month = divmod(key, 12)
+    first = datetime.date(year, month + 1, 1).toordinal()
+    year, month = divmod(key + 1, 12)
+    if year > datetime.MAXYEAR:
+        return first, datetime.date.max.toordinal()
+    return first, datetime.date(year, month + 1, 1).toordinal() - 1
+
+
+class DayTotals:
+    """
+    Net changes in cents by day ordinal, in a Fenwick tree over every day
+    ordinal a date can have: adding a change on any day and totalling the
+    changes up to a day both take O(log days), whatever order the days
+    come in. Only the tree's nodes that were touched are stored.
+    """
+    __slots__ = ("first", "_tree")
+    SIZE = datetime.date.max.toordinal()
+
+    def __init__(self):
+        self.first = None  # the earliest day a change was added on
+        self._tree = {}  # node -> total of the days it covers
+
+    def add(self, ordinal, cents):
+        """Add a change on a day ordinal; one of 0 still counts the day"""
+        if self.first is None or ordinal < self.first:
+            self.first = ordinal
+        tree = self._tree
+        while ordinal <= self.SIZE:
+            tree[ordinal] = tree.get(ordinal, 0) + cents
+            ordinal += ordinal & -ordinal
+
+    def total_to(self, ordinal):
+        """Return the total of the changes on days up to a day ordinal"""
+        tree = self._tree
+        ordinal = min(ordinal, self.SIZE)
+        total = 0
+        while ordinal > 0:
+            total += tree.get(ordinal, 0)
+            ordinal &= ordinal - 1
+        return total
+
+
+class Ledger:
+    """
+    The transaction history of an account, stored column by column.
+    Amounts and balances (in cents), type codes and dates live in parallel
+    typed arrays and Transaction objects are only built when a row is asked
+    for. Methods taking or returning raw rows work in cents.
+
+    With an Archive attached only the newest rows stay in the arrays; older
+    ones are moved out to segment files a segment at a time and read back
+    when asked for, their rollups and date order with them. Row numbers
+    always count from the first row ever added.
+    """
+    TYPE_MASK = 0b011
+    NOT_APPLIED = 0b100  # the row didn't change the balance (account closed)
+    CHECKPOINT_EVERY = 64
+
+    def __init__(self, transactions=()):
+        self._amounts = array("q")  # cents
+        self._balances = array("q")  # cents
+        self._codes = array("B")
+        self._ordinals = array("i")  # MyDate day ordinals
+        self._archive = None
+        self._archive_key = None
+        self._archived = 0  # rows moved out to the archive, all before the arrays
+        self._segment_lows = array("i")  # earliest day ordinal of each segment
+        self._segment_highs = array("i")  # latest day ordinal of each segment
+        self._segment_openings = array("q")  # balance before each segment
+        # resident row -> (transfer ID, other account ID); an archived row's
+        # link is kept in its segment's index
+        self._links = {}
+        self._publish()
+        self._reset_index()
+        for transaction in transactions:
+            self.append(transaction)
+
+    def _publish(self):
+        """
+        Let readers see the resident arrays and the row they start at. The
+        pair is replaced as one tuple, never changed in place, so a reader
+        takes both at once without locking; rows are only appended to it.
+        """
+        self._resident = (self._amounts, self._balances, self._codes,
+                          self._ordinals, self._archived)
+
+    def _reset_index(self):
+        """Forget the date index and the rollups"""
+        self._in_date_order = True
+        # The resident rows' offsets sorted by date, when out of order
+        self._date_order = None
+        # Rollups of the resident rows; a day or month can also have a part
+        # in the archived segments' indexes
+        self._daily = {}  # day ordinal -> Rollup
+        self._monthly = {}  # month_key -> Rollup
+        self._last_ordinal = None
+        self._last_daily = None
+        self._last_monthly = None
+        self._real_balance = 0  # the account's balance after the last row
+        # (day ordinal, balance before) of the first row that was applied
+        self._opening = None
+        # (rows counted, DayTotals of the daily changes) once asked for
+        # out of date order, then kept up to date
+        self._day_totals = None
+        # _checkpoints[k - _checkpoint_base] is the account's balance before
+        # row k * CHECKPOINT_EVERY; those of archived rows are dropped
+        self._checkpoints = []
+        self._checkpoint_base = 0
+
+    def _track(self, index, ordinal, code, amount, balance):
+        """Add row index to the date index, checkpoints and rollups"""
+        if index % self.CHECKPOINT_EVERY == 0:
+            self._checkpoints.append(self._real_balance)
+        if not code & self.NOT_APPLIED:
+            if self._opening is None:
+                self._opening = (ordinal, balance - self._change(code, amount))
+            self._real_balance = balance
+        if ordinal != self._last_ordinal or self._last_daily is None:
+            if self._last_ordinal is not None and ordinal < self._last_ordinal:
+                self._in_date_order = False
+            self._date_order = None
+            daily = self._daily.get(ordinal)
+            if daily is None:
+                daily = self._daily[ordinal] = Rollup()
+            key = month_key(ordinal)
+            monthly = self._monthly.get(key)
+            if monthly is None:
+                monthly = self._monthly[key] = Rollup()
+            self._last_ordinal = ordinal
+            self._last_daily = daily
+            self._last_monthly = monthly
+        elif not self._in_date_order:
+            self._date_order = None
+        type_index = code & self.TYPE_MASK
+        applied = not code & self.NOT_APPLIED
+        self._last_daily.add(type_index, amount, self._real_balance, applied)
+        self._last_monthly.add(type_index, amount, self._real_balance, applied)
+        day_totals = self._day_totals
+        if day_totals is not None:
+            totals = day_totals[1]
+            totals.add(ordinal, self._change(code, amount) if applied else 0)
+            self._day_totals = (index + 1, totals)
+
+    def __len__(self):
+        resident = self._resident
+        return resident[4] + len(resident[3])
+
+    def archive_to(self, archive):
+        """Keep this ledger's older rows in archive from now on"""
+        if self._archive is not None:
+            raise ValueError("ledger is already archived")
+        self._archive = archive
+        self._archive_key = archive.new_key()
+        weakref.finalize(self, archive.discard, self._archive_key)
+        self._spill()
+
+    def _spill(self):
+        """
+        Move whole segments of the oldest rows out while there are too many,
+        with an index of their rollups, their links and, out of date order,
+        their order. The rows kept are copied to new arrays, published once
+        the segment is on disk, so a reader still holding the old ones reads
+        them intact; links move out only after that, so one missing from
+        _links is in the index of a segment already counted as archived.
+        """
+        archive = self._archive
+        key = self._archive_key
+        rows = archive.segment_rows
+        while len(self._codes) >= archive.hot_rows + rows:
+            columns = (self._amounts, self._balances, self._codes,
+                       self._ordinals)
+            segment = self._archived // rows
+            spilled = [column[:rows] for column in columns]
+            ordinals = spilled[3]
+            archive.write(key, segment, spilled)
+            daily, monthly = self._rollups_of(spilled, self._checkpoints[0])
+            if self._in_date_order:
+                date_order = array("i")
+            else:
+                date_order = array("i", sorted(range(rows),
+                                               key=ordinals.__getitem__))
+            first = self._archived
+            links = {row - first: link for row, link in self._links.items()
+                     if row < first + rows}
+            archive.write_index(key, segment, daily, monthly, date_order,
+                                links)
+            for resident, moved in ((self._daily, daily),
+                                    (self._monthly, monthly)):
+                for period, rollup in moved.items():
+                    kept = resident[period]
+                    kept.subtract(rollup)
+                    if not kept.transactions:
+                        del resident[period]
+            if self._last_daily is not None and not self._last_daily.transactions:
+                self._last_daily = self._last_monthly = None
+            self._date_order = None
+            self._segment_lows.append(min(ordinals))
+            self._segment_highs.append(max(ordinals))
+            self._segment_openings.append(self._checkpoints[0])
+            (self._amounts, self._balances, self._codes,
+             self._ordinals) = (column[rows:] for column in columns)
+            del self._checkpoints[:rows // self.CHECKPOINT_EVERY]
+            self._checkpoint_base += rows // self.CHECKPOINT_EVERY
+            self._archived += rows
+            self._publish()
+            for offset in links:
+                del self._links[first + offset]
+
+    def _block(self, index):
+        """
+        Return (amounts, balances, codes, ordinals, first row, end row) of the
+        arrays holding row index: an archived segment or the resident rows
+        """
+        amounts, balances, codes, ordinals, first = self._resident
+        if index >= first:
+            return (amounts, balances, codes, ordinals, first,
+                    first + len(ordinals))
+        rows = self._archive.segment_rows
+        segment = index // rows
+        return self._archive.read(self._archive_key, segment) + (
+            segment * rows, segment * rows + rows)
+
+    @classmethod
+    def _rollups_of(cls, columns, balance):
+        """
+        Return ({day ordinal: Rollup}, {month key: Rollup}) of rows given as
+        columns, the account's balance before them being balance
+        """
+        daily = {}
+        monthly = {}
+        not_applied = cls.NOT_APPLIED
+        type_mask = cls.TYPE_MASK
+        last_ordinal = None
+        for amount, row_balance, code, ordinal in zip(*columns):
+            applied = not code & not_applied
+            if applied:
+                balance = row_balance
+            if ordinal != last_ordinal:
+                day = daily.get(ordinal)
+                if day is None:
+                    day = daily[ordinal] = Rollup()
+                period = month_key(ordinal)
+                month = monthly.get(period)
+                if month is None:
+                    month = monthly[period] = Rollup()
+                last_ordinal = ordinal
+            day.add(code & type_mask, amount, balance, applied)
+            month.add(code & type_mask, amount, balance, applied)
+        return daily, monthly
+
+    def _segments_between(self, first, last):
+        """
+        Return the archived segments that may hold rows dated from day
+        ordinal first to last, all of them if first is None
+        """
+        lows = self._segment_lows
+        highs = self._segment_highs
+        if first is None:
+            return range(len(lows))
+        if self._in_date_order:
+            return range(bisect.bisect_left(highs, first),
+                         bisect.bisect_right(lows, last))
+        return [segment for segment in range(len(lows))
+                if lows[segment] <= last and first <= highs[segment]]
+
+    def _rollups(self, monthly, first=None, last=None):
+        """
+        Return [(key, Rollup)] of the days, or the months if monthly, from
+        first to last that have transactions, in order; all of them if first
+        is None. The parts in archived segments are read from their indexes.
+        """
+        if first is None:
+            days = (None, None)
+        elif monthly:
+            days = (month_days(first)[0], month_days(last)[1])
+        else:
+            days = (first, last)
+        combined = {}
+        parts = [self._archive.read_index(self._archive_key, segment)[monthly]
+                 for segment in self._segments_between(*days)]
+        parts.append(self._monthly if monthly else self._daily)
+        for part in parts:  # oldest first, so the closing balances come last
+            for key, rollup in part.items():
+                if first is None or first <= key <= last:
+                    kept = combined.get(key)
+                    if kept is None:
+                        kept = combined[key] = Rollup()
+                    kept.follow(rollup)
+        return sorted(combined.items())
+
+    def _bisect(self, ordinal, right):
+        """
+        Return where ordinal would go among the row dates, which must be in
+        order: after equal dates if right, else before them. Only the segment
+        it falls in is read.
+        """
+        find = bisect.bisect_right if right else bisect.bisect_left
+        if not self._archived:
+            return find(self._ordinals, ordinal)
+        if self._ordinals and (self._ordinals[0] <= ordinal if right
+                               else self._ordinals[0] < ordinal):
+            return self._archived + find(self._ordinals, ordinal)
+        segment = find(self._segment_lows, ordinal) - 1
+        if segment < 0:
+            return 0
+        rows = self._archive.segment_rows
+        ordinals = self._archive.read(self._archive_key, segment)[3]
+        return segment * rows + find(ordinals, ordinal)
+
+    def append(self, transaction):
+        """Add a Transaction to the end of the ledger"""
+        self.append_row(transaction._amount, transaction._type_index,
+                        transaction._date,
+                        transaction._balance_after_transaction)
+
+    def append_row(self, amount, type_index, date, balance_after_transaction,
+                   applied=True):
+        """
+        Add an already resolved transaction to the end of the ledger.
+        applied is False for a row that didn't change the account's balance
+        even though it isn't a No transaction, such as one on a closed account.
+        """
+        code = type_index
+        if not applied and type_index != Transaction.NO_TRANSACTION:
+            code |= self.NOT_APPLIED
+        if type(date) is not MyDate:
+            date = MyDate.from_date(date)
+        self._amounts.append(amount)
+        self._balances.append(balance_after_transaction)
+        self._codes.append(code)
+        self._track(self._archived + len(self._ordinals), date._ordinal, code,
+                    amount, balance_after_transaction)
+        self._ordinals.append(date._ordinal)
+        if self._archive is not None:
+            self._spill()
+
+    def extend_rows(self, amounts, type_indexes, dates, balances,
+                    applied=True, links=()):
+        """
+        Add already resolved transactions, given as columns, to the ledger.
+        applied is as for append_row and goes for every row, or is a list
+        with a flag for each row. links gives (row offset, transfer ID,
+        other account ID) for the rows that are one side of a transfer.
+        """
+        if not isinstance(applied, list):
+            applied = itertools.repeat(applied)
+        not_applied = self.NOT_APPLIED
+        no_transaction = Transaction.NO_TRANSACTION
+        codes = [type_index | (not_applied if not row_applied
+                               and type_index != no_transaction else 0)
+                 for type_index, row_applied in zip(type_indexes, applied)]
+        ordinals = [MyDate.from_date(date)._ordinal for date in dates]
+        track = self._track
+        append_amount = self._amounts.append
+        append_balance = self._balances.append
+        append_code = self._codes.append
+        append_ordinal = self._ordinals.append
+        index = self._archived + len(self._ordinals)
+        for ordinal, code, amount, balance in zip(ordinals, codes, amounts,
+                                                  balances):
+            append_amount(amount)
+            append_balance(balance)
+            append_code(code)
+            track(index, ordinal, code, amount, balance)
+            append_ordinal(ordinal)
+            index += 1
+        first = index - len(codes)
+        for offset, transfer_id, account_id in links:
+            self._links[first + offset] = (transfer_id, account_id)
+        if self._archive is not None:
+            self._spill()
+
+    def columns(self):
+        """
+        Return the ledger's arrays: amounts, balances, codes, date ordinals.
+        Archived rows are read back and copied in front of the resident ones.
+        """
+        *resident, archived = self._resident
+        if not archived:
+            return tuple(resident)
+        rows = len(resident[3])
+        columns = tuple(array(column.typecode) for column in resident)
+        for segment in range(archived // self._archive.segment_rows):
+            for column, part in zip(columns, self._archive.read(
+                    self._archive_key, segment)):
+                column.extend(part)
+        for column, part in zip(columns, resident):
+            column.extend(part[:rows])
+        return columns
+
+    @classmethod
+    def from_columns(cls, amounts, balances, codes, ordinals, index=None):
+        """
+        Build a ledger around arrays laid out as columns() returns them.
+        index is what index() returned for them, if it was kept; without it
+        the date index and the rollups are worked out row by row.
+        """
+        ledger = cls()
+        ledger._amounts = amounts
+        ledger._balances = balances
+        ledger._codes = codes
+        ledger._ordinals = ordinals
+        ledger._publish()
+        if index is None:
+            ledger._rebuild_index()
+        else:
+            ledger._load_index(*index)
+        return ledger
+
+    def _rebuild_index(self):
+        """Work the date index and the rollups out again from the columns"""
+        self._reset_index()
+        for index in range(len(self._codes)):
+            self._track(index, self._ordinals[index], self._codes[index],
+                        self._amounts[index], self._balances[index])
+
+    def _load_index(self, in_date_order, daily, monthly):
+        """
+        Take the date index and the rollups from index() for the columns.
+        Only the checkpoints are worked out, one per CHECKPOINT_EVERY rows.
+        """
+        self._reset_index()
+        self._in_date_order = in_date_order
+        self._daily = daily
+        self._monthly = monthly
+        codes = self._codes
+        rows = len(codes)
+        if not rows:
+            return
+        last = self._ordinals[-1]
+        self._last_ordinal = last
+        self._last_daily = daily[last]
+        self._last_monthly = monthly[month_key(last)]
+        for index in range(0, rows, self.CHECKPOINT_EVERY):
+            self._checkpoints.append(self._real_balance_after(index - 1))
+        self._real_balance = self._real_balance_after(rows - 1)
+        not_applied = self.NOT_APPLIED
+        first = next((index for index, code in enumerate(codes)
+                      if not code & not_applied), None)
+        if first is not None:
+            self._opening = (self._ordinals[first], self._balances[first]
+                             - self._change(codes[first], self._amounts[first]))
+
+    def index(self):
+        """
+        Return (whether in date order, {day ordinal: Rollup},
+        {month key: Rollup}) over every row, for from_columns
+        """
+        return (self._in_date_order, dict(self._rollups(False)),
+                dict(self._rollups(True)))
+
+    @classmethod
+    def index_of(cls, columns):
+        """Return what index() would for a ledger of the columns"""
+        ordinals = columns[3]
+        in_date_order = all(earlier <= later for earlier, later
+                            in zip(ordinals, itertools.islice(ordinals, 1,
+                                                              None)))
+        return (in_date_order,) + cls._rollups_of(columns, 0)
+
+    def rows_between(self, start, end):
+        """
+        Return the row numbers dated from start to end inclusive, in date
+        order. Found by bisecting the date column; out of date order, by
+        bisecting each segment's rows in date order and merging them.
+        """
+        start = MyDate.from_date(start)._ordinal
+        end = MyDate.from_date(end)._ordinal
+        if self._in_date_order:
+            return range(self._bisect(start, False), self._bisect(end, True))
+        runs = []
+        for segment in self._segments_between(start, end):
+            rows = self._archive.segment_rows
+            ordinals = self._archive.read(self._archive_key, segment)[3]
+            order = self._archive.read_index(self._archive_key, segment)[2]
+            runs.append(self._run(order or range(rows), ordinals, start, end,
+                                  segment * rows))
+        if self._date_order is None:
+            self._date_order = array("i", sorted(
+                range(len(self._ordinals)), key=self._ordinals.__getitem__))
+        runs.append(self._run(self._date_order, self._ordinals, start, end,
+                              self._archived))
+        return [row for _, row in heapq.merge(*runs)]
+
+    @staticmethod
+    def _run(order, ordinals, start, end, first_row):
+        """
+        Return [(day ordinal, row number)] of the rows dated start to end
+        in a block of rows, given its offsets in date order
+        """
+        key = ordinals.__getitem__
+        return [(ordinals[offset], first_row + offset) for offset in
+                order[bisect.bisect_left(order, start, key=key):
+                      bisect.bisect_right(order, end, key=key)]]
+
+    def _real_balance_after(self, index):
+        """
+        Return the account's balance in cents after row index. Rows that
+        weren't applied are skipped back over, never past the row's checkpoint
+        or the start of its archived segment.
+        """
+        not_applied = self.NOT_APPLIED
+        if index < 0:
+            return 0
+        base = self._archived
+        if index >= base:
+            codes = self._codes
+            checkpoint_every = self.CHECKPOINT_EVERY
+            while codes[index - base] & not_applied:
+                if index % checkpoint_every == 0:
+                    return self._checkpoints[index // checkpoint_every
+                                             - self._checkpoint_base]
+                index -= 1
+            return self._balances[index - base]
+        segment, index = divmod(index, self._archive.segment_rows)
+        _, balances, codes, _ = self._archive.read(self._archive_key, segment)
+        while codes[index] & not_applied:
+            if index == 0:
+                return self._segment_openings[segment]
+            index -= 1
+        return balances[index]
+
+    def balance_as_of(self, date):
+        """
+        Return the account's balance at the end of date: that after the last
+        transaction dated on or before it, 0 before the first one. O(log n):
+        the date column is bisected and unapplied rows are resolved from the
+        sparse checkpoints. Once rows come out of date order each counts on
+        the day it is dated: the daily changes go into a DayTotals, kept up
+        to date as rows are added and worked out again only if a row came
+        in while it was being built.
+        """
+        ordinal = MyDate.from_date(date)._ordinal
+        if self._in_date_order:
+            index = self._bisect(ordinal, True) - 1
+            return Money.from_cents(self._real_balance_after(index))
+        day_totals = self._day_totals
+        if day_totals is None or day_totals[0] != len(self):
+            rows = len(self)
+            totals = DayTotals()
+            for day, change in self.daily_changes().items():
+                totals.add(day, change)
+            day_totals = self._day_totals = (rows, totals)
+        totals = day_totals[1]
+        if (self._opening is None or totals.first is None
+                or ordinal < totals.first):
+            return Money.from_cents(0)
+        return Money.from_cents(self._opening[1] + totals.total_to(ordinal))
+
+    @classmethod
+    def _change(cls, code, amount):
+        """Return how much a row changes the balance by, if it is applied"""
+        type_index = code & cls.TYPE_MASK
+        if type_index == Transaction.DEPOSIT:
+            return amount
+        if type_index == Transaction.WITHDRAWAL:
+            return -amount
+        return 0
+
+    def daily_changes(self):
+        """
+        Return {day ordinal: net change to the balance in cents} for the
+        days with transactions. They add up to the balance less the one
+        before the first applied row.
+        """
+        return {day: rollup.change_cents
+                for day, rollup in self._rollups(False)}
+
+    def iter_between(self, start, end):
+        """Yield the transactions dated from start to end inclusive"""
+        for index in self.rows_between(start, end):
+            yield Transaction.from_row(*self.row(index))
+
+    def daily_rollup(self, date):
+        """Return the Rollup of one day, or None if nothing happened"""
+        ordinal = MyDate.from_date(date)._ordinal
+        rollups = self._rollups(False, ordinal, ordinal)
+        return rollups[0][1] if rollups else None
+
+    def monthly_rollup(self, year, month):
+        """Return the Rollup of one month, or None if nothing happened"""
+        key = year * 12 + month - 1
+        rollups = self._rollups(True, key, key)
+        return rollups[0][1] if rollups else None
+
+    def daily_rollups(self, start, end):
+        """Return [(MyDate, Rollup)] for the active days from start to end"""
+        return [(MyDate.from_ordinal(day), rollup) for day, rollup
+                in self._rollups(False, MyDate.from_date(start)._ordinal,
+                                 MyDate.from_date(end)._ordinal)]
+
+    def closing_balance_for_month(self, year, month):
+        """
+        Return the balance at the end of the month, as balance_as_of its
+        last day: after the last transaction of the month, or of the latest
+        earlier month with transactions; 0 before the first one
+        """
+        return Money.from_cents(self.closing_cents_for_month(year, month))
+
+    def closing_cents_for_month(self, year, month):
+        """Return closing_balance_for_month in cents"""
+        last_day = month_days(year * 12 + month - 1)[1]
+        return self.balance_as_of(MyDate.from_ordinal(last_day)).cents
+
+    def link(self, index, transfer_id, account_id):
+        """Mark a row as this account's side of a transfer with another account"""
+        self._links[self._index(index)] = (transfer_id, account_id)
+
+    def get_link(self, index):
+        """Return (transfer ID, other account ID) for a transfer row, else None"""
+        index = self._index(index)
+        link = self._links.get(index)
+        if link is None and index < self._archived:
+            rows = self._archive.segment_rows
+            segment = index // rows
+            links = self._archive.read_index(self._archive_key, segment)[3]
+            link = links.get(index - segment * rows)
+        return link
+
+    def links(self):
+        """
+        Return {row: (transfer ID, other account ID)} for the transfer rows,
+        those of archived rows read from their segments' indexes
+        """
+        links = {}
+        resident = dict(self._links)
+        if self._archive is not None:
+            rows = self._archive.segment_rows
+            for segment in range(self._archived // rows):
+                index = self._archive.read_index(self._archive_key, segment)
+                links.update((segment * rows + offset, link)
+                             for offset, link in index[3].items())
+        links.update(resident)
+        return links
+
+    def _index(self, index):
+        """Return a non-negative row index, raising IndexError when out of range"""
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("ledger index out of range")
+        return index
+
+    def row(self, index):
+        """Return (amount, type, date, balance after) for a row, in cents"""
+        index = self._index(index)
+        amounts, balances, codes, ordinals, first, _ = self._block(index)
+        index -= first
+        return (amounts[index], codes[index] & self.TYPE_MASK,
+                MyDate.from_ordinal(ordinals[index]), balances[index])
+
+    def is_applied(self, index):
+        """
+        Return whether a row was applied, as append_row's applied: False for
+        one that didn't change the balance though it isn't a No transaction
+        """
+        index = self._index(index)
+        _, _, codes, _, first, _ = self._block(index)
+        return not codes[index - first] & self.NOT_APPLIED
+
+    def get_type(self, index):
+        """Return the transaction type of a row"""
+        index = self._index(index)
+        _, _, codes, _, first, _ = self._block(index)
+        return codes[index - first] & self.TYPE_MASK
+
+    def get_balance_after_transaction(self, index):
+        """Return the balance after a row"""
+        index = self._index(index)
+        _, balances, _, _, first, _ = self._block(index)
+        return Money.from_cents(balances[index - first])
+
+    def render(self, index):
+        """Return the statement line of a row without building a Transaction"""
+        index = self._index(index)
+        amounts, balances, codes, ordinals, first, _ = self._block(index)
+        index -= first
+        return self._render_line(ordinals[index], codes[index],
+                                 amounts[index], balances[index])
+
+    @staticmethod
+    @functools.lru_cache(maxsize=65536)
+    def _render_line(ordinal, code, amount, balance):
+        """Return the statement line for raw row values, remembering recent ones"""
+        return Transaction.render(MyDate.from_ordinal(ordinal),
+                                  code & Ledger.TYPE_MASK, amount, balance)
+
+    def iter_lines(self, start=0, stop=None):
+        """Yield statement lines for rows start..stop, a segment at a time"""
+        start, stop, _ = slice(start, stop).indices(len(self))
+        render_line = self._render_line
+        while start < stop:
+            amounts, balances, codes, ordinals, first, end = self._block(start)
+            end = min(end, stop)
+            for index in range(start - first, end - first):
+                yield render_line(ordinals[index], codes[index],
+                                  amounts[index], balances[index])
+            start = end
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = self._index(index)
+        transaction = Transaction.from_row(*self.row(index))
+        link = self.get_link(index)
+        if link is not None:
+            transaction._link = link
+        return transaction
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+class Archive:
+    """
+    Segment files holding ledgers' older rows, each segment_rows rows of
+    the four ledger columns, and an LRU cache of the segments read back.
+    Next to each segment is an index file of its daily and monthly rollups,
+    its transfer links and, for a ledger out of date order, its rows in date
+    order. Ledgers keep hot_rows to hot_rows + segment_rows rows in memory,
+    at least one so a transfer can link the row it just added, and so with
+    the cache bounded too memory stays flat however long histories grow.
+    A new temporary directory is used if none is given, and removed on
+    close. A ledger's files are removed once it is garbage collected.
+    """
+    # days, months, rows in date order, links
+    INDEX_HEADER = struct.Struct("<IIII")
+
+    def __init__(self, directory=None, hot_rows=4096, segment_rows=4096,
+                 cache_segments=64):
+        if segment_rows <= 0 or segment_rows % Ledger.CHECKPOINT_EVERY:
+            raise ValueError(f"segment_rows must be a multiple of "
+                             f"{Ledger.CHECKPOINT_EVERY}")
+        if hot_rows < 1:
+            raise ValueError("hot_rows must be at least 1")
+        self._temporary = None
+        if directory is None:
+            self._temporary = tempfile.TemporaryDirectory(
+                prefix="bank-archive-")
+            directory = self._temporary.name
+        else:
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.hot_rows = hot_rows
+        self.segment_rows = segment_rows
+        self.cache_segments = cache_segments
+        self.reads = 0  # segments read from disk
+        self._cache = OrderedDict()  # (key, segment) -> columns
+        self._lock = threading.Lock()
+        self._keys = itertools.count()
+        self._used_keys = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def new_key(self):
+        """Return a key no other ledger in this archive uses"""
+        with self._lock:
+            self._used_keys += 1
+            return next(self._keys)
+
+    def path(self, key, segment, kind="seg"):
+        """Return the file of one segment of a ledger, or with kind "idx" its index"""
+        return os.path.join(self.directory, f"{key}.{segment}.{kind}")
+
+    def discard(self, key):
+        """Remove a ledger's segments and indexes, files and cache alike"""
+        with self._lock:
+            for cached in [cached for cached in self._cache
+                           if cached[0] == key]:
+                del self._cache[cached]
+        for segment in itertools.count():
+            try:
+                os.remove(self.path(key, segment))
+            except FileNotFoundError:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.path(key, segment, "idx"))
+
+    def close(self):
+        """Remove every ledger's files, and the directory if it was temporary"""
+        for key in range(self._used_keys):
+            self.discard(key)
+        if self._temporary is not None:
+            self._temporary.cleanup()
+
+    def write(self, key, segment, columns):
+        """Write one segment of a ledger's columns"""
+        with open(self.path(key, segment), "wb") as file:
+            for column in columns:
+                file.write(column.tobytes())
+
+    def read(self, key, segment):
+        """Return (amounts, balances, codes, ordinals) of one segment"""
+        with self._lock:
+            columns = self._cache.get((key, segment))
+            if columns is not None:
+                self._cache.move_to_end((key, segment))
+                return columns
+        columns = (array("q"), array("q"), array("B"), array("i"))
+        with open(self.path(key, segment), "rb") as file:
+            for column in columns:
+                column.fromfile(file, self.segment_rows)
+        self._keep((key, segment), columns)
+        return columns
+
+    def _keep(self, cached, value):
+        """Cache what was read of a segment, evicting the least recently used"""
+        with self._lock:
+            self.reads += 1
+            self._cache[cached] = value
+            while len(self._cache) > self.cache_segments:
+                self._cache.popitem(last=False)
+
+    def write_index(self, key, segment, daily, monthly, date_order, links):
+        """
+        Write the index of one segment of a ledger: its {day ordinal: Rollup},
+        {month key: Rollup}, the segment's row offsets in date order, an
+        empty array when its rows are already in date order, and its
+        {row offset: (transfer ID, other account ID)}
+        """
+        daily = Rollup.to_columns(daily)
+        monthly = Rollup.to_columns(monthly)
+        link_columns = (array("i", links),
+                        array("q", (link[0] for link in links.values())),
+                        array("q", (link[1] for link in links.values())))
+        with open(self.path(key, segment, "idx"), "wb") as file:
+            file.write(self.INDEX_HEADER.pack(len(daily[0]), len(monthly[0]),
+                                              len(date_order), len(links)))
+            for column in daily + monthly + (date_order,) + link_columns:
+                file.write(column.tobytes())
+
+    def read_index(self, key, segment):
+        """Return (daily rollups, monthly rollups, date order, links) of a segment"""
+        with self._lock:
+            index = self._cache.get((key, segment, "idx"))
+            if index is not None:
+                self._cache.move_to_end((key, segment, "idx"))
+                return index
+        with open(self.path(key, segment, "idx"), "rb") as file:
+            days, months, rows, linked = self.INDEX_HEADER.unpack(
+                file.read(self.INDEX_HEADER.size))
+            rollups = []
+            for count in (days, months):
+                columns = [array("i")] + [array("q") for _ in Rollup.__slots__]
+                for column in columns:
+                    column.fromfile(file, count)
+                rollups.append(Rollup.from_columns(columns))
+            date_order = array("i")
+            date_order.fromfile(file, rows)
+            offsets, transfer_ids, account_ids = (array("i"), array("q"),
+                                                  array("q"))
+            for column in (offsets, transfer_ids, account_ids):
+                column.fromfile(file, linked)
+        index = (rollups[0], rollups[1], date_order,
+                 dict(zip(offsets, zip(transfer_ids, account_ids))))
+        self._keep((key, segment, "idx"), index)
+        return index
+
+
+class ActivityWindow:
+    """
+    The accepted deposits and withdrawals of one account over a sliding
+    window of days, kept as one bucket per day with activity. A day enters
+    and leaves the window once, so keeping the totals is O(1) amortized and
+    memory is bounded by the window's length. Amounts are in cents.
+    """
+    __slots__ = ("deposits", "deposit_cents", "withdrawals",
+                 "withdrawal_cents", "_buckets")
+
+    def __init__(self):
+        self.deposits = 0
+        self.deposit_cents = 0
+        self.withdrawals = 0
+        self.withdrawal_cents = 0
+        # [day ordinal, deposits, deposit cents, withdrawals, withdrawal cents]
+        # oldest first
+        self._buckets = deque()
+
+    @property
+    def deposit_total(self):
+        return Money.from_cents(self.deposit_cents)
+
+    @property
+    def withdrawal_total(self):
+        return Money.from_cents(self.withdrawal_cents)
+
+    @property
+    def latest(self):
+        """The day ordinal of the newest bucket, or None"""
+        return self._buckets[-1][0] if self._buckets else None
+
+    def add(self, ordinal, deposits, deposit_cents, withdrawals,
+            withdrawal_cents, days):
+        """
+        Count activity on a day, then drop the days that have left a window
+        of days ending on the newest day. Days already out of it are ignored.
+        """
+        buckets = self._buckets
+        if not buckets or ordinal > buckets[-1][0]:
+            bucket = [ordinal, 0, 0, 0, 0]
+            buckets.append(bucket)
+        elif ordinal <= buckets[-1][0] - days:
+            return
+        else:
+            position = len(buckets) - 1
+            while position >= 0 and buckets[position][0] > ordinal:
+                position -= 1
+            if position >= 0 and buckets[position][0] == ordinal:
+                bucket = buckets[position]
+            else:
+                bucket = [ordinal, 0, 0, 0, 0]
+                buckets.insert(position + 1, bucket)
+        bucket[1] += deposits
+        bucket[2] += deposit_cents
+        bucket[3] += withdrawals
+        bucket[4] += withdrawal_cents
+        self.deposits += deposits
+        self.deposit_cents += deposit_cents
+        self.withdrawals += withdrawals
+        self.withdrawal_cents += withdrawal_cents
+        self.expire(buckets[-1][0] - days)
+
+    def expire(self, ordinal):
+        """Drop the days up to and including ordinal"""
+        buckets = self._buckets
+        while buckets and buckets[0][0] <= ordinal:
+            _, deposits, deposit_cents, withdrawals, withdrawal_cents = \
+                buckets.popleft()
+            self.deposits -= deposits
+            self.deposit_cents -= deposit_cents
+            self.withdrawals -= withdrawals
+            self.withdrawal_cents -= withdrawal_cents
+
+    def between(self, first, last):
+        """Return an ActivityWindow of the days first to last inclusive"""
+        window = ActivityWindow()
+        for bucket in self._buckets:
+            if first <= bucket[0] <= last:
+                window._buckets.append(list(bucket))
+                window.deposits += bucket[1]
+                window.deposit_cents += bucket[2]
+                window.withdrawals += bucket[3]
+                window.withdrawal_cents += bucket[4]
+        return window
+
+    def __repr__(self):
+        return (f"ActivityWindow(deposits={self.deposits} "
+                f"${self.deposit_total}, withdrawals={self.withdrawals} "
+                f"${self.withdrawal_total})")
+
+
+class ActivityMonitor:
+    """
+    Sliding-window activity of a bank's accounts over the last days days,
+    from MyBank.watch_activity. The bank feeds it every deposit and
+    withdrawal that goes through from then on, closing withdrawals and
+    transfers included. Windows end on the given date, or on the newest day
+    seen; only the days of each account's latest window are kept, so windows
+    ending before that see just the part of them still kept. Queries change
+    nothing. Accounts that have gone quiet are swept out as the newest day
+    moves on, so memory is bounded by the accounts active in the window.
+    """
+
+    def __init__(self, days=1):
+        if days <= 0:
+            raise ValueError("an activity window must be at least a day long")
+        self.days = days
+        self._windows = {}  # account ID -> ActivityWindow, if any activity
+        self._latest = None  # the newest day ordinal seen
+        self._swept = None  # the newest day when quiet accounts were swept out
+        self._lock = threading.Lock()
+
+    def record(self, account_id, type_index, amount, date):
+        """Count one accepted transaction of an account, amount in cents"""
+        self.record_day(account_id, date.toordinal(),
+                        *((1, amount, 0, 0) if type_index == Transaction.DEPOSIT
+                          else (0, 0, 1, amount)))
+
+    def record_day(self, account_id, ordinal, deposits, deposit_cents,
+                   withdrawals, withdrawal_cents):
+        """Count a day's worth of accepted transactions of an account"""
+        with self._lock:
+            window = self._windows.get(account_id)
+            if window is None:
+                window = self._windows[account_id] = ActivityWindow()
+            window.add(ordinal, deposits, deposit_cents, withdrawals,
+                       withdrawal_cents, self.days)
+            if self._latest is None or ordinal > self._latest:
+                self._latest = ordinal
+                if self._swept is None:
+                    self._swept = ordinal
+                elif ordinal - self._swept >= self.days:
+                    self._sweep(ordinal)
+
+    def forget(self, account_id):
+        """Drop an account that has left the bank"""
+        with self._lock:
+            self._windows.pop(account_id, None)
+
+    def _last_day(self, date):
+        """Return the ordinal of the window's last day; lock held"""
+        if date is None:
+            return self._latest
+        return MyDate.from_date(date)._ordinal
+
+    def sweep(self, date=None):
+        """
+        Drop the days before the window ending on date, the newest day seen
+        if not given, and the accounts left with none. Return how many
+        accounts were dropped.
+        """
+        with self._lock:
+            last = self._last_day(date)
+            return 0 if last is None else self._sweep(last)
+
+    def _sweep(self, last):
+        """Sweep out what is older than the window ending on last; lock held"""
+        quiet = []
+        for account_id, window in self._windows.items():
+            window.expire(last - self.days)
+            if not window._buckets:
+                quiet.append(account_id)
+        for account_id in quiet:
+            del self._windows[account_id]
+        self._swept = last
+        return len(quiet)
+
+    def activity(self, account_id, date=None):
+        """Return an account's ActivityWindow ending on date"""
+        with self._lock:
+            window = self._windows.get(account_id)
+            last = self._last_day(date)
+            if window is None or last is None:
+                return ActivityWindow()
+            return window.between(last - self.days + 1, last)
+
+    def over(self, date=None, deposits=None, deposited=None, withdrawals=None,
+             withdrawn=None):
+        """
+        Return the IDs of the accounts over any of the given thresholds in
+        the window ending on date: more than deposits deposits or withdrawals
+        withdrawals, or more than deposited or withdrawn in all. Only the
+        accounts with activity in the window are looked at.
+        """
+        deposited = None if deposited is None else Money.to_cents(deposited)
+        withdrawn = None if withdrawn is None else Money.to_cents(withdrawn)
+        flagged = []
+        with self._lock:
+            last = self._last_day(date)
+            if last is None:
+                return flagged
+            first = last - self.days + 1
+            for account_id, window in self._windows.items():
+                if window.latest < first:
+                    continue
+                if window.latest > last or window._buckets[0][0] < first:
+                    window = window.between(first, last)
+                if (deposits is not None and window.deposits > deposits
+                        or deposited is not None
+                        and window.deposit_cents > deposited
+                        or withdrawals is not None
+                        and window.withdrawals > withdrawals
+                        or withdrawn is not None
+                        and window.withdrawal_cents > withdrawn):
+                    flagged.append(account_id)
+        return flagged
+
+
+class BalanceRanking:
+    """
+    The open accounts of a bank ordered by balance, from MyBank.rank_balances.
+    Kept as a list of sorted buckets of (cents, account ID) of up to
+    2 * LOAD keys each, with a Fenwick tree of the bucket sizes, so updates
+    and rank queries are O(log n) and top and bottom k O(log n + k).
+    Ties are broken by account ID.
+    """
+    LOAD = 512
+
+    def __init__(self):
+        self._balances = {}  # account ID -> cents
+        self._buckets = []  # sorted lists of (cents, account ID), in order
+        self._maxes = []  # the last key of each bucket
+        self._tree = [0]  # Fenwick tree of the bucket sizes, 1-based
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._balances)
+
+    def _rebuild_tree(self):
+        """Rebuild the Fenwick tree after buckets are split or dropped"""
+        tree = [0] + [len(bucket) for bucket in self._buckets]
+        for position in range(1, len(tree)):
+            parent = position + (position & -position)
+            if parent < len(tree):
+                tree[parent] += tree[position]
+        self._tree = tree
+
+    def _resize(self, bucket, change):
+        """Adjust the Fenwick tree for keys added to or taken from a bucket"""
+        tree = self._tree
+        position = bucket + 1
+        while position < len(tree):
+            tree[position] += change
+            position += position & -position
+
+    def _keys_before(self, bucket):
+        """Return the number of keys in the buckets before bucket"""
+        tree = self._tree
+        total = 0
+        while bucket > 0:
+            total += tree[bucket]
+            bucket -= bucket & -bucket
+        return total
+
+    def _insert(self, key):
+        buckets, maxes = self._buckets, self._maxes
+        if not buckets:
+            buckets.append([key])
+            maxes.append(key)
+            self._rebuild_tree()
+            return
+        position = bisect.bisect_left(maxes, key)
+        if position == len(maxes):
+            position -= 1
+            buckets[position].append(key)
+            maxes[position] = key
+        else:
+            bisect.insort(buckets[position], key)
+        bucket = buckets[position]
+        if len(bucket) > 2 * self.LOAD:
+            buckets.insert(position + 1, bucket[self.LOAD:])
+            del bucket[self.LOAD:]
+            maxes[position] = bucket[-1]
+            maxes.insert(position + 1, buckets[position + 1][-1])
+            self._rebuild_tree()
+        else:
+            self._resize(position, 1)
+
+    def _remove(self, key):
+        buckets, maxes = self._buckets, self._maxes
+        position = bisect.bisect_left(maxes, key)
+        bucket = buckets[position]
+        del bucket[bisect.bisect_left(bucket, key)]
+        if bucket:
+            maxes[position] = bucket[-1]
+            self._resize(position, -1)
+        else:
+            del buckets[position]
+            del maxes[position]
+            self._rebuild_tree()
+
+    def set(self, account_id, cents):
+        """Rank an account at a balance in cents"""
+        with self._lock:
+            old = self._balances.get(account_id)
+            if old == cents:
+                return
+            if old is not None:
+                self._remove((old, account_id))
+            self._insert((cents, account_id))
+            self._balances[account_id] = cents
+
+    def discard(self, account_id):
+        """Stop ranking an account"""
+        with self._lock:
+            cents = self._balances.pop(account_id, None)
+            if cents is not None:
+                self._remove((cents, account_id))
+
+    def rank(self, account_id):
+        """Return an account's place counting from the highest balance, or None"""
+        with self._lock:
+            cents = self._balances.get(account_id)
+            if cents is None:
+                return None
+            key = (cents, account_id)
+            position = bisect.bisect_left(self._maxes, key)
+            below = (self._keys_before(position)
+                     + bisect.bisect_left(self._buckets[position], key))
+            return len(self._balances) - below
+
+    def top(self, k):
+        """Return [(account ID, balance)] of the k highest balances, highest first"""
+        ranked = []
+        with self._lock:
+            for bucket in reversed(self._buckets):
+                for cents, account_id in reversed(bucket):
+                    if len(ranked) >= k:
+                        return ranked
+                    ranked.append((account_id, Money.from_cents(cents)))
+        return ranked
+
+    def bottom(self, k):
+        """Return [(account ID, balance)] of the k lowest balances, lowest first"""
+        ranked = []
+        with self._lock:
+            for bucket in self._buckets:
+                for cents, account_id in bucket:
+                    if len(ranked) >= k:
+                        return ranked
+                    ranked.append((account_id, Money.from_cents(cents)))
+        return ranked
+
+
+class NameIndex:
+    """
+    The customers of a bank by the words of their names, from
+    MyBank.index_names. Words are case-folded. Prefix searches bisect a
+    sorted list of the distinct words; typo-tolerant ones look words up by
+    their trigrams, a word within max_edits edits of another sharing at
+    least one of any 3 * max_edits + 1 of its trigrams. Shorter words are
+    looked up by trying every edit of them with the letters in use, or
+    among the words of about their length when there are fewer of those,
+    so the work doesn't grow with the number of customers. The candidates'
+    edit distance is then checked. Results come word by word in
+    alphabetical order, closest words first when typos are allowed, and the
+    customers with the same word in the order they were added; a search
+    stops once it has limit customers no later one could place ahead of.
+    """
+    WORD = re.compile(r"\w+")
+
+    def __init__(self):
+        self._words_of = {}  # customer ID -> the words of their name
+        self._customers_with = {}  # word -> {customer ID: None}, in order
+        self._words = []  # the distinct words, sorted
+        self._grams = {}  # trigram -> set of words
+        self._by_length = {}  # word length -> set of words
+        self._letters = {}  # letter -> number of distinct words with it
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._words_of)
+
+    @classmethod
+    def words(cls, name):
+        """Return the case-folded words of a name"""
+        return cls.WORD.findall(name.casefold())
+
+    @staticmethod
+    def trigrams(word):
+        """Return the trigrams of a word, its ends marked"""
+        marked = f"^{word}$"
+        return {marked[i:i + 3] for i in range(len(marked) - 2)}
+
+    def add(self, customer_id, name):
+        """Index a customer's name"""
+        with self._lock:
+            self._discard(customer_id)
+            words = tuple(dict.fromkeys(self.words(name)))
+            self._words_of[customer_id] = words
+            for word in words:
+                customers = self._customers_with.get(word)
+                if customers is None:
+                    customers = self._customers_with[word] = {}
+                    bisect.insort(self._words, word)
+                    for gram in self.trigrams(word):
+                        self._grams.setdefault(gram, set()).add(word)
+                    self._by_length.setdefault(len(word), set()).add(word)
+                    for letter in set(word):
+                        self._letters[letter] = self._letters.get(letter, 0) + 1
+                customers[customer_id] = None
+
+    def discard(self, customer_id):
+        """Stop indexing a customer"""
+        with self._lock:
+            self._discard(customer_id)
+
+    def _discard(self, customer_id):
+        for word in self._words_of.pop(customer_id, ()):
+            customers = self._customers_with[word]
+            del customers[customer_id]
+            if not customers:
+                del self._customers_with[word]
+                del self._words[bisect.bisect_left(self._words, word)]
+                for gram in self.trigrams(word):
+                    grams = self._grams[gram]
+                    grams.discard(word)
+                    if not grams:
+                        del self._grams[gram]
+                lengths = self._by_length[len(word)]
+                lengths.discard(word)
+                if not lengths:
+                    del self._by_length[len(word)]
+                for letter in set(word):
+                    self._letters[letter] -= 1
+                    if not self._letters[letter]:
+                        del self._letters[letter]
+
+    def _prefixed(self, prefix):
+        """Return the range of the sorted words starting with prefix"""
+        words = self._words
+        end = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return range(bisect.bisect_left(words, prefix),
+                     bisect.bisect_left(words, end))
+
+    def _edits(self, word, max_edits):
+        """
+        Return the indexed words reached by up to max_edits deletions,
+        insertions or substitutions of the letters in use on word
+        """
+        letters = list(self._letters)
+        reached = {word}
+        frontier = reached
+        for _ in range(max_edits):
+            edited = set()
+            for text in frontier:
+                for i in range(len(text) + 1):
+                    head, tail = text[:i], text[i:]
+                    rest = tail[1:]
+                    if tail:
+                        edited.add(head + rest)
+                        edited.update(head + letter + rest for letter in letters)
+                    edited.update(head + letter + tail for letter in letters)
+            frontier = edited - reached
+            reached |= frontier
+        customers_with = self._customers_with
+        return [text for text in reached if text in customers_with]
+
+    def _similar(self, word, max_edits):
+        """Return the indexed words that may be within max_edits edits of word"""
+        grams = sorted(self.trigrams(word),
+                       key=lambda gram: len(self._grams.get(gram, ())))
+        if len(grams) > 3 * max_edits:
+            candidates = set()
+            for gram in grams[:3 * max_edits + 1]:
+                candidates.update(self._grams.get(gram, ()))
+            return candidates
+        # Too short for a match to be sure to share a trigram: try every
+        # edit, unless the words of about its length are fewer
+        lengths = [self._by_length.get(length, ())
+                   for length in range(len(word) - max_edits,
+                                       len(word) + max_edits + 1)]
+        edits = ((2 * len(word) + 2 * max_edits + 1)
+                 * len(self._letters)) ** max_edits
+        if edits < sum(map(len, lengths)) * len(word):
+            return self._edits(word, max_edits)
+        return set().union(*lengths)
+
+    @staticmethod
+    def edit_distance(word, other, most):
+        """
+        Return the Levenshtein distance between two words, or most + 1 if
+        it is more than most
+        """
+        if abs(len(word) - len(other)) > most:
+            return most + 1
+        previous = list(range(len(other) + 1))
+        for i, letter in enumerate(word, 1):
+            current = [i]
+            for j, other_letter in enumerate(other, 1):
+                current.append(min(previous[j] + 1, current[j - 1] + 1,
+                                   previous[j - 1] + (letter != other_letter)))
+            if min(current) > most:
+                return most + 1
+            previous = current
+        return min(previous[-1], most + 1)
+
+    def _matches(self, customer_ids, words, scores):
+        """
+        Yield (score, customer ID) for the candidates whose names have a
+        word matching each of words, scores mapping a word to a function
+        of a name's word returning its distance, or None if it doesn't match
+        """
+        words_of = self._words_of
+        for customer_id in customer_ids:
+            total = 0
+            for word in words:
+                best = None
+                for name_word in words_of[customer_id]:
+                    distance = scores[word](name_word)
+                    if distance is not None and (best is None
+                                                 or distance < best):
+                        best = distance
+                if best is None:
+                    break
+                total += best
+            else:
+                yield total, customer_id
+
+    def search(self, text, limit=10):
+        """
+        Return the IDs of up to limit customers with a word in their name
+        starting with each word of text
+        """
+        words = self.words(text)
+        if not words or limit <= 0:
+            return []
+        found = []
+        with self._lock:
+            # Walk the customers of the word with the fewest, counting each
+            # word's only until it has more than the fewest so far
+            narrowest, fewest = None, None
+            for word in words:
+                customers = 0
+                for position in self._prefixed(word):
+                    customers += len(self._customers_with[self._words[position]])
+                    if fewest is not None and customers >= fewest:
+                        break
+                else:
+                    narrowest, fewest = word, customers
+            scores = {word: (lambda name_word, word=word:
+                             0 if name_word.startswith(word) else None)
+                      for word in words}
+            seen = set()
+            for position in self._prefixed(narrowest):
+                for customer_id in self._customers_with[self._words[position]]:
+                    if customer_id in seen:
+                        continue
+                    seen.add(customer_id)
+                    for _ in self._matches((customer_id,), words, scores):
+                        found.append(customer_id)
+                        if len(found) >= limit:
+                            return found
+        return found
+
+    def search_fuzzy(self, text, limit=10, max_edits=1):
+        """
+        Return the IDs of up to limit customers with a word in their name
+        within max_edits edits of each word of text, closest first
+        """
+        words = self.words(text)
+        if not words or limit <= 0:
+            return []
+        with self._lock:
+            close = {}  # query word -> {name word: distance}
+            for word in words:
+                close[word] = {}
+                for candidate in self._similar(word, max_edits):
+                    distance = self.edit_distance(word, candidate, max_edits)
+                    if distance <= max_edits:
+                        close[word][candidate] = distance
+            narrowest = min(words, key=lambda word: sum(
+                len(self._customers_with[candidate])
+                for candidate in close[word]))
+            # The candidates a distance d from the narrowest word score at
+            # least d, so once limit matches score less the rest can't place
+            by_distance = [[] for _ in range(max_edits + 1)]
+            for candidate, distance in sorted(close[narrowest].items()):
+                by_distance[distance].append(candidate)
+            scores = {word: close[word].get for word in words}
+            ranked = []
+            seen = set()
+
+            def reached(candidates):
+                for candidate in candidates:
+                    for customer_id in self._customers_with[candidate]:
+                        if customer_id not in seen:
+                            seen.add(customer_id)
+                            yield customer_id
+
+            for distance, candidates in enumerate(by_distance):
+                placed = sum(score <= distance for score, _ in ranked)
+                for score, customer_id in self._matches(reached(candidates),
+                                                        words, scores):
+                    if placed >= limit:
+                        break
+                    ranked.append((score, customer_id))
+                    if score <= distance:
+                        placed += 1
+                if placed >= limit:
+                    break
+            ranked.sort(key=lambda match: match[0])
+        return [customer_id for _, customer_id in ranked[:limit]]
 
 
 class Account:
     """
-    A bank account. Contains a list of transactions.
+    A bank account. Contains a ledger of transactions.
     """
 
     ACCOUNT_TYPE = "GET_RICH_QUICK ACCOUNT"
+    # Kept by the bank for its read views: the epoch of the last change, and
+    # [(epoch, cents, is_open, rows)] of states older views may still need
+    _written_epoch = 0
+    _versions = None
 
     def __init__(self, id): # -1
         self._ACCOUNT_ID = id
-        self.balance = 0
+        self._cents = 0  # the balance
         self.is_open = True
-        self.transactions = []
+        self.transactions = Ledger()
+        self._bank = None  # the MyBank keeping totals for this account
+        self._lock = threading.Lock()  # one change to the account at a time
+
+    def get_account_id(self):
+        """Return account ID"""
+        return self._ACCOUNT_ID
 
     def get_is_open(self):
         """Return account open status"""
@@ -84,53 +2038,145 @@ class Account:
         else:
             return False
 
+    @property
+    def balance(self):
+        """The account balance as Money"""
+        return Money.from_cents(self._cents)
+
+    @balance.setter
+    def balance(self, amount):
+        self._cents = Money.to_cents(amount)
+
     def get_current_balance(self):
         """Return account balance"""
         return self.balance
 
     def set_is_open(self, set_open):
         """Open account"""
-        self.is_open = set_open
+        with self._lock:
+            was_open = self.is_open
+            self.is_open = set_open
+            if self._bank is not None:
+                self._bank._on_status_change(self, was_open)
 
     def close_account(self, date):
         """Close account and withdraw funds"""
-        self.is_open = False
-        transaction = Transaction(self.balance, 1, date, self.balance)
-        self.transactions.append(transaction)
-        self.balance = 0
+        with self._lock:
+            was_open = self.is_open
+            amount = self._cents
+            self.is_open = False
+            self.transactions.append_row(amount, 1, date, 0)
+            self._cents = 0
+            if self._bank is not None:
+                self._bank._on_close(self, was_open, amount, date)
 
     def perform_transaction(self, amount, transaction_type, date):
         """Perform a transaction on the account"""
-        transaction = Transaction(amount, transaction_type, date, self.balance)
-        self.transactions.append(transaction)
-        if self.is_open:
-            if transaction_type == 0: # -1
-                self.balance += amount
-                return True
-            elif (transaction_type == 1) and not (self.balance - amount < 0): # -1
-                self.balance -= amount
-                return True
-            else:
-                return False
-        else:
-            return False
+        amount = Money.to_cents(amount)
+        with self._lock:
+            type_index, balance_after = Transaction.resolve(
+                amount, transaction_type, self._cents)
+            self.transactions.append_row(amount, type_index, date,
+                                         balance_after, self.is_open)
+            accepted = (self.is_open
+                        and type_index != Transaction.NO_TRANSACTION)
+            if accepted:
+                self._cents = balance_after
+            if self._bank is not None:
+                self._bank._on_transaction(self, amount, type_index, date,
+                                           accepted)
+            return accepted
+
+    def apply_rows(self, rows, amounts, transaction_types, dates, accepted):
+        """
+        Perform the transactions at the given row positions of the batch
+        columns, in order, and mark the rows that went through in accepted.
+        Amounts are in cents.
+        """
+        with self._lock:
+            deposit = Transaction.DEPOSIT
+            withdrawal = Transaction.WITHDRAWAL
+            no_transaction = Transaction.NO_TRANSACTION
+            balance = self._cents
+            is_open = self.is_open
+            row_amounts = [amounts[row] for row in rows]
+            row_types = [transaction_types[row] for row in rows]
+            row_dates = [dates[row] for row in rows]
+            row_balances = []
+            add_balance = row_balances.append
+            posted = [False] * len(rows)
+            for i, amount in enumerate(row_amounts):
+                transaction_type = row_types[i]
+                if transaction_type == deposit:
+                    balance_after = balance + amount
+                elif (transaction_type == withdrawal
+                      and not balance - amount < 0):
+                    balance_after = balance - amount
+                else:
+                    row_types[i] = transaction_type = no_transaction
+                    balance_after = balance
+                add_balance(balance_after)
+                if is_open and transaction_type != no_transaction:
+                    balance = balance_after
+                    accepted[rows[i]] = True
+                    posted[i] = True
+            self.transactions.extend_rows(row_amounts, row_types, row_dates,
+                                          row_balances, is_open)
+            self._cents = balance
+            if self._bank is not None:
+                self._bank._on_batch(self, row_amounts, row_types, row_dates,
+                                     posted)
+
+    def restore_rows(self, amounts, type_indexes, dates, balances, applied,
+                     links=()):
+        """
+        Add rows recorded elsewhere, such as in an export, to the history
+        as they were, leaving the balance alone. applied has a flag for each
+        row and links are as for Ledger.extend_rows. Amounts are in cents.
+        """
+        with self._lock:
+            rows = len(self.transactions)
+            self.transactions.extend_rows(amounts, type_indexes, dates,
+                                          balances, list(applied), links)
+            if self._bank is not None:
+                self._bank._on_restore(self, rows, amounts, type_indexes,
+                                       dates, applied, links)
 
     def get_max_10_transactions(self):
         """Return last 10 transactions"""
-        temp10 = ""
-        n = 1
-        if len(self.transactions) >= 10:
-            for i in range(-10, 0):
-                temp10 += f"{n} {self.transactions[i]}\n"
-                n += 1
-        else:
-            for i in range(-len(self.transactions), 0):
-                temp10 += f"{n} {self.transactions[i]}\n"
-                n += 1
-        if self.is_open:
-            return temp10
-        else:
-            return f"Account closed\n{temp10}"
+        return self.get_statement(-10)
+
+    def balance_as_of(self, date):
+        """Return the account balance at the end of date"""
+        return self.transactions.balance_as_of(date)
+
+    def history_between(self, start, end):
+        """Return the transactions dated from start to end inclusive"""
+        return list(self.transactions.iter_between(start, end))
+
+    def get_statement(self, start=0, stop=None, first_number=1):
+        """
+        Return the transactions from start up to stop, numbered from
+        first_number. start and stop index the history like a slice, so
+        get_statement(-50) gives the last 50.
+        """
+        out = io.StringIO()
+        self.write_statement(out, start, stop, first_number)
+        return out.getvalue()
+
+    def write_statement(self, out, start=0, stop=None, first_number=1,
+                        lines_per_write=1000):
+        """Write the transactions from start up to stop to a file object"""
+        if not self.is_open:
+            out.write("Account closed\n")
+        page = []
+        for n, line in enumerate(self.transactions.iter_lines(start, stop),
+                                 first_number):
+            page.append(f"{n} {line}\n")
+            if len(page) >= lines_per_write:
+                out.write("".join(page))
+                page = []
+        out.write("".join(page))
 
     def __str__(self):
         """Return account details"""
@@ -186,6 +2232,10 @@ class Customer:
         """Return last 10 transactions from user's account"""
         return self.account.get_max_10_transactions()
 
+    def get_statement(self, start=0, stop=None, first_number=1):
+        """Return transactions start..stop from user's account"""
+        return self.account.get_statement(start, stop, first_number)
+
     def get_account_information(self):
         """Return account information"""
         return self.account.__str__()
@@ -196,22 +2246,91 @@ class Customer:
                 f"{self.account.__str__()}")
 
 
+class TotalsStripe:
+    """
+    The running totals of the bank's accounts whose ID hashes leave one
+    remainder divided by MyBank.STRIPES, in cents. Each stripe has its own lock, so
+    accounts on different stripes update the totals side by side.
+    """
+
+    def __init__(self):
+        self.balance = 0
+        self.inflow = 0
+        self.outflow = 0
+        self.open_accounts = 0
+        self.closed_accounts = 0
+        # The balance's history: the net change of each day, carried forward
+        # to every later day, plus changes that count from the start
+        self.base = 0
+        self.changes = DayTotals()
+        self.lock = threading.Lock()
+
+    def note_change(self, ordinal, cents):
+        """
+        Count a change to the balance on a day ordinal and every day after,
+        in O(log days) whether or not it is dated before earlier changes
+        """
+        if cents:
+            self.changes.add(ordinal, cents)
+
+    def note_account(self, account, sign=1):
+        """
+        Count, or with sign -1 take away, an account's balance: the daily
+        changes of its ledger on their days and the rest from the start
+        """
+        changes = account.transactions.daily_changes()
+        for ordinal, cents in changes.items():
+            self.note_change(ordinal, sign * cents)
+        self.base += sign * (account._cents - sum(changes.values()))
+
+    def total_as_of(self, ordinal):
+        """Return the balance at the end of a day ordinal, in cents"""
+        return self.base + self.changes.total_to(ordinal)
+
+
 class MyBank:
     """
     Represents a bank. Contains customers.
     """
+    STRIPES = 16  # the running totals are split this many ways
+
     def __init__(self, name):
         # -1
         self.name = name
-        self.customers = []
+        self._customers_by_id = {}  # customer ID -> Customer, in joining order
+        self._accounts_by_id = {}  # account ID -> Customer holding it
+        # Running totals, kept up to date by the accounts as they change
+        self._stripes = tuple(TotalsStripe() for _ in range(self.STRIPES))
+        self._retired_accounts = 0  # accounts closed and removed by close_account
+        self.journal = None  # a bankJournal.Journal recording every change
+        self.archive = None  # an Archive for the accounts' older transactions
+        self._next_transfer = 1
+        self._transfer_lock = threading.Lock()
+        self._monitors = ()  # ActivityMonitors fed by the hooks
+        self.ranking = None  # a BalanceRanking of the open accounts
+        self.names = None  # a NameIndex of the customers' names
+        # Read views: changes are counted in epochs, each view sees the bank
+        # as it was at the end of one
+        self._epoch = 1
+        self._views = {}  # epoch -> read views open on it
+        self._indexes_shared = False
+        # Guards the indexes; taken before any stripe's lock, and after the
+        # lock of an account joining or leaving
+        self._lock = threading.Lock()
+        self._worker_queues = []
         self.day = 0
         self.month = 0
         self.year = 0
 
+    @property
+    def customers(self):
+        """Return the bank's customers in the order they joined"""
+        return list(self._customers_by_id.values())
+
     @staticmethod
     def get_mydate_object():
         """Returns current date"""
-        return datetime.date.today()  # -1
+        return MyDate.today()
 
     @staticmethod
     def deposit_funds(current_customer):
@@ -219,7 +2338,7 @@ class MyBank:
         if current_customer.account.is_open:
             temp_depo = input("Enter the amount to deposit:")
             current_customer.perform_transaction(
-                float(temp_depo), 0, datetime.date.today()) # -1
+                Money(temp_depo), 0, MyDate.today())
         elif not current_customer.account.is_open:
             print("Account is closed!")
 
@@ -229,31 +2348,367 @@ class MyBank:
         if current_customer.account.is_open:
             temp_depo = input("Enter the amount to withdraw:")
             current_customer.perform_transaction(
-                float(temp_depo), 1, datetime.date.today()) # -1 # -1
+                Money(temp_depo), 1, MyDate.today())
         elif not current_customer.account.is_open:
             print("Account is closed!")
 
     @staticmethod
     def open_account(current_customer):
         """Opens customer's account"""
-        current_customer.open_account(datetime.date.today()) # -1
+        current_customer.open_account(MyDate.today())
         return current_customer.get_account_information()
 
     def close_account(self, current_customer):
         """Closes customer's account"""
-        current_customer.close_account(datetime.date.today()) # -1
-        self.customers.remove(current_customer)
+        self.retire_customer(current_customer, MyDate.today())
         print(current_customer.get_account_information())
 
-    def display_bank_summary(self):
+    def retire_customer(self, customer, date):
+        """Close the customer's account on date and remove them from the bank"""
+        customer.close_account(date)
+        self._remove_customer(customer, retire=True)
+
+    def _stripe(self, account):
+        """Return the TotalsStripe an account's changes are counted in"""
+        return self._stripes[hash(account._ACCOUNT_ID) % self.STRIPES]
+
+    @contextlib.contextmanager
+    def _all_locked(self):
+        """Hold the bank's lock and then every stripe's, so nothing changes"""
+        with self._lock:
+            for stripe in self._stripes:
+                stripe.lock.acquire()
+            try:
+                yield
+            finally:
+                for stripe in self._stripes:
+                    stripe.lock.release()
+
+    def _on_transaction(self, account, amount, type_index, date, accepted):
+        """
+        Update the running totals after a transaction on one of our accounts.
+        Amounts reach the bank's hooks in cents. The hooks are called with
+        the account locked and lock only its stripe, so changes to accounts
+        on other stripes go on meanwhile. Each hook journals the change last,
+        so the totals match the accounts even if recording it fails.
+        """
+        stripe = self._stripe(account)
+        with stripe.lock:
+            cents = account._cents
+            if accepted:
+                cents += -amount if type_index == Transaction.DEPOSIT else amount
+            self._keep_version(account, cents, account.is_open,
+                               len(account.transactions) - 1)
+            if accepted:
+                for monitor in self._monitors:
+                    monitor.record(account._ACCOUNT_ID, type_index, amount,
+                                   date)
+                if self.ranking is not None:
+                    self._rank(account)
+                if type_index == Transaction.DEPOSIT:
+                    stripe.balance += amount
+                    stripe.inflow += amount
+                    stripe.note_change(date.toordinal(), amount)
+                else:
+                    stripe.balance -= amount
+                    stripe.outflow += amount
+                    stripe.note_change(date.toordinal(), -amount)
+            if self.journal is not None:
+                self.journal.record_transaction(account._ACCOUNT_ID, amount,
+                                                type_index, date)
+
+    def _on_batch(self, account, amounts, type_indexes, dates, accepted):
+        """Update the running totals after a batch on one of our accounts"""
+        stripe = self._stripe(account)
+        with stripe.lock:
+            if self._views:
+                cents = account._cents
+                for amount, type_index, posted in zip(amounts, type_indexes,
+                                                      accepted):
+                    if posted:
+                        cents += (-amount if type_index == Transaction.DEPOSIT
+                                  else amount)
+                self._keep_version(account, cents, account.is_open,
+                                   len(account.transactions) - len(amounts))
+            else:
+                self._keep_version(account, None, None, None)
+            inflow = 0
+            outflow = 0
+            for amount, type_index, date, posted in zip(amounts, type_indexes,
+                                                        dates, accepted):
+                if posted:
+                    if type_index == Transaction.DEPOSIT:
+                        inflow += amount
+                        stripe.balance += amount
+                        stripe.note_change(date.toordinal(), amount)
+                    else:
+                        outflow += amount
+                        stripe.balance -= amount
+                        stripe.note_change(date.toordinal(), -amount)
+                    for monitor in self._monitors:
+                        monitor.record(account._ACCOUNT_ID, type_index, amount,
+                                       date)
+            stripe.inflow += inflow
+            stripe.outflow += outflow
+            if self.ranking is not None:
+                self._rank(account)
+            if self.journal is not None:
+                self.journal.record_batch(account._ACCOUNT_ID, amounts,
+                                          type_indexes, dates)
+
+    def _on_transfer(self, source, destination, amount, date, accepted):
+        """
+        Journal a transfer between two of our accounts and link its rows.
+        Money only moves inside the bank, so the totals stay as they are,
+        though the balances of the accounts' stripes change.
+        """
+        stripes = sorted({self._stripe(source), self._stripe(destination)},
+                         key=self._stripes.index)
+        with contextlib.ExitStack() as locked:
+            for stripe in stripes:
+                locked.enter_context(stripe.lock)
+            self._keep_version(source, source._cents + (amount if accepted
+                                                        else 0),
+                               source.is_open, len(source.transactions) - 1)
+            if accepted:
+                self._keep_version(destination, destination._cents - amount,
+                                   destination.is_open,
+                                   len(destination.transactions) - 1)
+            if accepted:
+                for monitor in self._monitors:
+                    monitor.record(source._ACCOUNT_ID, Transaction.WITHDRAWAL,
+                                   amount, date)
+                    monitor.record(destination._ACCOUNT_ID,
+                                   Transaction.DEPOSIT, amount, date)
+                if self.ranking is not None:
+                    self._rank(source)
+                    self._rank(destination)
+                if len(stripes) > 1:
+                    self._stripe(source).balance -= amount
+                    self._stripe(source).note_change(date.toordinal(), -amount)
+                    self._stripe(destination).balance += amount
+                    self._stripe(destination).note_change(date.toordinal(),
+                                                          amount)
+            with self._transfer_lock:
+                transfer_id = self._next_transfer
+                self._next_transfer += 1
+            # Linked here so a read view never sees a transfer row unlinked
+            source.transactions.link(-1, transfer_id, destination._ACCOUNT_ID)
+            if accepted:
+                destination.transactions.link(-1, transfer_id,
+                                              source._ACCOUNT_ID)
+            if self.journal is not None:
+                self.journal.record_transfer(source._ACCOUNT_ID,
+                                             destination._ACCOUNT_ID, amount,
+                                             date)
+
+    def _on_restore(self, account, rows, amounts, type_indexes, dates,
+                    applied, links):
+        """
+        Count history restored to one of our accounts, from row rows on, on
+        its days. The balance is as it was, so what the rows changed it by
+        is taken from the part counted from the start.
+        """
+        stripe = self._stripe(account)
+        with stripe.lock:
+            self._keep_version(account, account._cents, account.is_open, rows)
+            for amount, type_index, date, row_applied in zip(
+                    amounts, type_indexes, dates, applied):
+                if row_applied:
+                    change = Ledger._change(type_index, amount)
+                    stripe.note_change(date.toordinal(), change)
+                    stripe.base -= change
+            if links:
+                with self._transfer_lock:
+                    self._next_transfer = max(
+                        self._next_transfer,
+                        max(transfer_id for _, transfer_id, _ in links) + 1)
+
+    def _on_status_change(self, account, was_open):
+        """Update the account counts after one of our accounts opens or closes"""
+        stripe = self._stripe(account)
+        with stripe.lock:
+            self._keep_version(account, account._cents, was_open,
+                               len(account.transactions))
+            if bool(was_open) != bool(account.is_open):
+                change = 1 if account.is_open else -1
+                stripe.open_accounts += change
+                stripe.closed_accounts -= change
+            if self.ranking is not None:
+                self._rank(account)
+            if self.journal is not None:
+                self.journal.record_status(account._ACCOUNT_ID, account.is_open)
+
+    def _on_close(self, account, was_open, amount, date):
+        """Update the running totals after one of our accounts is closed"""
+        stripe = self._stripe(account)
+        with stripe.lock:
+            self._keep_version(account, amount, was_open,
+                               len(account.transactions) - 1)
+            if was_open:
+                stripe.open_accounts -= 1
+                stripe.closed_accounts += 1
+            stripe.balance -= amount
+            stripe.outflow += amount
+            stripe.note_change(date.toordinal(), -amount)
+            if amount:
+                for monitor in self._monitors:
+                    monitor.record(account._ACCOUNT_ID, Transaction.WITHDRAWAL,
+                                   amount, date)
+            if self.ranking is not None:
+                self._rank(account)
+            if self.journal is not None:
+                self.journal.record_close(account._ACCOUNT_ID, date)
+
+    def _keep_version(self, account, cents, is_open, rows):
+        """
+        Note that an account is changing in the current epoch, given its
+        state before the change. The first change after a read view was
+        taken keeps that state for the views. Called with the account's
+        stripe locked; epochs and views only change with every stripe locked.
+        """
+        epoch = self._epoch
+        if account._written_epoch == epoch:
+            return
+        if self._views:
+            oldest = min(self._views)
+            versions = account._versions
+            if versions is None:
+                versions = account._versions = []
+            while versions and versions[0][0] < oldest:
+                del versions[0]
+            versions.append((epoch - 1, cents, is_open, rows))
+        elif account._versions is not None:
+            account._versions = None
+        account._written_epoch = epoch
+
+    def read_view(self):
+        """
+        Return a BankView of the bank as it is now. Taking one is O(1) and
+        nothing is locked while it is read: accounts keep their state from
+        before the first change made after it, and the customer indexes are
+        copied on the next change to them.
+        """
+        return self._read_view()
+
+    def _read_view(self, then=None):
+        """Return a new read view, calling then() as it is taken if given"""
+        with self._all_locked():
+            epoch = self._epoch
+            self._epoch += 1
+            self._views[epoch] = self._views.get(epoch, 0) + 1
+            self._indexes_shared = True
+            if then is not None:
+                then()
+            return BankView(self, epoch, self._customers_by_id,
+                            self._accounts_by_id, self._totals(),
+                            self._retired_accounts, self._next_transfer)
+
+    def _release_view(self, epoch):
+        """Forget a read view once it is closed"""
+        with self._all_locked():
+            count = self._views.get(epoch, 0) - 1
+            if count > 0:
+                self._views[epoch] = count
+            else:
+                self._views.pop(epoch, None)
+
+    def _own_indexes(self):
+        """Copy the customer indexes if a read view shares them; lock held"""
+        if self._indexes_shared:
+            self._customers_by_id = dict(self._customers_by_id)
+            self._accounts_by_id = dict(self._accounts_by_id)
+            self._indexes_shared = False
+
+    def total_as_of(self, date):
+        """
+        Return the total balance of the bank's accounts at the end of date,
+        found from the stripes' daily totals: the sum of the accounts'
+        balance_as_of. Transactions count on the day they are dated,
+        whatever order they come in. Balances set outside an account's
+        ledger count from the start.
+        """
+        ordinal = date.toordinal()
+        with self._all_locked():
+            return Money.from_cents(sum(stripe.total_as_of(ordinal)
+                                        for stripe in self._stripes))
+
+    def get_totals(self):
+        """Return the running totals of the bank"""
+        with self._all_locked():
+            return self._totals()
+
+    def _totals(self):
+        """Return the running totals; called with everything locked"""
+        stripes = self._stripes
+        return {"customers": len(self._customers_by_id),
+                "total_balance": Money.from_cents(
+                    sum(stripe.balance for stripe in stripes)),
+                "open_accounts": sum(stripe.open_accounts
+                                     for stripe in stripes),
+                "closed_accounts": sum(stripe.closed_accounts
+                                       for stripe in stripes)
+                                   + self._retired_accounts,
+                "total_inflow": Money.from_cents(
+                    sum(stripe.inflow for stripe in stripes)),
+                "total_outflow": Money.from_cents(
+                    sum(stripe.outflow for stripe in stripes))}
+
+    def recount_totals(self):
+        """
+        Recount balances and account counts from the customers, replace the
+        running totals with them and return {name: (running, recounted)} for
+        every total that had drifted. Inflow and outflow are not recounted.
+        """
+        names = ("balance", "open_accounts", "closed_accounts")
+        with self._all_locked():
+            counts = {stripe: dict.fromkeys(names, 0)
+                      for stripe in self._stripes}
+            for customer in self._customers_by_id.values():
+                account = customer.account
+                count = counts[self._stripe(account)]
+                count["balance"] += account._cents
+                count["open_accounts" if account.is_open
+                      else "closed_accounts"] += 1
+            drift = {}
+            for name in names:
+                running = sum(getattr(stripe, name) for stripe in self._stripes)
+                recounted = sum(count[name] for count in counts.values())
+                if running != recounted:
+                    drift["total_balance" if name == "balance"
+                          else name] = (running, recounted)
+            for stripe, count in counts.items():
+                stripe.base += count["balance"] - stripe.balance
+                for name in names:
+                    setattr(stripe, name, count[name])
+            return drift
+
+    def _restore_counts(self, inflow, outflow, retired_accounts,
+                        next_transfer):
+        """Set the counts a snapshot keeps that the accounts don't show"""
+        with self._all_locked():
+            for stripe in self._stripes:
+                stripe.inflow = stripe.outflow = 0
+            self._stripes[0].inflow = inflow
+            self._stripes[0].outflow = outflow
+            self._retired_accounts = retired_accounts
+            self._next_transfer = next_transfer
+
+    def display_bank_summary(self, recount=False):
         """Return a summary of the bank; number of customers and total money held in the bank"""
-        x = 0
-        for i in range(0, len(self.customers)):
-            x += self.customers[i].account.balance
+        if recount:
+            self.recount_totals()
+        totals = self.get_totals()
+        print(self.summary_text(totals["customers"], totals["total_balance"]))
+
+    @staticmethod
+    def summary_text(customers, total_balance):
+        """Return the bank summary for a number of customers and their total balance"""
+        x = total_balance
         result = f"\n************************************************************************\n" \
-                 f"TakeMyMoney has {len(self.customers)} customers\nTotal amount in customer accounts ${x}\n" \
+                 f"TakeMyMoney has {customers} customers\nTotal amount in customer accounts ${x}\n" \
                  f"************************************************************************\n"
-        print(result)
+        return result
 
     @staticmethod
     def display_account_information(customer):
@@ -267,11 +2722,565 @@ class MyBank:
 
     def add_customer(self, customer):
         """Add customer to bank customers"""
-        return self.customers.append(customer)
+        account = customer.account
+        stripe = self._stripe(account)
+        with account._lock, self._lock, stripe.lock:
+            customer_id = customer.get_customer_id()
+            account_id = account.get_account_id()
+            if customer_id in self._customers_by_id:
+                raise ValueError(f"customer {customer_id} is already with the bank")
+            if account_id in self._accounts_by_id:
+                raise ValueError(f"account {account_id} is already with the bank")
+            if account._bank is not None:
+                raise ValueError(f"account {account_id} is with another bank")
+            if self.journal is not None:
+                self.journal.check_customer(customer)
+            self._own_indexes()
+            self._customers_by_id[customer_id] = customer
+            self._accounts_by_id[account_id] = customer
+            account._bank = self
+            stripe.balance += account._cents
+            stripe.note_account(account)
+            if account.is_open:
+                stripe.open_accounts += 1
+            else:
+                stripe.closed_accounts += 1
+            if self.archive is not None:
+                account.transactions.archive_to(self.archive)
+            if self.ranking is not None:
+                self._rank(account)
+            if self.names is not None:
+                self.names.add(customer_id, customer.get_name())
+            if self.journal is not None:
+                self.journal.record_customer(customer)
+
+    def archive_history(self, archive):
+        """Keep the older transactions of every account, now and to come, in archive"""
+        with self._lock:
+            if self.archive is not None:
+                raise ValueError("bank is already archived")
+            self.archive = archive
+            customers = list(self._customers_by_id.values())
+        # Accounts lock before the bank, so each is archived under its own
+        # lock after letting go of ours; those added since archive themselves
+        for customer in customers:
+            account = customer.account
+            with account._lock:
+                ledger = account.transactions
+                if account._bank is self and ledger._archive is None:
+                    ledger.archive_to(archive)
+
+    def watch_activity(self, days=1):
+        """
+        Return an ActivityMonitor counting the accounts' activity over
+        sliding windows of days days, from now on
+        """
+        monitor = ActivityMonitor(days)
+        with self._all_locked():
+            self._monitors += (monitor,)
+        return monitor
+
+    def stop_watching(self, monitor):
+        """Stop feeding an ActivityMonitor from watch_activity"""
+        with self._all_locked():
+            self._monitors = tuple(each for each in self._monitors
+                                   if each is not monitor)
+
+    def rank_balances(self):
+        """
+        Return the bank's BalanceRanking of its open accounts, starting to
+        keep it up to date on every change if it isn't already
+        """
+        with self._all_locked():
+            if self.ranking is None:
+                self.ranking = BalanceRanking()
+                for customer in self._customers_by_id.values():
+                    self._rank(customer.account)
+            return self.ranking
+
+    def _rank(self, account):
+        """Update an account's place in the ranking; its stripe locked"""
+        if account.is_open:
+            self.ranking.set(account._ACCOUNT_ID, account._cents)
+        else:
+            self.ranking.discard(account._ACCOUNT_ID)
+
+    def top_customers(self, k):
+        """Return the k customers with the highest balances, highest first"""
+        return [self._accounts_by_id[account_id] for account_id, _
+                in self.rank_balances().top(k)]
+
+    def bottom_customers(self, k):
+        """Return the k customers with the lowest balances, lowest first"""
+        return [self._accounts_by_id[account_id] for account_id, _
+                in self.rank_balances().bottom(k)]
+
+    def index_names(self):
+        """
+        Return the bank's NameIndex of its customers, starting to keep it up
+        to date as customers come and go if it isn't already
+        """
+        with self._lock:
+            if self.names is None:
+                self.names = NameIndex()
+                for customer_id, customer in self._customers_by_id.items():
+                    self.names.add(customer_id, customer.get_name())
+            return self.names
+
+    def find_customers_by_name(self, text, limit=10):
+        """
+        Return up to limit customers with a word in their name starting
+        with each word of text, such as "gab new" for Gabe Newell
+        """
+        return [self._customers_by_id[customer_id] for customer_id
+                in self.index_names().search(text, limit)]
+
+    def find_customers_like(self, text, limit=10, max_edits=1):
+        """
+        Return up to limit customers whose names have a word within
+        max_edits typos of each word of text, closest first
+        """
+        return [self._customers_by_id[customer_id] for customer_id
+                in self.index_names().search_fuzzy(text, limit, max_edits)]
 
     def remove_customer(self, customer):
         """Remove customer to bank customers"""
-        return self.customers.remove(customer)
+        self._remove_customer(customer, retire=False)
+
+    def _remove_customer(self, customer, retire):
+        """
+        Remove customer, counting their account as closed out if retire.
+        The account is locked first, so no change to it can reach the bank
+        after it has left.
+        """
+        account = customer.account
+        stripe = self._stripe(account)
+        with account._lock, self._lock, stripe.lock:
+            customer_id = customer.get_customer_id()
+            if self._customers_by_id.get(customer_id) is not customer:
+                raise ValueError(f"customer {customer_id} is not with the bank")
+            self._own_indexes()
+            del self._customers_by_id[customer_id]
+            del self._accounts_by_id[account.get_account_id()]
+            account._bank = None
+            stripe.balance -= account._cents
+            stripe.note_account(account, -1)
+            if account.is_open:
+                stripe.open_accounts -= 1
+            else:
+                stripe.closed_accounts -= 1
+            if retire:
+                self._retired_accounts += 1
+            for monitor in self._monitors:
+                monitor.forget(account.get_account_id())
+            if self.ranking is not None:
+                self.ranking.discard(account.get_account_id())
+            if self.names is not None:
+                self.names.discard(customer_id)
+            if self.journal is not None:
+                self.journal.record_remove(customer_id, retire)
+
+    def apply_batch(self, account_ids, amounts, transaction_types, dates,
+                    amounts_in_cents=False):
+        """
+        Perform a batch of transactions given as columns and return a list
+        saying which rows went through. Each account sees its rows in order,
+        exactly as if perform_transaction had been called for each of them.
+        Rows for accounts the bank doesn't hold are rejected. amounts may be
+        dollar amounts, or already in cents (such as from Money.pack) with
+        amounts_in_cents.
+        """
+        if not (len(account_ids) == len(amounts) == len(transaction_types)
+                == len(dates)):
+            raise ValueError("batch columns must all be the same length")
+        if not amounts_in_cents:
+            amounts = Money.pack(amounts)
+        accepted = [False] * len(account_ids)
+        rows_by_account = {}
+        for row, account_id in enumerate(account_ids):
+            rows = rows_by_account.get(account_id)
+            if rows is None:
+                rows = rows_by_account[account_id] = []
+            rows.append(row)
+        for account_id, rows in rows_by_account.items():
+            customer = self._accounts_by_id.get(account_id)
+            if customer is not None:
+                customer.account.apply_rows(rows, amounts, transaction_types,
+                                            dates, accepted)
+        return accepted
+
+    def transfer(self, source_id, destination_id, amount, date):
+        """
+        Move amount from one account to another and return whether it went
+        through. Both accounts are locked, in the order of their objects'
+        id() as account IDs of mixed types may not compare, so transfers
+        can't deadlock and nobody sees one side without the other.
+        A transfer goes through if both accounts are open and the source has
+        the funds: the source gets a Withdrawal and the destination a Deposit,
+        linked to each other. Otherwise only the source gets a row, a linked
+        No transaction.
+        """
+        source = self.find_account(source_id)
+        destination = self.find_account(destination_id)
+        for account_id, account in ((source_id, source),
+                                    (destination_id, destination)):
+            if account is None:
+                raise ValueError(f"account {account_id} is not with the bank")
+        if source is destination:
+            raise ValueError("cannot transfer to the same account")
+        amount = Money.to_cents(amount)
+        if amount <= 0:
+            raise ValueError("transfer amount must be positive")
+        first, second = sorted((source, destination), key=id)
+        with first._lock, second._lock:
+            if source._bank is not self or destination._bank is not self:
+                raise ValueError("account left the bank during the transfer")
+            accepted = (source.is_open and destination.is_open
+                        and amount <= source._cents)
+            if accepted:
+                source._cents -= amount
+                destination._cents += amount
+                source.transactions.append_row(amount, Transaction.WITHDRAWAL,
+                                               date, source._cents)
+                destination.transactions.append_row(amount, Transaction.DEPOSIT,
+                                                    date, destination._cents)
+            else:
+                source.transactions.append_row(amount,
+                                               Transaction.NO_TRANSACTION,
+                                               date, source._cents)
+            self._on_transfer(source, destination, amount, date, accepted)
+        return accepted
+
+    def start_workers(self, threads=4):
+        """
+        Start worker threads for submit_transaction. Each account is always
+        served by the same worker, so its transactions run in the order they
+        were submitted while different accounts are served side by side.
+        """
+        if self._worker_queues:
+            raise RuntimeError("workers are already running")
+        for _ in range(threads):
+            work = queue.SimpleQueue()
+            threading.Thread(target=self._work, args=(work,),
+                             daemon=True).start()
+            self._worker_queues.append(work)
+
+    def stop_workers(self):
+        """Finish the submitted transactions and stop the worker threads"""
+        stopped = []
+        for work in self._worker_queues:
+            done = threading.Event()
+            work.put(done)
+            stopped.append(done)
+        self._worker_queues = []
+        for done in stopped:
+            done.wait()
+
+    @staticmethod
+    def _work(work):
+        """Run submitted transactions until told to stop"""
+        while True:
+            item = work.get()
+            if isinstance(item, threading.Event):
+                item.set()
+                return
+            future, account, amount, transaction_type, date = item
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(account.perform_transaction(
+                        amount, transaction_type, date))
+                except Exception as error:
+                    future.set_exception(error)
+
+    def submit_transaction(self, account_id, amount, transaction_type, date):
+        """
+        Queue a transaction for the workers and return a Future that gives
+        what perform_transaction returned
+        """
+        if not self._worker_queues:
+            raise RuntimeError("start_workers has not been called")
+        account = self.find_account(account_id)
+        if account is None:
+            raise ValueError(f"account {account_id} is not with the bank")
+        future = Future()
+        self._worker_queues[hash(account_id) % len(self._worker_queues)].put(
+            (future, account, amount, transaction_type, date))
+        return future
+
+    def accrue(self, date, rate=0, fee=0, dry_run=False):
+        """
+        Credit interest at rate (a fraction of the balance, such as "0.0125")
+        and charge a flat fee to every open account, posted on date in one
+        apply_batch. Neither may be negative: a fee never credits an account.
+        Interest is worked out on the balances as they stand when the pass
+        starts; a fee an account can't cover is rejected like any withdrawal.
+        Return the totals: accounts, interest, fees, posted and rejected.
+        With dry_run nothing is posted and the totals are what would happen.
+        """
+        fee = Money.to_cents(fee)
+        if fractions.Fraction(str(rate)) < 0:
+            raise ValueError(f"interest rate {rate} is negative")
+        if fee < 0:
+            raise ValueError(f"fee {Money.from_cents(fee)} is negative")
+        with self._lock:
+            accounts = [customer.account
+                        for customer in self._customers_by_id.values()
+                        if customer.account.is_open]
+        balances = array("q", [account._cents for account in accounts])
+        account_ids = []
+        amounts = array("q")
+        types = []
+        expected = []  # whether each row should go through
+        for account, balance, interest in zip(accounts, balances,
+                                              Money.scale(balances, rate)):
+            if interest > 0:
+                account_ids.append(account._ACCOUNT_ID)
+                amounts.append(interest)
+                types.append(Transaction.DEPOSIT)
+                expected.append(True)
+                balance += interest
+            if fee:
+                account_ids.append(account._ACCOUNT_ID)
+                amounts.append(fee)
+                types.append(Transaction.WITHDRAWAL)
+                expected.append(fee <= balance)
+        if dry_run:
+            posted = expected
+        else:
+            posted = self.apply_batch(account_ids, amounts, types,
+                                      [date] * len(account_ids),
+                                      amounts_in_cents=True)
+        credited = 0
+        charged = 0
+        for amount, type_index, went_through in zip(amounts, types, posted):
+            if went_through:
+                if type_index == Transaction.DEPOSIT:
+                    credited += amount
+                else:
+                    charged += amount
+        return {"accounts": len(accounts),
+                "interest": Money.from_cents(credited),
+                "fees": Money.from_cents(charged),
+                "posted": sum(posted),
+                "rejected": len(posted) - sum(posted)}
+
+    def monthly_report(self, year, month):
+        """
+        Return a Rollup of the month over every customer's account, built
+        from the accounts' monthly rollups. Its closing balance is the sum of
+        the accounts' balances at the end of the month.
+        """
+        report = Rollup()
+        for customer in self.customers:
+            ledger = customer.account.transactions
+            rollup = ledger.monthly_rollup(year, month)
+            if rollup is not None:
+                report.merge(rollup)
+                report.closing_cents -= rollup.closing_cents
+            report.closing_cents += ledger.closing_cents_for_month(year, month)
+        return report
+
+    def find_customer(self, customer_id):
+        """Return the customer with the given ID, or None"""
+        return self._customers_by_id.get(customer_id)
+
+    def find_customer_by_account(self, account_id):
+        """Return the customer holding the given account ID, or None"""
+        return self._accounts_by_id.get(account_id)
+
+    def find_account(self, account_id):
+        """Return the account with the given ID, or None"""
+        customer = self._accounts_by_id.get(account_id)
+        if customer is None:
+            return None
+        return customer.account
+
+
+class LedgerView:
+    """The first rows of a ledger, read-only"""
+
+    def __init__(self, ledger, rows, lock):
+        self._ledger = ledger
+        self._rows = rows
+        self._lock = lock  # the account's
+
+    def __len__(self):
+        return self._rows
+
+    def _index(self, index):
+        """Return a non-negative row index, raising IndexError when out of range"""
+        if index < 0:
+            index += self._rows
+        if not 0 <= index < self._rows:
+            raise IndexError("ledger index out of range")
+        return index
+
+    def row(self, index):
+        """Return (amount, type, date, balance after) for a row, in cents"""
+        return self._ledger.row(self._index(index))
+
+    def get_balance_after_transaction(self, index):
+        """Return the balance after a row"""
+        return self._ledger.get_balance_after_transaction(self._index(index))
+
+    def render(self, index):
+        """Return the statement line of a row"""
+        return self._ledger.render(self._index(index))
+
+    def is_applied(self, index):
+        """Return whether a row was applied"""
+        return self._ledger.is_applied(self._index(index))
+
+    def iter_lines(self, start=0, stop=None):
+        """Yield statement lines for rows start..stop"""
+        start, stop, _ = slice(start, stop).indices(self._rows)
+        return self._ledger.iter_lines(start, max(start, stop))
+
+    def columns(self):
+        """Return (amounts, balances, codes, ordinals) of the rows"""
+        return tuple(column[:self._rows] for column in self._ledger.columns())
+
+    def index(self):
+        """
+        Return Ledger.index() of the rows: the ledger's own if it has no
+        more rows, else worked out from the columns
+        """
+        with self._lock:
+            if len(self._ledger) == self._rows:
+                return self._ledger.index()
+        return Ledger.index_of(self.columns())
+
+    def links(self):
+        """Return {row: (transfer ID, other account ID)} of the linked rows"""
+        return {row: link for row, link in list(self._ledger.links().items())
+                if row < self._rows}
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._rows))]
+        return self._ledger[self._index(index)]
+
+    def __iter__(self):
+        for index in range(self._rows):
+            yield self._ledger[index]
+
+
+class AccountView:
+    """An account as a read view sees it"""
+
+    ACCOUNT_TYPE = Account.ACCOUNT_TYPE
+
+    def __init__(self, account, cents, is_open, rows):
+        self._ACCOUNT_ID = account._ACCOUNT_ID
+        self._cents = cents
+        self.is_open = is_open
+        self.transactions = LedgerView(account.transactions, rows,
+                                       account._lock)
+
+    @property
+    def balance(self):
+        return Money.from_cents(self._cents)
+
+    get_account_id = Account.get_account_id
+    get_is_open = Account.get_is_open
+    get_current_balance = Account.get_current_balance
+    get_max_10_transactions = Account.get_max_10_transactions
+    get_statement = Account.get_statement
+    write_statement = Account.write_statement
+    __str__ = Account.__str__
+
+
+class CustomerView:
+    """A customer as a read view sees them"""
+
+    def __init__(self, customer, account):
+        self.name = customer.name
+        self._customer_id = customer._customer_id
+        self.account = account
+
+    get_customer_id = Customer.get_customer_id
+    get_name = Customer.get_name
+    get_account_balance = Customer.get_account_balance
+    has_an_open_account = Customer.has_an_open_account
+    get_max_10_transactions = Customer.get_max_10_transactions
+    get_statement = Customer.get_statement
+    get_account_information = Customer.get_account_information
+    __str__ = Customer.__str__
+
+
+class BankView:
+    """
+    A read-only, point-in-time view of a bank from MyBank.read_view. It can
+    be read for as long as needed while the bank keeps changing, and can be
+    passed to bankIO's exports in place of the bank. Close it when done so
+    the bank stops keeping old account states for it.
+    """
+
+    def __init__(self, bank, epoch, customers_by_id, accounts_by_id, totals,
+                 retired_accounts=0, next_transfer=1):
+        self.name = bank.name
+        self.epoch = epoch
+        self._bank = bank
+        self._customers_by_id = customers_by_id
+        self._accounts_by_id = accounts_by_id
+        self._totals = totals
+        self.retired_accounts = retired_accounts
+        self.next_transfer = next_transfer
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Let the bank forget the states kept for this view"""
+        if not self._closed:
+            self._closed = True
+            self._bank._release_view(self.epoch)
+
+    def _view(self, customer):
+        """Return the CustomerView of a customer as of this view"""
+        account = customer.account
+        with account._lock:
+            if account._written_epoch <= self.epoch:
+                state = (account._cents, account.is_open,
+                         len(account.transactions))
+            else:
+                state = next(version[1:] for version in account._versions
+                             if version[0] >= self.epoch)
+        return CustomerView(customer, AccountView(account, *state))
+
+    @property
+    def customers(self):
+        """Return the bank's customers as of this view"""
+        return [self._view(customer)
+                for customer in self._customers_by_id.values()]
+
+    def find_customer(self, customer_id):
+        """Return the CustomerView of a customer, or None"""
+        customer = self._customers_by_id.get(customer_id)
+        return None if customer is None else self._view(customer)
+
+    def find_customer_by_account(self, account_id):
+        """Return the CustomerView of the customer holding an account, or None"""
+        customer = self._accounts_by_id.get(account_id)
+        return None if customer is None else self._view(customer)
+
+    def find_account(self, account_id):
+        """Return the AccountView of an account, or None"""
+        customer = self.find_customer_by_account(account_id)
+        return None if customer is None else customer.account
+
+    def get_totals(self):
+        """Return the bank's running totals as of this view"""
+        return dict(self._totals)
+
+    def display_bank_summary(self):
+        """Print the bank summary as of this view"""
+        print(MyBank.summary_text(self._totals["customers"],
+                                  self._totals["total_balance"]))
 
 
 def test_bank():
@@ -286,6 +3295,36 @@ def test_bank():
     >>> date2 = MyDate(23, 4, 2021)
     >>> print(date2)
     23/4/2021
+    >>> date2 < date1, date1 - date2
+    (True, 224)
+    >>> print(date2 + 10)
+    3/5/2021
+    >>> MyDate.parse("23/4/2021") is date2
+    True
+    >>> MyDate.parse("023/04/2021") is date2
+    True
+    >>> for n in range(10000):
+    ...     _ = MyDate.parse(f"0{n % 28 + 1}/{n // 28 % 12 + 1}/{2000 + n // 336}")
+    >>> MyDate._text_ordinal.cache_info().currsize <= 4096
+    True
+
+    # Money
+    >>> print(Money(100.01), Money("900.50"), Money(500), -Money("0.05"))
+    100.01 900.5 500 -0.05
+    >>> Money(0.1) + 0.2 == Money("0.3"), Money.pack([1, 2.5]).tolist()
+    (True, [100, 250])
+    >>> Money(0.1) == 0.1, Money(1) == 1.004, Money("0.5") == 0.5
+    (False, False, True)
+    >>> len({Money(0.1), 0.1}), len({Money("2.5"), 2.5, Money(2.5)})
+    (2, 1)
+    >>> Money(1) < float("inf"), Money(2) > 1.999
+    (True, True)
+    >>> Money(float("inf"))
+    Traceback (most recent call last):
+    ValueError: inf is not an amount of money
+    >>> Money("1e30")
+    Traceback (most recent call last):
+    ValueError: '1e30' is too large an amount of money
 
     # ==== #
     # Transaction Class
@@ -387,6 +3426,109 @@ def test_bank():
     9 25/4/2021 Deposit $65 Balance: $440
     10 25/4/2021 Deposit $70 Balance: $510
     <BLANKLINE>
+    >>> account.perform_transaction(5, Transaction.WITHDRAWAL, MyDate(2, 5, 2021))
+    True
+    >>> account.perform_transaction(900, Transaction.WITHDRAWAL, MyDate(3, 5, 2021))
+    False
+    >>> [str(t) for t in account.history_between(MyDate(1, 5, 2021),
+    ...                                          MyDate(31, 5, 2021))]
+    ['2/5/2021 Withdrawal $5 Balance: $505', '3/5/2021 No transaction Balance: $505']
+    >>> account.transactions.monthly_rollup(2021, 4)
+    Rollup(deposits=11 $510, withdrawals=0 $0, rejected=0, closing balance=$510)
+    >>> account.transactions.daily_rollups(MyDate(1, 5, 2021), MyDate(2, 5, 2021))
+    [(MyDate.parse('2/5/2021'), Rollup(deposits=0 $0, withdrawals=1 $5, rejected=0, closing balance=$505))]
+    >>> account.balance_as_of(MyDate(24, 4, 2021))
+    Money('0')
+    >>> account.balance_as_of(MyDate(30, 4, 2021))
+    Money('510')
+    >>> account.balance_as_of(MyDate(2, 5, 2021))
+    Money('505')
+    >>> closed = Account(1235)
+    >>> closed.set_is_open(False)
+    >>> for date in (MyDate(5, 3, 2022), MyDate(1, 3, 2022)):
+    ...     closed.perform_transaction(10, Transaction.DEPOSIT, date)
+    False
+    False
+    >>> closed.balance_as_of(MyDate(10, 3, 2022))
+    Money('0')
+
+    # Archived history
+    >>> archive = Archive(tempfile.mkdtemp(), hot_rows=64, segment_rows=64,
+    ...                   cache_segments=2)
+    >>> archived = Account(2001)
+    >>> archived.transactions.archive_to(archive)
+    >>> resident = Account(2002)
+    >>> for n in range(1000):
+    ...     for each in (archived, resident):
+    ...         _ = each.perform_transaction(n % 7, n % 3 % 2,
+    ...                                      MyDate(1, 1, 2021) + n // 10)
+    >>> archived.close_account(MyDate(1, 1, 2021))
+    >>> resident.close_account(MyDate(1, 1, 2021))
+    >>> len(archived.transactions), len(archived.transactions._codes)
+    (1001, 105)
+    >>> archived.get_statement() == resident.get_statement()
+    True
+    >>> all(archived.balance_as_of(MyDate(1, 1, 2021) + day)
+    ...     == resident.balance_as_of(MyDate(1, 1, 2021) + day)
+    ...     for day in range(0, 101, 7))
+    True
+    >>> archived.transactions.row(100) == resident.transactions.row(100)
+    True
+    >>> archived.transactions.columns() == resident.transactions.columns()
+    True
+    >>> len(archive._cache)
+    2
+    >>> start, end = MyDate(20, 1, 2021), MyDate(3, 3, 2021)
+    >>> (str(archived.transactions.daily_rollups(start, end))
+    ...  == str(resident.transactions.daily_rollups(start, end)))
+    True
+    >>> all(str(archived.transactions.monthly_rollup(2021, month))
+    ...     == str(resident.transactions.monthly_rollup(2021, month))
+    ...     for month in range(1, 6))
+    True
+    >>> (list(archived.transactions.rows_between(start, end))
+    ...  == list(resident.transactions.rows_between(start, end)))
+    True
+    >>> len(archived.transactions._daily), len(resident.transactions._daily)
+    (12, 100)
+    >>> del archived
+    >>> sorted(os.listdir(archive.directory))
+    []
+    >>> archived = Account(2003)
+    >>> archived.transactions.archive_to(archive)
+    >>> for n in range(200):
+    ...     _ = archived.perform_transaction(1, 0, MyDate(1, 1, 2021))
+    ...     if n % 50 == 0:
+    ...         archived.transactions.link(-1, n, 2004)
+    >>> len(os.listdir(archive.directory))
+    4
+    >>> archived.transactions.links()
+    {0: (0, 2004), 50: (50, 2004), 100: (100, 2004), 150: (150, 2004)}
+    >>> archived.transactions[50].get_link(), archived.transactions._links
+    ((50, 2004), {150: (150, 2004)})
+    >>> Archive(hot_rows=0)
+    Traceback (most recent call last):
+    ...
+    ValueError: hot_rows must be at least 1
+    >>> archive.close()
+    >>> os.listdir(archive.directory)  # emptied; a directory given is kept
+    []
+    >>> os.rmdir(archive.directory)
+    >>> with Archive() as temporary:
+    ...     os.path.isdir(temporary.directory)
+    True
+    >>> os.path.exists(temporary.directory)
+    False
+    >>> print(account.get_statement(3, 5, first_number=4))
+    4 25/4/2021 Deposit $35 Balance: $125
+    5 25/4/2021 Deposit $40 Balance: $165
+    <BLANKLINE>
+    >>> len(account.transactions)
+    13
+    >>> print(account.transactions[0])
+    25/4/2021 Deposit $35 Balance: $35
+    >>> account.transactions[-1].get_balance_after_transaction()
+    Money('505')
 
     # Customer class
 
@@ -437,8 +3579,18 @@ def test_bank():
     >>> customers.append(Customer("Winnie the Pooh", 4, 1004))
     >>> for customer in customers:
     ...     take_my_money.add_customer(customer)
+    >>> take_my_money.find_customer(3).get_name()
+    'Gabe Newell'
+    >>> print(take_my_money.find_account(1004))
+    GET_RICH_QUICK ACCOUNT [1004]: Balance $0
+    >>> take_my_money.add_customer(Customer("Mr. Bean", 2, 1005))
+    Traceback (most recent call last):
+    ...
+    ValueError: customer 2 is already with the bank
     >>> take_my_money.close_account(customers[1])
     GET_RICH_QUICK ACCOUNT [1002]: Balance $0 Account closed
+    >>> take_my_money.find_account(1002) is None
+    True
     >>> import io, sys
     >>> sys.stdin = io.StringIO("500.5")  # input
     >>> take_my_money.deposit_funds(customers[0])
@@ -452,6 +3604,7 @@ def test_bank():
     >>> sys.stdin = io.StringIO("200")  # input
     >>> take_my_money.withdraw_funds(customers[0]) # Enter 200
     Enter the amount to withdraw:
+    >>> sys.stdin = sys.__stdin__
     >>> take_my_money.display_bank_summary()
     <BLANKLINE>
     ************************************************************************
@@ -459,8 +3612,374 @@ def test_bank():
     Total amount in customer accounts $900.5
     ************************************************************************
     <BLANKLINE>
+    >>> totals = take_my_money.get_totals()
+    >>> totals["open_accounts"], totals["closed_accounts"]
+    (3, 1)
+    >>> totals["total_inflow"], totals["total_outflow"]
+    (Money('1100.5'), Money('200'))
+    >>> take_my_money.recount_totals()
+    {}
+    >>> lettered = MyBank("TakeMyMoney")
+    >>> lettered.add_customer(Customer("Mr. Gardiner", "C1", "ACC-1"))
+    >>> lettered.find_account("ACC-1").perform_transaction(5, 0, MyDate(1, 3, 2022))
+    True
+    >>> lettered.get_totals()["total_balance"]
+    Money('5')
+    >>> lettered.add_customer(Customer("Mr. Bean", 2, 1002))
+    >>> lettered.transfer("ACC-1", 1002, 2, MyDate(2, 3, 2022))
+    True
+    >>> lettered.transfer(1002, "ACC-1", 5, MyDate(2, 3, 2022))
+    False
+    >>> [str(lettered.find_account(account_id).balance)
+    ...  for account_id in ("ACC-1", 1002)]
+    ['3', '2']
+    >>> day = MyDate(4, 3, 2022)
+    >>> take_my_money.apply_batch([1003, 1003, 1002, 1003, 9999],
+    ...                           [50, 80, 10, 20, 5],
+    ...                           [Transaction.DEPOSIT, Transaction.WITHDRAWAL,
+    ...                            Transaction.DEPOSIT, Transaction.WITHDRAWAL,
+    ...                            Transaction.DEPOSIT], [day] * 5)
+    [True, False, False, True, False]
+    >>> print(customers[2].get_max_10_transactions())
+    1 4/3/2022 Deposit $50 Balance: $50
+    2 4/3/2022 No transaction Balance: $50
+    3 4/3/2022 Withdrawal $20 Balance: $30
+    <BLANKLINE>
+    >>> take_my_money.get_totals()["total_balance"]
+    Money('930.5')
+    >>> take_my_money.total_as_of(MyDate(3, 3, 2022))
+    Money('0')
+    >>> take_my_money.total_as_of(MyDate.today())
+    Money('930.5')
+
+    # Back-dated transactions count on their own day, and customers bring
+    # their history with them
+    >>> dated = MyBank("TakeMyMoney")
+    >>> dated.add_customer(Customer("Mr. Gardiner", 1, 1001))
+    >>> late = dated.find_account(1001)
+    >>> for amount, type_index, date in [(100, 0, MyDate(1, 3, 2022)),
+    ...                                  (50, 0, MyDate(5, 3, 2022)),
+    ...                                  (20, 1, MyDate(3, 3, 2022))]:
+    ...     _ = late.perform_transaction(amount, type_index, date)
+    >>> days = [MyDate(n, 3, 2022) for n in range(1, 7)]
+    >>> [str(dated.total_as_of(day)) for day in days]
+    ['100', '100', '80', '80', '130', '130']
+    >>> all(dated.total_as_of(day) == late.balance_as_of(day) for day in days)
+    True
+    >>> totals = late.transactions._day_totals[1]
+    >>> _ = late.perform_transaction(5, 1, MyDate(2, 3, 2022))
+    >>> [str(late.balance_as_of(day)) for day in days]
+    ['100', '95', '75', '75', '125', '125']
+    >>> late.transactions._day_totals[1] is totals  # kept up, not rebuilt
+    True
+    >>> all(dated.total_as_of(day) == late.balance_as_of(day) for day in days)
+    True
+    >>> joining = Customer("Mr. Bean", 2, 1002)
+    >>> _ = joining.perform_transaction(40, 0, MyDate(2, 3, 2022))
+    >>> dated.add_customer(joining)
+    >>> [str(dated.total_as_of(day)) for day in days[:3]]
+    ['100', '135', '115']
+    >>> dated.remove_customer(dated.find_customer(1))
+    >>> [str(dated.total_as_of(day)) for day in days[:3]]
+    ['0', '40', '40']
+    >>> take_my_money.monthly_report(2022, 3)
+    Rollup(deposits=1 $50, withdrawals=1 $20, rejected=1, closing balance=$30)
+    >>> Money.scale(array("q", [12345, 250, 350, -250]), "0.1").tolist()
+    [1234, 25, 35, -25]
+
+    # Interest and fees
+    >>> [str(customer.get_account_balance()) for customer in customers]
+    ['300.5', '0', '30', '600']
+    >>> take_my_money.accrue(day, rate="-0.015")
+    Traceback (most recent call last):
+    ...
+    ValueError: interest rate -0.015 is negative
+    >>> take_my_money.accrue(day, fee=-40)
+    Traceback (most recent call last):
+    ...
+    ValueError: fee -40 is negative
+    >>> take_my_money.accrue(day, rate="0.015", fee=40, dry_run=True)
+    {'accounts': 3, 'interest': Money('13.96'), 'fees': Money('80'), 'posted': 5, 'rejected': 1}
+    >>> take_my_money.get_totals()["total_balance"]
+    Money('930.5')
+    >>> take_my_money.accrue(day, rate="0.015", fee=40)
+    {'accounts': 3, 'interest': Money('13.96'), 'fees': Money('80'), 'posted': 5, 'rejected': 1}
+    >>> print(customers[0].get_statement(-2))
+    1 4/3/2022 Deposit $4.51 Balance: $305.01
+    2 4/3/2022 Withdrawal $40 Balance: $265.01
+    <BLANKLINE>
+    >>> take_my_money.get_totals()["total_balance"], take_my_money.recount_totals()
+    (Money('864.46'), {})
+
+    # Concurrent tellers must not lose updates
+    >>> import threading
+    >>> busy = MyBank("TakeMyMoney")
+    >>> busy.add_customer(Customer("Mr. Gardiner", 1, 2001))
+    >>> busy.add_customer(Customer("Mr. Bean", 2, 2002))
+    >>> def teller():
+    ...     for _ in range(2000):
+    ...         busy.find_customer(1).perform_transaction(1, 0, day)
+    >>> tellers = [threading.Thread(target=teller) for _ in range(8)]
+    >>> for thread in tellers: thread.start()
+    >>> for thread in tellers: thread.join()
+    >>> busy.find_customer(1).get_account_balance()
+    Money('16000')
+    >>> busy.start_workers(4)
+    >>> futures = [busy.submit_transaction(2000 + n % 2 + 1, 1, 0, day)
+    ...            for n in range(4000)]
+    >>> futures.append(busy.submit_transaction(2002, 2001, 1, day))
+    >>> busy.stop_workers()
+    >>> futures[-1].result()
+    False
+    >>> len(busy.find_account(2002).transactions)
+    2001
+    >>> busy.get_totals()["total_balance"], busy.recount_totals()
+    (Money('20000'), {})
+
+    # Transfers
+    >>> busy.transfer(2001, 2002, 500, day)
+    True
+    >>> busy.transfer(2002, 2001, 9000, day)
+    False
+    >>> print(busy.find_customer(2).get_statement(-2))
+    1 4/3/2022 Deposit $500 Balance: $2500
+    2 4/3/2022 No transaction Balance: $2500
+    <BLANKLINE>
+    >>> [t.get_link() for t in busy.find_account(2002).transactions[-2:]]
+    [(1, 2001), (2, 2001)]
+    >>> busy.find_account(2001).transactions[-1].get_link()
+    (1, 2002)
+    >>> busy.transfer(2001, 2001, 5, day)
+    Traceback (most recent call last):
+    ValueError: cannot transfer to the same account
+    >>> busy.transfer(2001, 9999, 5, day)
+    Traceback (most recent call last):
+    ValueError: account 9999 is not with the bank
+    >>> def mover(source, destination):
+    ...     for _ in range(500):
+    ...         busy.transfer(source, destination, 3, day)
+    >>> movers = [threading.Thread(target=mover, args=pair)
+    ...           for pair in [(2001, 2002), (2002, 2001)] * 4]
+    >>> for thread in movers: thread.start()
+    >>> for thread in movers: thread.join()
+    >>> busy.get_totals()["total_balance"], busy.recount_totals()
+    (Money('20000'), {})
+    >>> busy.add_customer(Customer("Mr. Teller", 3, 2003))
+    >>> leaving = busy.find_account(2003)
+    >>> def depositor():
+    ...     for _ in range(5000):
+    ...         leaving.perform_transaction(1, 0, day)
+    >>> depositors = [threading.Thread(target=depositor) for _ in range(4)]
+    >>> for thread in depositors: thread.start()
+    >>> busy.remove_customer(busy.find_customer(3))
+    >>> for thread in depositors: thread.join()
+    >>> busy.get_totals()["total_balance"], busy.recount_totals()
+    (Money('20000'), {})
+
+    # Sliding-window activity
+    >>> watched = MyBank("TakeMyMoney")
+    >>> for n in range(1, 4):
+    ...     watched.add_customer(Customer(f"Customer {n}", n, 4000 + n))
+    >>> daily = watched.watch_activity()
+    >>> weekly = watched.watch_activity(days=7)
+    >>> first = MyDate(1, 3, 2022)
+    >>> for offset in range(10):
+    ...     _ = watched.find_account(4001).perform_transaction(
+    ...         100, 0, first + offset)
+    ...     _ = watched.find_account(4001).perform_transaction(
+    ...         30, 1, first + offset)
+    >>> watched.apply_batch([4002] * 4, [500, 50, 50, 900], [0, 1, 1, 1],
+    ...                     [first + 9] * 4)
+    [True, True, True, False]
+    >>> watched.transfer(4001, 4003, 200, first + 9)
+    True
+    >>> daily.activity(4001)
+    ActivityWindow(deposits=1 $100, withdrawals=2 $230)
+    >>> weekly.activity(4001)
+    ActivityWindow(deposits=7 $700, withdrawals=8 $410)
+    >>> weekly.activity(4001, first + 12)
+    ActivityWindow(deposits=4 $400, withdrawals=5 $320)
+    >>> daily.over(withdrawals=1), daily.over(withdrawn=150)
+    ([4001, 4002], [4001])
+    >>> weekly.over(deposited=600), weekly.over(deposits=0, date=first + 20)
+    ([4001], [])
+    >>> weekly.activity(4001), weekly.over(deposited=600)
+    (ActivityWindow(deposits=7 $700, withdrawals=8 $410), [4001])
+    >>> weekly.sweep(first + 20), len(weekly._windows)
+    (3, 0)
+    >>> len(daily._windows[4001]._buckets)
+    1
+    >>> watched.retire_customer(watched.find_customer(3), first + 20)
+    >>> daily.activity(4003)
+    ActivityWindow(deposits=0 $0, withdrawals=0 $0)
+    >>> watched.stop_watching(daily)
+    >>> _ = watched.find_account(4001).perform_transaction(1, 0, first + 21)
+    >>> daily.activity(4001, first + 21), weekly.activity(4001)
+    (ActivityWindow(deposits=0 $0, withdrawals=0 $0), ActivityWindow(deposits=1 $1, withdrawals=0 $0))
+
+    # Balance rankings
+    >>> ranked = MyBank("TakeMyMoney")
+    >>> for n in range(1, 6):
+    ...     ranked.add_customer(Customer(f"Customer {n}", n, 5000 + n))
+    ...     _ = ranked.find_account(5000 + n).perform_transaction(n * 100, 0,
+    ...                                                           day)
+    >>> ranking = ranked.rank_balances()
+    >>> [customer.get_name() for customer in ranked.top_customers(2)]
+    ['Customer 5', 'Customer 4']
+    >>> ranked.transfer(5005, 5001, 450, day)
+    True
+    >>> ranking.top(3)
+    [(5001, Money('550')), (5004, Money('400')), (5003, Money('300'))]
+    >>> ranking.bottom(2), ranking.rank(5002), ranking.rank(5005)
+    ([(5005, Money('50')), (5002, Money('200'))], 4, 5)
+    >>> ranked.retire_customer(ranked.find_customer(1), day)
+    >>> ranked.find_customer(2).close_account(day)
+    >>> ranked.apply_batch([5003, 5004], [500, 400], [0, 1], [day] * 2)
+    [True, True]
+    >>> ranking.top(5), ranking.rank(5002)
+    ([(5003, Money('800')), (5005, Money('50')), (5004, Money('0'))], None)
+    >>> ranked.add_customer(Customer("Customer 6", 6, 5006))
+    >>> [customer.get_name() for customer in ranked.bottom_customers(2)]
+    ['Customer 4', 'Customer 6']
+    >>> import random
+    >>> shuffled = BalanceRanking()
+    >>> shuffled.LOAD = 4
+    >>> balances = {}
+    >>> for n in range(2000):
+    ...     account_id = random.randrange(300)
+    ...     if n % 7 == 0:
+    ...         shuffled.discard(account_id)
+    ...         _ = balances.pop(account_id, None)
+    ...     else:
+    ...         balances[account_id] = random.randrange(1000)
+    ...         shuffled.set(account_id, balances[account_id])
+    >>> expected = sorted(balances, key=lambda a: (balances[a], a), reverse=True)
+    >>> [a for a, _ in shuffled.top(len(balances) + 1)] == expected
+    True
+    >>> [shuffled.rank(a) for a in expected] == list(range(1, len(expected) + 1))
+    True
+
+    # Name search
+    >>> named = MyBank("TakeMyMoney")
+    >>> for n, name in enumerate(["Mr. Gardiner", "Mr. Bean", "Gabe Newell",
+    ...                           "Winnie the Pooh", "Gabriel Gardner",
+    ...                           "mr. garden"]):
+    ...     named.add_customer(Customer(name, n + 1, 6001 + n))
+    >>> def names(customers):
+    ...     return [customer.get_name() for customer in customers]
+    >>> names(named.find_customers_by_name("gab"))
+    ['Gabe Newell', 'Gabriel Gardner']
+    >>> names(named.find_customers_by_name("MR GARD"))
+    ['Mr. Gardiner', 'mr. garden']
+    >>> names(named.find_customers_by_name("mr", limit=2))
+    ['Mr. Gardiner', 'Mr. Bean']
+    >>> names(named.find_customers_by_name("pooh the")), names(
+    ...     named.find_customers_by_name("zz"))
+    (['Winnie the Pooh'], [])
+    >>> names(named.find_customers_like("gardner"))
+    ['Gabriel Gardner', 'Mr. Gardiner']
+    >>> names(named.find_customers_like("gardner", max_edits=2))
+    ['Gabriel Gardner', 'Mr. Gardiner', 'mr. garden']
+    >>> names(named.find_customers_like("Gabe Newel"))
+    ['Gabe Newell']
+    >>> names(named.find_customers_like("winny pooh", max_edits=2))
+    ['Winnie the Pooh']
+    >>> named.retire_customer(named.find_customer(5), day)
+    >>> named.add_customer(Customer("Gabe Gardiner", 7, 6007))
+    >>> names(named.find_customers_like("gardner"))
+    ['Mr. Gardiner', 'Gabe Gardiner']
+    >>> names(named.find_customers_by_name("gab"))
+    ['Gabe Newell', 'Gabe Gardiner']
+    >>> "gabriel" in named.names._customers_with, len(named.names)
+    (False, 6)
+    >>> for n, name in enumerate(["Tim Smith", "Li Wei", "Bab Jones"]):
+    ...     named.add_customer(Customer(name, 8 + n, 6008 + n))
+    >>> names(named.find_customers_like("Tom Smith")), names(
+    ...     named.find_customers_like("Le Wei"))
+    (['Tim Smith'], ['Li Wei'])
+    >>> names(named.find_customers_like("bob jones"))
+    ['Bab Jones']
+    >>> names(named.find_customers_like("wi", max_edits=1))
+    ['Li Wei']
+    >>> NameIndex.edit_distance("kitten", "sitting", 3)
+    3
+
+    # Read views
+    >>> reports = MyBank("TakeMyMoney")
+    >>> for n in range(1, 4):
+    ...     reports.add_customer(Customer(f"Customer {n}", n, 3000 + n))
+    ...     _ = reports.find_account(3000 + n).perform_transaction(100, 0, day)
+    >>> view = reports.read_view()
+    >>> reports.transfer(3001, 3002, 60, day)
+    True
+    >>> reports.retire_customer(reports.find_customer(3), day)
+    >>> reports.add_customer(Customer("Customer 4", 4, 3004))
+    >>> [str(customer.get_account_balance()) for customer in view.customers]
+    ['100', '100', '100']
+    >>> [str(customer.get_account_balance()) for customer in reports.customers]
+    ['40', '160', '0']
+    >>> view.display_bank_summary()
+    <BLANKLINE>
+    ************************************************************************
+    TakeMyMoney has 3 customers
+    Total amount in customer accounts $300
+    ************************************************************************
+    <BLANKLINE>
+    >>> print(view.find_customer(2).get_statement())
+    1 4/3/2022 Deposit $100 Balance: $100
+    <BLANKLINE>
+    >>> print(view.find_account(3003))
+    GET_RICH_QUICK ACCOUNT [3003]: Balance $100
+    >>> def poster():
+    ...     for n in range(3000):
+    ...         reports.transfer(3001 + n % 2, 3002 - n % 2, 1, day)
+    ...         reports.find_account(3004).perform_transaction(1, 0, day)
+    >>> writer = threading.Thread(target=poster)
+    >>> writer.start()
+    >>> consistent = []
+    >>> while writer.is_alive():
+    ...     with reports.read_view() as moment:
+    ...         balances = sum(customer.account._cents
+    ...                        for customer in moment.customers)
+    ...         consistent.append(balances
+    ...                           == moment.get_totals()["total_balance"].cents)
+    >>> writer.join()
+    >>> all(consistent)
+    True
+    >>> switch_interval = sys.getswitchinterval()
+    >>> sys.setswitchinterval(1e-6)  # switch threads often, mid-spill too
+    >>> def depositor(deposits):
+    ...     for n in range(deposits):
+    ...         reports.find_account(3004).perform_transaction(1, 0, day)
+    >>> writer = threading.Thread(target=depositor, args=(2000,))
+    >>> writer.start()
+    >>> history = Archive(hot_rows=64, segment_rows=64)
+    >>> reports.archive_history(history)
+    >>> writer.join()
+    >>> len(reports.find_account(3004).transactions)
+    5000
+    >>> writer = threading.Thread(target=depositor, args=(3000,))
+    >>> writer.start()
+    >>> consistent = []
+    >>> while writer.is_alive():
+    ...     with reports.read_view() as moment:
+    ...         lines = moment.find_customer(4).get_statement().splitlines()
+    ...         consistent.append(all(
+    ...             line == f"{n} 4/3/2022 Deposit $1 Balance: ${n}"
+    ...             for n, line in enumerate(lines, 1)))
+    >>> writer.join()
+    >>> sys.setswitchinterval(switch_interval)
+    >>> all(consistent), len(consistent) > 1
+    (True, True)
+    >>> view.close()
+    >>> reports._views
+    {}
+    >>> history.close()
+    >>> os.path.exists(history.directory)
+    False
     """
     pass
 
 
-doctest.testmod()  # or doctest.testmod(verbose=True)
+if __name__ == "__main__":
+    doctest.testmod()  # or doctest.testmod(verbose=True)
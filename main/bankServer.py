@@ -0,0 +1,311 @@
+"""
+Asyncio front end for MyBank. Clients send one JSON request per line and get
+one JSON response per line, in the same order, so requests can be pipelined.
+
+    {"id": 1, "op": "open", "customer": 1, "name": "Mr. Bean", "account": 1001}
+    {"id": 2, "op": "deposit", "account": 1001, "amount": 500, "date": "1/3/2022"}
+    {"id": 3, "op": "withdraw", "account": 1001, "amount": 200}
+    {"id": 4, "op": "transfer", "from": 1001, "to": 1002, "amount": 50}
+    {"id": 5, "op": "close", "account": 1001}
+    {"id": 6, "op": "summary"}
+
+"date" is optional and defaults to today. Every response carries the
+request's "id" and "ok"; failures also carry "error".
+
+    python bankServer.py serve [--port 8765] [--data DIRECTORY]
+    python bankServer.py load [--clients 50] [--requests 2000] [--depth 16]
+    python bankServer.py                  (runs the doctests)
+"""
+import argparse
+import asyncio
+import doctest
+import json
+import random
+import sys
+import time
+from bankIO import decode_date
+from bankProject import Customer, Money, MyBank, MyDate, Transaction
+
+HOST = "127.0.0.1"
+PORT = 8765
+
+
+class BankService:
+    """Answers protocol requests against a bank"""
+
+    def __init__(self, bank):
+        self.bank = bank
+
+    def handle(self, request):
+        """Return the response to one decoded request"""
+        if not isinstance(request, dict):
+            return {"id": None, "ok": False,
+                    "error": "request must be a JSON object"}
+        response = {"id": request.get("id")}
+        try:
+            handler = getattr(self, "do_" + str(request.get("op")), None)
+            if handler is None:
+                raise ValueError(f"unknown op {request.get('op')!r}")
+            response.update(handler(request))
+            response.setdefault("ok", True)
+        except (KeyError, OverflowError, TypeError, ValueError) as error:
+            response["ok"] = False
+            response["error"] = str(error)
+        return response
+
+    def _account(self, request):
+        """Return the account named in a request"""
+        account = self.bank.find_account(request["account"])
+        if account is None:
+            raise ValueError(f"account {request['account']} is not with the bank")
+        return account
+
+    @staticmethod
+    def _date(request):
+        """Return the date of a request, today if it has none"""
+        if "date" in request:
+            return decode_date(request["date"])
+        return MyDate.today()
+
+    @staticmethod
+    def _amount(request):
+        """Return the amount of a request, which must be positive"""
+        amount = Money(request["amount"])
+        if amount.cents <= 0:
+            raise ValueError("amount must be positive")
+        return amount
+
+    def _post(self, request, transaction_type):
+        """Perform a deposit or withdrawal request"""
+        amount = self._amount(request)
+        account = self._account(request)
+        if not account.is_open:
+            return {"ok": False, "error": "Account is closed!"}
+        accepted = account.perform_transaction(amount,
+                                               transaction_type,
+                                               self._date(request))
+        return {"ok": accepted, "balance": account.balance.as_number()}
+
+    def do_deposit(self, request):
+        """Deposit funds"""
+        return self._post(request, Transaction.DEPOSIT)
+
+    def do_withdraw(self, request):
+        """Withdraw funds"""
+        return self._post(request, Transaction.WITHDRAWAL)
+
+    def do_transfer(self, request):
+        """Move funds between two accounts"""
+        accepted = self.bank.transfer(request["from"], request["to"],
+                                      request["amount"], self._date(request))
+        return {"ok": accepted}
+
+    def do_open(self, request):
+        """Open a new customer's account, or reopen an existing account"""
+        account = self.bank.find_account(request["account"])
+        if account is None:
+            customer = Customer(request["name"], request["customer"],
+                                request["account"])
+            self.bank.add_customer(customer)
+        else:
+            customer = self.bank.find_customer_by_account(request["account"])
+            customer.open_account(self._date(request))
+        return {"account": str(self._account(request))}
+
+    def do_close(self, request):
+        """Close an account and remove its customer"""
+        customer = self.bank.find_customer_by_account(request["account"])
+        if customer is None:
+            raise ValueError(f"account {request['account']} is not with the bank")
+        self.bank.retire_customer(customer, self._date(request))
+        return {"account": customer.get_account_information()}
+
+    def do_summary(self, request):
+        """Return the bank's running totals"""
+        return {"summary": {key: value.as_number() if isinstance(value, Money)
+                            else value
+                            for key, value in self.bank.get_totals().items()}}
+
+
+async def serve_client(service, reader, writer):
+    """Answer one connection's requests in order until it closes"""
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                response = service.handle(json.loads(line))
+            except ValueError as error:
+                response = {"id": None, "ok": False, "error": str(error)}
+            writer.write((json.dumps(response) + "\n").encode())
+            if writer.transport.get_write_buffer_size() > 65536:
+                await writer.drain()
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(bank, host=HOST, port=PORT):
+    """Return a started asyncio server for the bank"""
+    service = BankService(bank)
+    return await asyncio.start_server(
+        lambda reader, writer: serve_client(service, reader, writer),
+        host, port)
+
+
+def percentile(sorted_values, fraction):
+    """Return the value at fraction of the way through sorted values"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+async def load_client(host, port, number, requests, depth, latencies):
+    """Drive one connection with up to depth requests in flight"""
+    reader, writer = await asyncio.open_connection(host, port)
+    account = 900000000 + number
+    sent_at = {}
+    in_flight = asyncio.Semaphore(depth)
+
+    async def send():
+        for n in range(requests + 1):
+            if n == 0:
+                request = {"id": 0, "op": "open", "customer": account,
+                           "name": f"Load {number}", "account": account}
+            else:
+                request = {"id": n, "account": account,
+                           "amount": random.randint(1, 100),
+                           "op": random.choice(("deposit", "withdraw"))}
+            await in_flight.acquire()
+            sent_at[n] = time.perf_counter()
+            writer.write((json.dumps(request) + "\n").encode())
+            await writer.drain()
+
+    sender = asyncio.create_task(send())
+    for _ in range(requests + 1):
+        response = json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - sent_at.pop(response["id"]))
+        in_flight.release()
+    await sender
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run_load(host=HOST, port=PORT, clients=50, requests=2000, depth=16):
+    """
+    Run clients concurrent connections of requests pipelined requests each
+    and return the request rate and p50, p99 and p999 latencies in ms
+    """
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(load_client(host, port, number, requests, depth,
+                                       latencies)
+                           for number in range(clients)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {"requests": len(latencies),
+            "requests_per_second": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "p999_ms": percentile(latencies, 0.999) * 1000}
+
+
+async def serve_forever(port, data):
+    """Serve a bank until interrupted"""
+    if data is None:
+        bank = MyBank("TakeMyMoney")
+    else:
+        import bankJournal
+        bank = bankJournal.open_bank(data, "TakeMyMoney")
+    server = await start_server(bank, port=port)
+    print(f"Serving on {HOST}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if bank.journal is not None:
+            bank.journal.close()
+
+
+def test_server():
+    """
+    >>> async def session():
+    ...     bank = MyBank("TakeMyMoney")
+    ...     server = await start_server(bank, port=0)
+    ...     port = server.sockets[0].getsockname()[1]
+    ...     reader, writer = await asyncio.open_connection(HOST, port)
+    ...     requests = [
+    ...         {"id": 1, "op": "open", "customer": 1, "name": "Mr. Bean",
+    ...          "account": 1001},
+    ...         {"id": 2, "op": "deposit", "account": 1001, "amount": 500,
+    ...          "date": "1/3/2022"},
+    ...         {"id": 3, "op": "withdraw", "account": 1001, "amount": 900},
+    ...         {"id": 7, "op": "deposit", "account": 1001, "amount": -50},
+    ...         {"id": 8, "op": "deposit", "account": 1001, "amount": 1e30},
+    ...         [1, 2],
+    ...         {"id": 4, "op": "close", "account": 1001, "date": "2/3/2022"},
+    ...         {"id": 5, "op": "deposit", "account": 1001, "amount": 5},
+    ...         {"id": 6, "op": "summary"}]
+    ...     writer.write("".join(json.dumps(r) + "\\n" for r in requests).encode())
+    ...     writer.write(b'{"id": 9, "op": "deposit", "account": 1001, '
+    ...                  b'"amount": Infinity}\\n{"id": 10, "op": "summary"}\\n')
+    ...     for _ in requests + [9, 10]:
+    ...         print(await reader.readline())
+    ...     writer.close()
+    ...     await writer.wait_closed()
+    ...     await asyncio.sleep(0.1)  # let the server see the connection end
+    ...     server.close()
+    ...     await server.wait_closed()
+    >>> asyncio.run(session())
+    b'{"id": 1, "account": "GET_RICH_QUICK ACCOUNT [1001]: Balance $0", "ok": true}\\n'
+    b'{"id": 2, "ok": true, "balance": 500}\\n'
+    b'{"id": 3, "ok": false, "balance": 500}\\n'
+    b'{"id": 7, "ok": false, "error": "amount must be positive"}\\n'
+    b'{"id": 8, "ok": false, "error": "1e+30 is too large an amount of money"}\\n'
+    b'{"id": null, "ok": false, "error": "request must be a JSON object"}\\n'
+    b'{"id": 4, "account": "GET_RICH_QUICK ACCOUNT [1001]: Balance $0 Account closed", "ok": true}\\n'
+    b'{"id": 5, "ok": false, "error": "account 1001 is not with the bank"}\\n'
+    b'{"id": 6, "summary": {"customers": 0, "total_balance": 0, "open_accounts": 0, "closed_accounts": 1, "total_inflow": 500, "total_outflow": 500}, "ok": true}\\n'
+    b'{"id": 9, "ok": false, "error": "inf is not an amount of money"}\\n'
+    b'{"id": 10, "summary": {"customers": 0, "total_balance": 0, "open_accounts": 0, "closed_accounts": 1, "total_inflow": 500, "total_outflow": 500}, "ok": true}\\n'
+    """
+    pass
+
+
+def main():
+    """Run the server or the load generator from the command line"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="run the bank server")
+    serve.add_argument("--port", type=int, default=PORT)
+    serve.add_argument("--data", help="directory to journal the bank in")
+    load = commands.add_parser("load", help="run the load generator")
+    load.add_argument("--port", type=int, default=PORT)
+    load.add_argument("--clients", type=int, default=50)
+    load.add_argument("--requests", type=int, default=2000)
+    load.add_argument("--depth", type=int, default=16,
+                      help="requests each client keeps in flight")
+    arguments = parser.parse_args()
+    if arguments.command == "serve":
+        try:
+            asyncio.run(serve_forever(arguments.port, arguments.data))
+        except KeyboardInterrupt:
+            pass
+    else:
+        result = asyncio.run(run_load(HOST, arguments.port, arguments.clients,
+                                      arguments.requests, arguments.depth))
+        print(f"{result['requests']} requests, "
+              f"{result['requests_per_second']:,.0f}/s, "
+              f"p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms, "
+              f"p999 {result['p999_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main()
+    else:
+        doctest.testmod()
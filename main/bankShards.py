@@ -0,0 +1,341 @@
+"""
+A MyBank split across worker processes, so it isn't held to one core by the
+GIL. Each shard process owns the customers whose account IDs hash to it.
+Transactions are routed to the owning shard, and summaries and lookups by
+customer ID are answered by asking every shard and combining the answers.
+
+Customers travel between processes as bankIO customer records, and dates as
+day ordinals.
+"""
+import contextlib
+import doctest
+import multiprocessing
+import threading
+from array import array
+from bankIO import customer_from_record, customer_record
+from bankProject import Money, MyBank, MyDate
+
+
+class ShardService:
+    """Answers requests against the bank held by one shard process"""
+
+    def __init__(self, name):
+        self.bank = MyBank(name)
+
+    def do_add(self, record):
+        """Add the customer in a customer record"""
+        self.bank.add_customer(customer_from_record(record))
+
+    def do_remove(self, customer_id, ordinal):
+        """
+        Remove a customer, closing their account first if ordinal is a date,
+        and return whether this shard held them
+        """
+        customer = self.bank.find_customer(customer_id)
+        if customer is None:
+            return False
+        if ordinal is None:
+            self.bank.remove_customer(customer)
+        else:
+            self.bank.retire_customer(customer, MyDate.from_ordinal(ordinal))
+        return True
+
+    def do_transaction(self, account_id, cents, type_index, ordinal):
+        """Perform one transaction and return whether it went through"""
+        account = self.bank.find_account(account_id)
+        if account is None:
+            raise ValueError(f"account {account_id} is not with the bank")
+        return account.perform_transaction(Money.from_cents(cents), type_index,
+                                           MyDate.from_ordinal(ordinal))
+
+    def do_batch(self, account_ids, cents, type_indexes, ordinals):
+        """Perform a batch of transactions and return which went through"""
+        from_ordinal = MyDate.from_ordinal
+        return self.bank.apply_batch(account_ids, cents, type_indexes,
+                                     [from_ordinal(o) for o in ordinals],
+                                     amounts_in_cents=True)
+
+    def do_find_customer(self, customer_id):
+        """Return the record of a customer, or None"""
+        customer = self.bank.find_customer(customer_id)
+        return None if customer is None else customer_record(customer)
+
+    def do_find_account(self, account_id):
+        """Return the record of the customer holding an account, or None"""
+        customer = self.bank.find_customer_by_account(account_id)
+        return None if customer is None else customer_record(customer)
+
+    def do_totals(self):
+        """Return the shard's running totals"""
+        return self.bank.get_totals()
+
+
+def serve_shard(name, connection):
+    """Answer (op, args) requests on a pipe until None arrives"""
+    service = ShardService(name)
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        op, args = message
+        try:
+            reply = (True, getattr(service, "do_" + op)(*args))
+        except Exception as error:  # sent back so the shard keeps serving
+            reply = (False, error)
+        connection.send(reply)
+    connection.close()
+
+
+class ShardedBank:
+    """
+    A bank whose customers are spread over shard processes by account ID.
+    Customers are added as new Customer objects and referred to by ID from
+    then on. Safe to share between threads: each shard connection carries
+    one request at a time, and requests to different shards go side by side.
+    """
+
+    def __init__(self, name, shards=4):
+        self.name = name
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._connections = []
+        self._processes = []
+        for _ in range(shards):
+            connection, shard_end = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=serve_shard,
+                                              args=(name, shard_end),
+                                              daemon=True)
+            process.start()
+            shard_end.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @contextlib.contextmanager
+    def _all_locked(self):
+        """Hold every shard connection's lock, taken in shard order"""
+        with contextlib.ExitStack() as locked:
+            for lock in self._locks:
+                locked.enter_context(lock)
+            yield
+
+    def close(self):
+        """Stop the shard processes"""
+        with self._all_locked():
+            for connection in self._connections:
+                connection.send(None)
+                connection.close()
+            for process in self._processes:
+                process.join()
+            self._connections = []
+            self._processes = []
+
+    @property
+    def shards(self):
+        return len(self._connections)
+
+    def shard_of(self, account_id):
+        """Return the shard that owns an account"""
+        return hash(account_id) % len(self._connections)
+
+    @staticmethod
+    def _result(reply):
+        """Return a shard's answer, raising the error it sent instead"""
+        ok, result = reply
+        if not ok:
+            raise result
+        return result
+
+    def _call(self, shard, op, *args):
+        """Ask one shard and return its answer"""
+        with self._locks[shard]:
+            return self._ask(shard, op, *args)
+
+    def _ask(self, shard, op, *args):
+        """Ask one shard whose lock is held and return its answer"""
+        connection = self._connections[shard]
+        connection.send((op, args))
+        return self._result(connection.recv())
+
+    def _scatter(self, op, *args):
+        """Ask every shard at once and return their answers in shard order"""
+        with self._all_locked():
+            replies = self._ask_all(op, *args)
+        return [self._result(reply) for reply in replies]
+
+    def _ask_all(self, op, *args):
+        """Ask every shard, their locks held, and return their raw replies"""
+        for connection in self._connections:
+            connection.send((op, args))
+        return [connection.recv() for connection in self._connections]
+
+    def add_customer(self, customer):
+        """
+        Add a new customer to the shard that owns their account. Every shard
+        stays locked from checking the customer ID is new to adding them,
+        so two callers can't both add the same customer ID to two shards.
+        """
+        customer_id = customer.get_customer_id()
+        with self._all_locked():
+            if any(self._result(reply) is not None for reply
+                   in self._ask_all("find_customer", customer_id)):
+                raise ValueError(
+                    f"customer {customer_id} is already with the bank")
+            self._ask(self.shard_of(customer.account.get_account_id()), "add",
+                      customer_record(customer))
+
+    def _remove(self, customer_id, ordinal):
+        if not any(self._scatter("remove", customer_id, ordinal)):
+            raise ValueError(f"customer {customer_id} is not with the bank")
+
+    def remove_customer(self, customer_id):
+        """Remove a customer from the bank"""
+        self._remove(customer_id, None)
+
+    def retire_customer(self, customer_id, date):
+        """Close the customer's account on date and remove them from the bank"""
+        self._remove(customer_id, date.toordinal())
+
+    def perform_transaction(self, account_id, amount, transaction_type, date):
+        """Perform a transaction on an account and return whether it went through"""
+        return self._call(self.shard_of(account_id), "transaction", account_id,
+                          Money.to_cents(amount), transaction_type,
+                          date.toordinal())
+
+    def apply_batch(self, account_ids, amounts, transaction_types, dates,
+                    amounts_in_cents=False):
+        """
+        Perform a batch of transactions given as columns, as MyBank.apply_batch
+        does. The rows are split by shard and every shard works on its part
+        at the same time.
+        """
+        if not (len(account_ids) == len(amounts) == len(transaction_types)
+                == len(dates)):
+            raise ValueError("batch columns must all be the same length")
+        if not amounts_in_cents:
+            amounts = Money.pack(amounts)
+        shards = len(self._connections)
+        rows_by_shard = [[] for _ in range(shards)]
+        for row, account_id in enumerate(account_ids):
+            rows_by_shard[hash(account_id) % shards].append(row)
+        accepted = [False] * len(account_ids)
+        with self._all_locked():
+            for connection, rows in zip(self._connections, rows_by_shard):
+                connection.send(("batch", (
+                    [account_ids[row] for row in rows],
+                    array("q", [amounts[row] for row in rows]),
+                    [transaction_types[row] for row in rows],
+                    array("i", [dates[row].toordinal() for row in rows]))))
+            replies = [connection.recv() for connection in self._connections]
+        for rows, reply in zip(rows_by_shard, replies):
+            for row, went_through in zip(rows, self._result(reply)):
+                accepted[row] = went_through
+        return accepted
+
+    def find_customer(self, customer_id):
+        """Return the record of a customer, or None"""
+        for record in self._scatter("find_customer", customer_id):
+            if record is not None:
+                return record
+        return None
+
+    def find_customer_by_account(self, account_id):
+        """Return the record of the customer holding an account, or None"""
+        return self._call(self.shard_of(account_id), "find_account", account_id)
+
+    def get_totals(self):
+        """Return the running totals of all the shards added together"""
+        totals = None
+        for shard_totals in self._scatter("totals"):
+            if totals is None:
+                totals = shard_totals
+            else:
+                for key, value in shard_totals.items():
+                    totals[key] += value
+        return totals
+
+    def display_bank_summary(self):
+        """Print a summary of the bank; number of customers and total money held in the bank"""
+        totals = self.get_totals()
+        print(MyBank.summary_text(totals["customers"], totals["total_balance"]))
+
+
+def test_shards():
+    """
+    >>> from bankProject import Customer, Transaction
+    >>> bank = ShardedBank("TakeMyMoney", shards=3)
+    >>> for n in range(6):
+    ...     bank.add_customer(Customer(f"Customer {n}", n, 1000 + n))
+    >>> bank.add_customer(Customer("Again", 5, 2000))
+    Traceback (most recent call last):
+    ValueError: customer 5 is already with the bank
+    >>> bank.add_customer(Customer("Again", 6, 1005))
+    Traceback (most recent call last):
+    ValueError: account 1005 is already with the bank
+    >>> added = []
+    >>> together = threading.Barrier(8)
+    >>> def join(account_id):
+    ...     together.wait()
+    ...     try:
+    ...         bank.add_customer(Customer("Twin", 100, account_id))
+    ...     except ValueError:
+    ...         return
+    ...     added.append(account_id)
+    >>> twins = [threading.Thread(target=join, args=(3000 + n,))
+    ...          for n in range(8)]
+    >>> for twin in twins:
+    ...     twin.start()
+    >>> for twin in twins:
+    ...     twin.join()
+    >>> len(added), bank.get_totals()["customers"]
+    (1, 7)
+    >>> bank.remove_customer(100)
+    >>> date = MyDate(1, 3, 2022)
+    >>> bank.perform_transaction(1001, 500.5, Transaction.DEPOSIT, date)
+    True
+    >>> bank.perform_transaction(1001, 900, Transaction.WITHDRAWAL, date)
+    False
+    >>> bank.perform_transaction(9999, 1, Transaction.DEPOSIT, date)
+    Traceback (most recent call last):
+    ValueError: account 9999 is not with the bank
+    >>> bank._call(bank.shard_of(1001), "transaction", 1001, 2 ** 70,
+    ...            Transaction.DEPOSIT, date.toordinal())
+    Traceback (most recent call last):
+    OverflowError: int too big to convert
+    >>> bank.perform_transaction(1001, 0, Transaction.DEPOSIT, date)
+    True
+    >>> bank.apply_batch([1000 + n % 6 for n in range(12)], [10] * 12,
+    ...                  [Transaction.DEPOSIT] * 11 + [Transaction.WITHDRAWAL],
+    ...                  [date] * 12)
+    [True, True, True, True, True, True, True, True, True, True, True, True]
+    >>> bank.find_customer_by_account(1001)["balance"]
+    520.5
+    >>> bank.find_customer(5)
+    {'customer_id': 5, 'name': 'Customer 5', 'account_id': 1005, 'balance': 0, 'is_open': True}
+    >>> bank.retire_customer(5, date)
+    >>> bank.find_customer(5) is None
+    True
+    >>> bank.remove_customer(5)
+    Traceback (most recent call last):
+    ValueError: customer 5 is not with the bank
+    >>> totals = bank.get_totals()
+    >>> totals["customers"], totals["total_balance"], totals["closed_accounts"]
+    (5, Money('600.5'), 1)
+    >>> bank.display_bank_summary()
+    <BLANKLINE>
+    ************************************************************************
+    TakeMyMoney has 5 customers
+    Total amount in customer accounts $600.5
+    ************************************************************************
+    <BLANKLINE>
+    >>> bank.close()
+    """
+    pass
+
+
+if __name__ == "__main__":
+    doctest.testmod()
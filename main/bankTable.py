@@ -0,0 +1,441 @@
+"""
+A fixed-record binary table of a bank's customers and accounts that read-only
+tools open with mmap. Nothing is loaded up front: summaries come from the
+header, lookups bisect sorted ID indexes in place, and a customer's record
+and statement lines are read only when asked for. Tables are written
+atomically from a read view, so they are consistent while the bank runs.
+
+Layout, little-endian (the columns and indexes are read as native arrays,
+so tables only move between little-endian machines), every region starting
+on an 8-byte boundary:
+    header         TABLE_MAGIC and TABLE_HEADER: totals and region offsets
+    records        one TABLE_RECORD per customer, in joining order
+    customer index (customer ID, record number) pairs sorted by customer ID
+    account index  (account ID, record number) pairs sorted by account ID
+    names          the bank's name, then every customer's name, UTF-8
+    ledgers        the amounts, balances, ordinals and codes columns of all
+                   the accounts' rows, each account's rows together
+
+    python bankTable.py export DIRECTORY TABLE  (a bankJournal directory)
+    python bankTable.py summary TABLE
+    python bankTable.py customer TABLE CUSTOMER_ID
+    python bankTable.py                         (runs the doctests)
+"""
+import argparse
+import bisect
+import doctest
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bankProject import Account, Customer, Ledger, Money, MyBank, MyDate
+
+TABLE_MAGIC = b"BANKTBL1"
+TABLE_HEADER = struct.Struct("<IIIIqqqQQQQQQQQQ")
+# customers, open accounts, closed accounts, bank name length,
+# total balance, inflow and outflow in cents, ledger rows,
+# offsets of the records, customer index, account index, names,
+# amounts, balances, ordinals and codes
+TABLE_RECORD = struct.Struct("<qqqQIIIB3x")
+# customer ID, account ID, balance in cents, first ledger row,
+# name offset, name length, ledger rows, is open
+INDEX_ENTRY = struct.Struct("<qq")  # ID, record number
+
+
+def _aligned(offset):
+    """Return offset rounded up to a multiple of 8"""
+    return (offset + 7) & ~7
+
+
+def write_table(bank, path):
+    """
+    Write a table of a MyBank, as of a read view taken now, or of a
+    BankView, to path atomically
+    """
+    if isinstance(bank, MyBank):
+        with bank.read_view() as view:
+            return write_table(view, path)
+    customers = bank.customers
+    totals = bank.get_totals()
+    bank_name = bank.name.encode()
+    names = [customer.get_name().encode() for customer in customers]
+    rows = [len(customer.account.transactions) for customer in customers]
+    total_rows = sum(rows)
+    records = TABLE_HEADER.size + len(TABLE_MAGIC)
+    customer_index = records + len(customers) * TABLE_RECORD.size
+    account_index = customer_index + len(customers) * INDEX_ENTRY.size
+    name_offsets = account_index + len(customers) * INDEX_ENTRY.size
+    amounts = _aligned(name_offsets + len(bank_name) + sum(map(len, names)))
+    balances = amounts + total_rows * 8
+    ordinals = balances + total_rows * 8
+    codes = ordinals + total_rows * 4
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(TABLE_MAGIC)
+        file.write(TABLE_HEADER.pack(
+            len(customers), totals["open_accounts"], totals["closed_accounts"],
+            len(bank_name), totals["total_balance"].cents,
+            totals["total_inflow"].cents, totals["total_outflow"].cents,
+            total_rows, records, customer_index, account_index, name_offsets,
+            amounts, balances, ordinals, codes))
+        name_offset = len(bank_name)
+        first_row = 0
+        for customer, name, count in zip(customers, names, rows):
+            account = customer.account
+            file.write(TABLE_RECORD.pack(
+                customer.get_customer_id(), account.get_account_id(),
+                account.balance.cents, first_row, name_offset, len(name),
+                count, bool(account.is_open)))
+            name_offset += len(name)
+            first_row += count
+        for key in (lambda record: record[1].get_customer_id(),
+                    lambda record: record[1].account.get_account_id()):
+            for number, customer in sorted(enumerate(customers), key=key):
+                file.write(INDEX_ENTRY.pack(key((number, customer)), number))
+        file.write(bank_name)
+        file.write(b"".join(names))
+        file.write(bytes(amounts - file.tell()))
+        first_row = 0
+        for customer, count in zip(customers, rows):
+            (row_amounts, row_balances, row_codes,
+             row_ordinals) = customer.account.transactions.columns()
+            for start, column in ((amounts, row_amounts),
+                                  (balances, row_balances),
+                                  (ordinals, row_ordinals),
+                                  (codes, row_codes)):
+                file.seek(start + first_row * column.itemsize)
+                file.write(column[:count].tobytes())
+            first_row += count
+        file.seek(codes + total_rows)
+        file.truncate()
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+class TableLedger:
+    """An account's rows in a table, read-only"""
+
+    def __init__(self, table, first_row, rows):
+        self._table = table
+        self._first = first_row
+        self._rows = rows
+
+    def __len__(self):
+        return self._rows
+
+    def _index(self, index):
+        """Return the table row of an index, raising IndexError when out of range"""
+        if index < 0:
+            index += self._rows
+        if not 0 <= index < self._rows:
+            raise IndexError("ledger index out of range")
+        return self._first + index
+
+    def row(self, index):
+        """Return (amount, type, date, balance after) for a row, in cents"""
+        index = self._index(index)
+        table = self._table
+        return (table._amounts[index], table._codes[index] & Ledger.TYPE_MASK,
+                MyDate.from_ordinal(table._ordinals[index]),
+                table._balances[index])
+
+    def get_balance_after_transaction(self, index):
+        """Return the balance after a row"""
+        return Money.from_cents(self._table._balances[self._index(index)])
+
+    def is_applied(self, index):
+        """Return whether a row was applied"""
+        return not self._table._codes[self._index(index)] & Ledger.NOT_APPLIED
+
+    @staticmethod
+    def links():
+        """Return {} as tables don't keep transfer links"""
+        return {}
+
+    def render(self, index):
+        """Return the statement line of a row"""
+        index = self._index(index)
+        table = self._table
+        return Ledger._render_line(table._ordinals[index], table._codes[index],
+                                   table._amounts[index], table._balances[index])
+
+    def iter_lines(self, start=0, stop=None):
+        """Yield statement lines for rows start..stop"""
+        start, stop, _ = slice(start, stop).indices(self._rows)
+        table = self._table
+        render_line = Ledger._render_line
+        for index in range(self._first + start, self._first + max(start, stop)):
+            yield render_line(table._ordinals[index], table._codes[index],
+                              table._amounts[index], table._balances[index])
+
+    def columns(self):
+        """Return (amounts, balances, codes, ordinals) of the rows"""
+        table = self._table
+        end = self._first + self._rows
+        return tuple(array(column.format, column[self._first:end].tobytes())
+                     for column in (table._amounts, table._balances,
+                                    table._codes, table._ordinals))
+
+
+class TableAccount:
+    """An account read from a table"""
+
+    ACCOUNT_TYPE = Account.ACCOUNT_TYPE
+
+    def __init__(self, account_id, cents, is_open, transactions):
+        self._ACCOUNT_ID = account_id
+        self._cents = cents
+        self.is_open = is_open
+        self.transactions = transactions
+
+    @property
+    def balance(self):
+        return Money.from_cents(self._cents)
+
+    get_account_id = Account.get_account_id
+    get_is_open = Account.get_is_open
+    get_current_balance = Account.get_current_balance
+    get_max_10_transactions = Account.get_max_10_transactions
+    get_statement = Account.get_statement
+    write_statement = Account.write_statement
+    __str__ = Account.__str__
+
+
+class TableCustomer:
+    """A customer read from a table"""
+
+    def __init__(self, name, customer_id, account):
+        self.name = name
+        self._customer_id = customer_id
+        self.account = account
+
+    get_customer_id = Customer.get_customer_id
+    get_name = Customer.get_name
+    get_account_balance = Customer.get_account_balance
+    has_an_open_account = Customer.has_an_open_account
+    get_max_10_transactions = Customer.get_max_10_transactions
+    get_statement = Customer.get_statement
+    get_account_information = Customer.get_account_information
+    __str__ = Customer.__str__
+
+
+class BankTable:
+    """
+    A table written by write_table, memory-mapped read-only. Opening one
+    reads only the header; it answers MyBank's read-only queries and can be
+    passed to bankIO's exports in place of a bank. Close it when done.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(TABLE_MAGIC)] != TABLE_MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not a bank table")
+        (self._customers, self._open_accounts, self._closed_accounts,
+         name_length, self._total_balance, self._total_inflow,
+         self._total_outflow, rows, self._records, customer_index,
+         account_index, self._names, amounts, balances, ordinals,
+         codes) = TABLE_HEADER.unpack_from(self._map, len(TABLE_MAGIC))
+        self.name = self._map[self._names:self._names + name_length].decode()
+        memory = memoryview(self._map)
+        count = self._customers
+        customer_pairs = memory[customer_index:account_index].cast("q")
+        account_pairs = memory[account_index:
+                               account_index + count * INDEX_ENTRY.size
+                               ].cast("q")
+        self._customer_ids = customer_pairs[0::2]
+        self._customer_numbers = customer_pairs[1::2]
+        self._account_ids = account_pairs[0::2]
+        self._account_numbers = account_pairs[1::2]
+        self._amounts = memory[amounts:balances].cast("q")
+        self._balances = memory[balances:ordinals].cast("q")
+        self._ordinals = memory[ordinals:codes].cast("i")
+        self._codes = memory[codes:codes + rows].cast("B")
+        self._views = [memory, customer_pairs, account_pairs,
+                       self._customer_ids, self._customer_numbers,
+                       self._account_ids, self._account_numbers,
+                       self._amounts, self._balances, self._ordinals,
+                       self._codes]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Unmap the table"""
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._map.close()
+
+    def __len__(self):
+        return self._customers
+
+    def _customer(self, number):
+        """Return the TableCustomer of record number"""
+        (customer_id, account_id, cents, first_row, name_offset, name_length,
+         rows, is_open) = TABLE_RECORD.unpack_from(
+            self._map, self._records + number * TABLE_RECORD.size)
+        start = self._names + name_offset
+        return TableCustomer(
+            self._map[start:start + name_length].decode(), customer_id,
+            TableAccount(account_id, cents, bool(is_open),
+                         TableLedger(self, first_row, rows)))
+
+    def _lookup(self, ids, numbers, wanted):
+        """Return the customer whose ID in a sorted index is wanted, or None"""
+        position = bisect.bisect_left(ids, wanted)
+        if position == len(ids) or ids[position] != wanted:
+            return None
+        return self._customer(numbers[position])
+
+    @property
+    def customers(self):
+        """Return the bank's customers in the order they joined"""
+        return [self._customer(number) for number in range(self._customers)]
+
+    def find_customer(self, customer_id):
+        """Return the customer with an ID, or None"""
+        return self._lookup(self._customer_ids, self._customer_numbers,
+                            customer_id)
+
+    def find_customer_by_account(self, account_id):
+        """Return the customer holding an account, or None"""
+        return self._lookup(self._account_ids, self._account_numbers,
+                            account_id)
+
+    def find_account(self, account_id):
+        """Return the account with an ID, or None"""
+        customer = self.find_customer_by_account(account_id)
+        if customer is None:
+            return None
+        return customer.account
+
+    def get_totals(self):
+        """Return the bank's totals when the table was written"""
+        return {"customers": self._customers,
+                "total_balance": Money.from_cents(self._total_balance),
+                "open_accounts": self._open_accounts,
+                "closed_accounts": self._closed_accounts,
+                "total_inflow": Money.from_cents(self._total_inflow),
+                "total_outflow": Money.from_cents(self._total_outflow)}
+
+    def display_bank_summary(self):
+        """Print the bank summary from the table"""
+        print(MyBank.summary_text(self._customers,
+                                  Money.from_cents(self._total_balance)))
+
+
+def test_table():
+    """
+    >>> import tempfile
+    >>> from bankProject import Transaction
+    >>> bank = MyBank("TakeMyMoney")
+    >>> for n, name in enumerate(["Mr. Gardiner", "Mr. Bean", "Gabe Newell",
+    ...                           "Winnie the Pooh"]):
+    ...     bank.add_customer(Customer(name, 4 - n, 1001 + n))
+    >>> date = MyDate(1, 3, 2022)
+    >>> bank.apply_batch([1001, 1001, 1002, 1003, 1001],
+    ...                  [500.5, 200, 20, 600, 900],
+    ...                  [Transaction.DEPOSIT, Transaction.WITHDRAWAL,
+    ...                   Transaction.DEPOSIT, Transaction.DEPOSIT,
+    ...                   Transaction.WITHDRAWAL], [date] * 5)
+    [True, True, True, True, False]
+    >>> bank.transfer(1003, 1004, 100, date + 1)
+    True
+    >>> bank.find_customer(3).close_account(date + 2)
+    >>> path = os.path.join(tempfile.mkdtemp(), "bank.tbl")
+    >>> write_table(bank, path)
+    >>> bank.find_customer(1).perform_transaction(50, 0, date + 3)
+    True
+    >>> table = BankTable(path)
+    >>> table.name, len(table), table.get_totals() == bank.get_totals()
+    ('TakeMyMoney', 4, False)
+    >>> table.display_bank_summary()
+    <BLANKLINE>
+    ************************************************************************
+    TakeMyMoney has 4 customers
+    Total amount in customer accounts $900.5
+    ************************************************************************
+    <BLANKLINE>
+    >>> customer = table.find_customer(4)
+    >>> print(customer)
+    Name: Mr. Gardiner
+    Customer ID: 4
+    GET_RICH_QUICK ACCOUNT [1001]: Balance $300.5
+    >>> print(customer.get_max_10_transactions())
+    1 1/3/2022 Deposit $500.5 Balance: $500.5
+    2 1/3/2022 Withdrawal $200 Balance: $300.5
+    3 1/3/2022 No transaction Balance: $300.5
+    <BLANKLINE>
+    >>> print(table.find_customer_by_account(1002).get_statement())
+    Account closed
+    1 1/3/2022 Deposit $20 Balance: $20
+    2 3/3/2022 Withdrawal $20 Balance: $0
+    <BLANKLINE>
+    >>> table.find_account(1002).is_open, table.find_account(9) is None
+    (False, True)
+    >>> table.find_customer(9) is None
+    True
+    >>> print(table.find_account(1004).get_statement(-1))
+    1 2/3/2022 Deposit $100 Balance: $100
+    <BLANKLINE>
+    >>> [c.get_name() for c in table.customers] == [c.get_name()
+    ...                                           for c in bank.customers]
+    True
+    >>> import bankIO
+    >>> list(bankIO.iter_transaction_records(table))[-1]
+    {'account_id': 1004, 'date': '2/3/2022', 'type': 'Deposit', 'amount': 100, 'balance_after': 100, 'applied': True, 'transfer_id': None, 'transfer_account': None}
+    >>> table.close()
+    >>> write_table(bank, path)
+    >>> with BankTable(path) as table:
+    ...     table.get_totals() == bank.get_totals()
+    True
+    """
+    pass
+
+
+def main():
+    """Write or query a table from the command line"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write a table of a bank")
+    export.add_argument("directory", help="the bankJournal directory")
+    export.add_argument("table")
+    export.add_argument("--name", default="TakeMyMoney")
+    summary = commands.add_parser("summary", help="print the bank summary")
+    summary.add_argument("table")
+    lookup = commands.add_parser("customer", help="print a customer")
+    lookup.add_argument("table")
+    lookup.add_argument("customer_id", type=int)
+    arguments = parser.parse_args()
+    if arguments.command == "export":
+        import bankJournal
+        bank = bankJournal.open_bank(arguments.directory, arguments.name)
+        try:
+            write_table(bank, arguments.table)
+        finally:
+            bank.journal.close()
+        return
+    with BankTable(arguments.table) as table:
+        if arguments.command == "summary":
+            table.display_bank_summary()
+            return
+        customer = table.find_customer(arguments.customer_id)
+        if customer is None:
+            sys.exit(f"customer {arguments.customer_id} is not with the bank")
+        print(customer)
+        print(customer.get_max_10_transactions(), end="")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main()
+    else:
+        doctest.testmod()